@@ -1,6 +1,7 @@
 # from ..utils.indi import PanIndiDevice
 
 from ..utils import error
+from ..utils.executor import get_executor
 from ..utils import listify
 from ..utils.indi import PanIndiDevice
 from ..utils.logger import get_logger
@@ -100,8 +101,8 @@ class AbstractGPhotoCamera(AbstractCamera):
             self.logger.debug("gphoto2 command: {}".format(run_cmd))
 
             try:
-                self._proc = subprocess.Popen(
-                    run_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+                self._proc = get_executor().run('gphoto2', run_cmd, priority='high', stdout=subprocess.PIPE,
+                                                stderr=subprocess.STDOUT, universal_newlines=True)
             except OSError as e:
                 raise error.InvalidCommand("Can't send command to gphoto2. {} \t {}".format(e, run_cmd))
             except ValueError as e:
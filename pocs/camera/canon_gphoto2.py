@@ -5,6 +5,7 @@ from astropy import units as u
 
 from ..utils import current_time
 from ..utils import error
+from ..utils.executor import get_executor
 from .camera import AbstractGPhotoCamera
 
 
@@ -97,7 +98,8 @@ class Camera(AbstractGPhotoCamera):
 
         # Send command to camera
         try:
-            proc = subprocess.Popen(run_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            proc = get_executor().run('take_pic', run_cmd, priority='high', stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, universal_newlines=True)
         except error.InvalidCommand as e:
             self.logger.warning(e)
 
@@ -60,6 +60,10 @@ class POCS(PanStateMachine, PanStateLogic):
         self.logger.info('\t observatory')
         self.observatory = Observatory(config=self.config, **kwargs)
 
+        # Wake anything waiting on the mount (e.g. for tracking) as soon as its status changes
+        self.observatory.status_poller.add_listener(self._loop.post)
+        self.observatory.corrections.add_listener(self._loop.post)
+
         self._connected = True
         self._initialized = False
 
@@ -0,0 +1,338 @@
+import os
+import threading
+import time
+
+from collections import deque
+
+import numpy as np
+
+from astropy import units as u
+
+from .utils import current_time
+from .utils import error
+from .utils import images
+from .utils.PID import PID
+from .utils.logger import get_logger
+from .utils.messaging import PanMessaging
+
+# Guide pulses are at the mount's guide rate, a fraction of sidereal
+sidereal_rate = 15.0  # arcsec / s
+
+
+class Guider(object):
+
+    """ Closed-loop guiding
+
+    A thread measures the offset of the stars (with `measure`) every `cadence` seconds and
+    feeds it to a `PID` controller for each axis. The output of each controller is sent to
+    the mount, either as a guide pulse (through `corrections`, see
+    `pocs.mount.corrections.CorrectionScheduler`) or, with `mode: rate`, as a custom
+    tracking rate that removes the offset over the next `cadence` seconds. The mount is
+    corrected while the science exposure is running rather than once it is done.
+
+    Each measurement (the residual) is kept in `residuals`, passed to the listeners added
+    with `add_listener` and, if `port` is set, sent on the GUIDING messaging channel.
+
+    Args:
+        mount:          Mount to correct.
+        measure:        Callable returning the current offset from the reference position,
+            a dict with `ra_delta_as` and `dec_delta_as` (arcsec, e.g. from
+            `pocs.utils.images.measure_offset`), or None if there is no measurement yet.
+        corrections(`CorrectionScheduler`): Sends the guide pulses.
+        config(dict):   The `guider` config entry:
+
+            * cadence: Seconds between measurements, defaults to 10.
+            * mode: 'pulse' (the default) or 'rate'.
+            * pid: Gains for each axis, e.g. `{ra: {Kp: 0.7, Ki: 0.1, Kd: 0.0}}`.
+            * max_correction: Largest correction in arcsec, defaults to 30.
+            * pixscale: Arcsec per pixel of the guide camera, for `get_rms` in pixels
+              and `get_guide_wcsinfo`.
+            * port: Messaging port to publish the residuals on.
+    """
+
+    axes = ['ra', 'dec']
+
+    def __init__(self, mount, measure, corrections=None, config=None):
+        self.logger = get_logger(self)
+
+        self.mount = mount
+        self.measure = measure
+        self.corrections = corrections
+
+        config = config or {}
+        self.cadence = config.get('cadence', 10)
+        self.mode = config.get('mode', 'pulse')
+        self.max_correction = config.get('max_correction', 30)
+        self.pixscale = config.get('pixscale', None)
+        self.port = config.get('port', None)
+
+        assert self.mode in ['pulse', 'rate'], self.logger.warning("Unknown guider mode: {}".format(self.mode))
+        assert self.mode == 'rate' or corrections is not None, \
+            self.logger.warning("Pulse guiding needs a correction scheduler")
+
+        gains = config.get('pid', {})
+        self.pid = dict((axis, self._create_pid(gains.get(axis, {}))) for axis in self.axes)
+
+        self.residuals = deque(maxlen=config.get('history', 500))
+        self._listeners = []
+
+        self._last_measurement = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, callback):
+        """ Call `callback('guide_residual', residual)` after each measurement """
+        self._listeners.append(callback)
+
+    def start(self):
+        """ Start guiding in a background thread """
+        if self.is_running:
+            return
+
+        self.reset()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='guider')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop guiding, a running measurement is finished first """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=self.cadence + 60)
+            self._thread = None
+
+        if self.mode == 'rate':
+            for axis in self.axes:
+                self._set_rate(axis, 0.0)
+
+    def reset(self):
+        """ Forget the controller state, e.g. for a new target """
+        for pid in self.pid.values():
+            pid.reset()
+
+        self.residuals.clear()
+        self._last_measurement = None
+
+    def update(self, offset_info):
+        """ Correct the mount for a measured offset
+
+        This is what the guider thread runs after each measurement. It can also be called
+        directly.
+
+        Args:
+            offset_info(dict):  Offset with `ra_delta_as` and `dec_delta_as`.
+
+        Returns:
+            dict:   The residual: the offset and correction for each axis (arcsec), the
+                `time` of the measurement and the `interval` since the last one.
+        """
+        now = time.monotonic()
+        interval = now - self._last_measurement if self._last_measurement is not None else self.cadence
+        self._last_measurement = now
+
+        residual = {
+            'time': current_time().isot,
+            'interval': interval,
+        }
+
+        for axis in self.axes:
+            offset = _to_arcsec(offset_info.get('{}_delta_as'.format(axis)))
+            if offset is None:
+                continue
+
+            # The controller keeps the offset at 0, so its output is the correction
+            correction = -self.pid[axis].recalculate(offset, interval=interval)
+            correction = max(min(correction, self.max_correction), -self.max_correction)
+
+            residual['{}_offset'.format(axis)] = offset
+            residual['{}_correction'.format(axis)] = correction
+
+            if self.mode == 'pulse':
+                ms = correction / (self.mount.guide_rate * sidereal_rate) * 1000
+                self.corrections.add(axis, ms)
+            else:
+                # Remove the offset over the next `cadence` seconds
+                self._set_rate(axis, -correction / (self.cadence * sidereal_rate))
+
+        self.residuals.append(residual)
+
+        for callback in self._listeners:
+            try:
+                callback('guide_residual', residual)
+            except Exception as e:
+                self.logger.debug("Guider listener failed: {}".format(e))
+
+        return residual
+
+    def get_rms(self, in_pixels=False):
+        """ RMS of the offsets in `residuals` for each axis
+
+        Args:
+            in_pixels(bool):    Give the RMS in pixels (needs `pixscale`), defaults to arcsec.
+
+        Returns:
+            dict:   RMS for each axis, None for an axis without measurements.
+        """
+        rms = {}
+        for axis in self.axes:
+            offsets = [r['{}_offset'.format(axis)] for r in self.residuals if '{}_offset'.format(axis) in r]
+            if offsets:
+                rms[axis] = (sum(o ** 2 for o in offsets) / len(offsets)) ** 0.5
+                if in_pixels:
+                    rms[axis] = rms[axis] / self.pixscale
+            else:
+                rms[axis] = None
+
+        return rms
+
+    def _run(self):
+        publisher = None
+        if self.port is not None:
+            # ZMQ sockets can't be shared between threads so the guider has its own
+            publisher = PanMessaging('publisher', self.port)
+
+        while not self._stop.is_set():
+            start_time = time.monotonic()
+
+            try:
+                offset_info = self.measure()
+            except Exception as e:
+                self.logger.warning("Can't measure guide offset: {}".format(e))
+                offset_info = None
+
+            if offset_info and not self._stop.is_set():
+                try:
+                    residual = self.update(offset_info)
+                    if publisher is not None:
+                        publisher.send_message('GUIDING', dict(residual))
+                except Exception as e:
+                    self.logger.warning("Problem guiding: {}".format(e))
+
+            self._stop.wait(max(self.cadence - (time.monotonic() - start_time), 0))
+
+    def _set_rate(self, axis, delta):
+        try:
+            self.mount.set_tracking_rate(direction=axis, delta=delta)
+        except Exception as e:
+            self.logger.warning("Can't set {} tracking rate: {}".format(axis, e))
+
+    def _create_pid(self, gains):
+        return PID(Kp=gains.get('Kp', 0.7), Ki=gains.get('Ki', 0.1), Kd=gains.get('Kd', 0.0),
+                   set_point=0.0, max_age=gains.get('max_age', 300))
+
+
+class CameraOffsets(object):
+
+    """ Measure the offset of the stars with short exposures from a guide camera
+
+    The first exposure after `reset` is the reference. The offset of each later exposure
+    from the reference is measured with `pocs.utils.images.measure_offset`.
+
+    Args:
+        camera:             Camera to take the guide exposures with. This can't be a camera
+            that takes the science exposures.
+        wcs_info(dict):     WCS information of the guide camera (see `get_guide_wcsinfo`),
+            used to turn the shift in pixels into arcsec.
+        exptime(float):     Exposure time in seconds, defaults to 5.
+        image_dir(str):     Where to put the guide images, which are removed once measured.
+        box_width(int):     Width of the box around the center that is used, defaults to 500.
+
+    Raises:
+        error.InvalidConfig: If `wcs_info` has no plate scale. `measure_offset` would use
+            1 degree per pixel and every shift would be a full size correction.
+    """
+
+    def __init__(self, camera, wcs_info, exptime=5, image_dir='/var/panoptes/images/guide', box_width=500):
+        self.logger = get_logger(self)
+
+        if not wcs_info or 'cd11' not in wcs_info:
+            raise error.InvalidConfig("Guide camera needs its own plate scale, see get_guide_wcsinfo")
+
+        self.camera = camera
+        self.exptime = exptime
+        self.image_dir = image_dir
+        self.box_width = box_width
+
+        self._reference = None
+        self._wcs_info = dict(wcs_info)
+        self._count = 0
+
+    def reset(self):
+        """ Take a new reference with the next exposure """
+        self._reference = None
+
+    def __call__(self):
+        os.makedirs(self.image_dir, exist_ok=True)
+
+        self._count += 1
+        fn = '{}/guide_{:04d}.cr2'.format(self.image_dir, self._count)
+
+        proc = self.camera.take_exposure(seconds=self.exptime, filename=fn)
+        proc.wait(timeout=self.exptime + 60)
+
+        try:
+            data = images.crop_data(images.read_image_data(fn), box_width=self.box_width)
+        finally:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+        if self._reference is None:
+            self._reference = data
+            return None
+
+        info = dict(self._wcs_info)
+        info['delta_time'] = self.exptime * u.second
+
+        return images.measure_offset(self._reference, data, info=info, crop=False)
+
+
+def get_guide_wcsinfo(config):
+    """ WCS information of the guide camera from the `guider` config entry
+
+    The guide camera has its own plate scale and orientation, so it can't use the WCS of
+    the pointing images. Either give `wcs_file`, a plate-solved image from the guide
+    camera, or `pixscale` (arcsec per pixel) and `rotation` (degrees from north to the +y
+    axis of the image, through east, defaults to 0).
+
+    Args:
+        config(dict):   The `guider` config entry.
+
+    Returns:
+        dict:   WCS information with the `cd11` to `cd22` terms (see `images.get_wcsinfo`),
+            empty if the config has neither.
+    """
+    if config.get('wcs_file'):
+        return images.get_wcsinfo(config['wcs_file'])
+
+    if not config.get('pixscale'):
+        return {}
+
+    scale = (float(config['pixscale']) * u.arcsec).to(u.degree).value
+    theta = np.radians(float(config.get('rotation', 0)))
+
+    # North up and east left when `rotation` is 0
+    unit = u.degree / u.pixel
+    return {
+        'cd11': -scale * np.cos(theta) * unit,
+        'cd12': scale * np.sin(theta) * unit,
+        'cd21': scale * np.sin(theta) * unit,
+        'cd22': scale * np.cos(theta) * unit,
+        'pixscale': float(config['pixscale']) * (u.arcsec / u.pixel),
+    }
+
+
+def _to_arcsec(value):
+    if value is None:
+        return None
+
+    if isinstance(value, u.Quantity):
+        return value.to(u.arcsec).value
+
+    return float(value)
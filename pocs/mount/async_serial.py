@@ -0,0 +1,354 @@
+import asyncio
+import time
+
+from ..utils.logger import get_logger
+
+
+class AsyncSerialTransport(object):
+
+    """ Send queries on a `SerialData` port from an asyncio loop
+
+    The commands are written to the port and the responses are collected by a reader on
+    the loop (`loop.add_reader`), so waiting for the mount doesn't block the loop and
+    other coroutines (cameras, messaging) run in the meantime.
+
+    This module uses `async` and `await` so it needs Python 3.5 or later. Nothing else in
+    POCS imports it, so the rest still runs on 3.4.
+
+    The port is shared with the blocking `serial_query` (e.g. from the status poller
+    thread), so a transaction holds `lock` (the mount's `_serial_lock`) and the reader is
+    only on the loop during a transaction. The lock is taken without blocking the loop.
+    Transactions from coroutines on the loop are one at a time as well.
+
+    Args:
+        serial_data(`pocs.utils.rs232.SerialData`): The connected port.
+        split:          Callable taking the buffer and the expected response format and
+            returning the next response (None if it hasn't all arrived) and the rest of the
+            buffer, e.g. `AbstractSerialMount._split_response`.
+        lock:           Lock shared with the blocking queries.
+        loop:           The asyncio loop, defaults to the running one.
+    """
+
+    def __init__(self, serial_data, split, lock, loop=None):
+        self.logger = get_logger(self)
+
+        self.serial = serial_data
+        self.split = split
+        self.lock = lock
+        self.loop = loop
+
+        self._buffer = ''
+        self._data = None
+        self._transaction_lock = None
+
+    async def transaction(self, commands, timeout=1.0):
+        """ Write commands back to back and wait for their responses
+
+        Args:
+            commands(list):     (command, expected) tuples, with the full command to write and
+                the expected response format, None for a command without a response.
+            timeout(float):     Seconds to wait for all the responses, defaults to 1.
+
+        Returns:
+            list:   The response to each command, '' for commands without one. What has
+                arrived so far (usually '') for a command that wasn't answered in time.
+        """
+        loop = self.loop or asyncio.get_event_loop()
+
+        if self._transaction_lock is None:
+            self._transaction_lock = asyncio.Lock()
+
+        async with self._transaction_lock:
+            return await self._transaction(loop, commands, timeout)
+
+    async def _transaction(self, loop, commands, timeout):
+        await self._acquire()
+        try:
+            end_time = time.monotonic() + timeout
+
+            self.serial.clear_buffer()
+            self._buffer = ''
+            self._data = asyncio.Event()
+
+            fd = self.serial.ser.fileno()
+            loop.add_reader(fd, self._on_readable)
+            try:
+                self.serial.write(''.join(command for command, expected in commands))
+
+                responses = list()
+                for command, expected in commands:
+                    if expected is None:
+                        responses.append('')
+                        continue
+
+                    response, self._buffer = self.split(self._buffer, expected)
+                    while response is None:
+                        try:
+                            await asyncio.wait_for(self._data.wait(), max(end_time - time.monotonic(), 0))
+                        except asyncio.TimeoutError:
+                            self.logger.warning("No response to {} from mount".format(command))
+                            response, self._buffer = self._buffer, ''
+                            break
+
+                        self._data.clear()
+                        response, self._buffer = self.split(self._buffer, expected)
+
+                    responses.append(response)
+            finally:
+                loop.remove_reader(fd)
+        finally:
+            self.lock.release()
+
+        return responses
+
+    async def _acquire(self):
+        # A threading lock, so poll it rather than block the loop
+        while not self.lock.acquire(blocking=False):
+            await asyncio.sleep(0.001)
+
+    def _on_readable(self):
+        try:
+            self._buffer += self.serial.ser.read(self.serial.ser.inWaiting() or 1).decode()
+        except Exception as e:
+            self.logger.warning("Problem reading from mount: {}".format(e))
+
+        self._data.set()
+
+
+class AsyncMount(object):
+
+    """ Asyncio versions of the `AbstractSerialMount` operations
+
+    These use the same commands, parsing and state as the blocking methods of `mount`, so
+    the two can be mixed. Waiting for a slew or park to finish awaits a status that
+    matches (see `wait_for_status`) rather than sleeping for a fixed time.
+
+    Examples:
+        >>> async_mount = AsyncMount(mount)                   #doctest: +SKIP
+        >>> await async_mount.slew_to_coordinates(coords)     #doctest: +SKIP
+        >>> await asyncio.gather(async_mount.park(), take_flats())  #doctest: +SKIP
+
+    Args:
+        mount(`AbstractSerialMount`):   An initialized serial mount.
+        loop:               The asyncio loop, defaults to the running one.
+        poll_interval(float): Seconds between status polls while waiting, defaults to 1.
+    """
+
+    def __init__(self, mount, loop=None, poll_interval=1.0):
+        self.logger = get_logger(self)
+
+        self.mount = mount
+        self.poll_interval = poll_interval
+
+        self.transport = AsyncSerialTransport(mount.serial, mount._split_response, mount._serial_lock, loop=loop)
+
+        self.last_status = {}
+        self._status_count = 0
+        self._status_changed = None
+        self._waiters = 0
+        self._poller = None
+
+    async def transaction(self, *queries):
+        """ Send queries back to back, like `AbstractSerialMount.serial_transaction` """
+        assert self.mount.is_initialized, self.logger.warning('Mount has not been initialized')
+
+        commands = list()
+        names = list()
+        for query in queries:
+            if isinstance(query, str):
+                query = (query,)
+
+            cmd = query[0]
+            params = query[1] if len(query) > 1 else None
+
+            names.append(cmd)
+            commands.append((self.mount._get_command(cmd, params=params),
+                             self.mount.commands.get(cmd, {}).get('response')))
+
+        start_time = time.monotonic()
+        responses = await self.transport.transaction(commands, timeout=self.mount._serial_timeout)
+        self.mount.serial.record_latency(','.join(names), time.monotonic() - start_time)
+
+        return [self.mount._parse_response(response) for response in responses]
+
+    async def query(self, cmd, *args):
+        """ Send one query, like `AbstractSerialMount.serial_query` """
+        responses = await self.transaction((cmd,) + args[:1])
+
+        return responses[0]
+
+    async def status(self):
+        """ Status, guide rate and position in one round trip, like `AbstractSerialMount.status` """
+        responses = await self.transaction('get_status', 'get_guide_rate', 'get_coordinates')
+
+        self.last_status = self.mount._parse_status(*responses)
+        self._status_count += 1
+
+        if self._status_changed is not None:
+            async with self._status_changed:
+                self._status_changed.notify_all()
+
+        return self.last_status
+
+    async def wait_for_status(self, check, timeout=None):
+        """ Wait for a status that passes `check`
+
+        Only statuses from after the call count. The status is polled every `poll_interval`
+        while something is waiting, one poll is shared by all the waiters.
+
+        Args:
+            check:          Callable taking the status dict.
+            timeout(float): Seconds to wait, defaults to None (wait forever).
+
+        Returns:
+            dict:   The status that passed.
+
+        Raises:
+            asyncio.TimeoutError: If no status passed in time.
+        """
+        if self._status_changed is None:
+            self._status_changed = asyncio.Condition()
+
+        start_count = self._status_count
+
+        def passed():
+            return self._status_count > start_count and check(self.last_status)
+
+        self._waiters += 1
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll_status())
+
+        try:
+            async with self._status_changed:
+                await asyncio.wait_for(self._status_changed.wait_for(passed), timeout)
+        finally:
+            self._waiters -= 1
+
+        return self.last_status
+
+    async def set_target_coordinates(self, coords, apply_model=True):
+        """ Set the target, corrected with the `pointing_model`, in one round trip """
+        self.mount._target_coordinates = coords
+
+        ra, dec = self.mount._skycoord_to_mount_coord(self.mount._get_mount_target(coords, apply_model=apply_model))
+        responses = await self.transaction(('set_ra', ra), ('set_dec', dec))
+
+        return all(responses)
+
+    async def slew_to_target(self, wait=True, timeout=300):
+        """ Slew to the target coordinates
+
+        Args:
+            wait(bool):     Wait until the mount is tracking the target, defaults to True.
+            timeout(float): Seconds to wait, defaults to 300.
+
+        Returns:
+            bool: indicating success
+        """
+        if await self._is_parked():
+            self.logger.info('Mount is parked')
+            return 0
+
+        assert self.mount.has_target, self.logger.warning("Target Coordinates not set")
+
+        response = await self.query('slew_to_target')
+        if not response:
+            self.logger.warning('Problem with slew_to_target')
+            return response
+
+        self.logger.debug('Slewing to target')
+        if wait:
+            await self.wait_for_status(lambda status: 'Tracking' in status.get('state', ''), timeout=timeout)
+
+        return response
+
+    async def slew_to_coordinates(self, coords, wait=True, timeout=300):
+        """ Set the target and slew to it, see `slew_to_target` """
+        if not await self.set_target_coordinates(coords):
+            self.logger.warning("Could not set target_coordinates")
+            return 0
+
+        return await self.slew_to_target(wait=wait, timeout=timeout)
+
+    async def slew_to_home(self, wait=True, timeout=300):
+        """ Slew to the home position """
+        if await self._is_parked():
+            return 0
+
+        self.mount._target_coordinates = None
+        response = await self.query('goto_home')
+
+        if response and wait:
+            await self.wait_for_status(lambda status: 'Zero Position' in status.get('state', ''), timeout=timeout)
+
+        return response
+
+    async def park(self, wait=True, timeout=300):
+        """ Slew to the park position and park """
+        self.mount.set_park_coordinates()
+        await self.set_target_coordinates(self.mount._park_coordinates)
+
+        response = await self.query('park')
+        if not response:
+            self.logger.warning('Problem with slew_to_park')
+            return response
+
+        self.logger.debug('Slewing to park')
+        if wait:
+            await self.wait_for_status(lambda status: 'Parked' in status.get('state', ''), timeout=timeout)
+
+        return response
+
+    async def home_and_park(self, timeout=300):
+        """ Slew home then park, like `AbstractSerialMount.home_and_park` """
+        if await self._is_parked():
+            return
+
+        await self.slew_to_home(timeout=timeout)
+
+        # Setting the location again from home puts the mount on the right side of the pier.
+        # These are a few short blocking queries.
+        self.mount._setup_location_for_mount()
+
+        await self.park(timeout=timeout)
+
+        self.logger.debug("Mount parked")
+
+    async def unpark(self):
+        return await self.query('unpark')
+
+    async def move_direction(self, direction='north', seconds=1.0):
+        """ Move in `direction` for `seconds`, the loop runs in the meantime """
+        assert direction in ['north', 'south', 'east', 'west']
+
+        await self.query('move_{}'.format(direction))
+        try:
+            await asyncio.sleep(float(seconds))
+        finally:
+            await self.query('stop_moving')
+
+    async def set_tracking_rate(self, direction='ra', delta=0.0):
+        """ Custom tracking rate in one round trip, like `AbstractSerialMount.set_tracking_rate` """
+        delta, delta_str = self.mount._get_tracking_delta(delta)
+
+        custom, response = await self.transaction('set_custom_tracking',
+                                                  ('set_custom_{}_tracking_rate'.format(direction), delta_str))
+        if custom and response:
+            self.mount.tracking = 'Custom'
+            self.mount.tracking_rate = 1.0 + delta
+
+        return response
+
+    async def _is_parked(self):
+        status = await self.status()
+
+        return 'Parked' in status.get('state', '')
+
+    async def _poll_status(self):
+        while self._waiters > 0:
+            try:
+                await self.status()
+            except Exception as e:
+                self.logger.warning("Problem polling mount status: {}".format(e))
+
+            await asyncio.sleep(self.poll_interval)
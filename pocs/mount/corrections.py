@@ -0,0 +1,171 @@
+import threading
+import time
+
+from ..utils.logger import get_logger
+
+
+class CorrectionScheduler(object):
+
+    """ Send guide pulses to the mount without waiting for them
+
+    A pulse (the `move_ms_<direction>` commands) is a move at the guide rate for a number
+    of milliseconds, during which the mount answers other commands. On the iOptron a new
+    pulse replaces the one that is running, on either axis, so by default only one pulse
+    runs at a time: the pulses are queued and the next one is sent when a timer says the
+    last one has finished. Pulses waiting for the same axis are combined into one.
+
+    Mounts that are known to move the axes independently can set `concurrent_axes`, so an
+    RA pulse and a Dec pulse run at the same time. A new pulse on an axis still waits for
+    the running one on that axis.
+
+    Listeners added with `add_listener` are called with `('guide', axis)` from the timer
+    thread when an axis has finished its pulses, e.g. to post an event on the state
+    machine's event loop.
+
+    Args:
+        mount:              Mount to send the pulses to.
+        min_ms(int):        Pulses shorter than this (in milliseconds) are dropped, defaults to 10.
+        max_ms(int):        Longest single pulse in milliseconds, defaults to 5000. Longer
+            corrections are sent as several pulses.
+        concurrent_axes(bool): Run RA and Dec pulses at the same time, defaults to False.
+    """
+
+    # Direction for a positive and a negative offset on each axis
+    directions = {
+        'ra': ('west', 'east'),
+        'dec': ('south', 'north'),
+    }
+
+    def __init__(self, mount, min_ms=10, max_ms=5000, concurrent_axes=False):
+        self.logger = get_logger(self)
+
+        self.mount = mount
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.concurrent_axes = concurrent_axes
+
+        self._queued = {}
+        self._timers = {}
+        self._listeners = []
+
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    @property
+    def is_busy(self):
+        """ Whether a pulse is running or queued """
+        return not self._idle.is_set()
+
+    def add(self, axis, ms):
+        """ Queue a pulse
+
+        Args:
+            axis(str):  'ra' or 'dec'.
+            ms(float):  Length of the pulse in milliseconds. Positive moves west (RA) or
+                south (Dec), negative east or north.
+        """
+        assert axis in self.directions, self.logger.warning("Unknown axis: {}".format(axis))
+
+        with self._lock:
+            self._queued[axis] = self._queued.get(axis, 0) + ms
+            self._idle.clear()
+
+            if self._can_send(axis):
+                self._send(axis)
+
+            self._update_idle()
+
+    def add_listener(self, callback):
+        """ Call `callback('guide', axis)` when an axis has finished its pulses """
+        self._listeners.append(callback)
+
+    def wait(self, timeout=None):
+        """ Wait for all the pulses to finish
+
+        Args:
+            timeout(float):     Seconds to wait, defaults to None (wait forever).
+
+        Returns:
+            bool:   True if the pulses finished, False on timeout.
+        """
+        return self._idle.wait(timeout)
+
+    def cancel(self):
+        """ Drop the queued pulses, the running ones still finish """
+        with self._lock:
+            self._queued.clear()
+            self._update_idle()
+
+    def get_remaining(self):
+        """ Milliseconds of pulses still to run on each axis """
+        now = time.monotonic()
+
+        with self._lock:
+            remaining = dict((axis, abs(ms)) for axis, ms in self._queued.items())
+            for axis, (timer, end_time) in self._timers.items():
+                remaining[axis] = remaining.get(axis, 0) + max(end_time - now, 0) * 1000
+
+        return remaining
+
+    def _can_send(self, axis):
+        if self.concurrent_axes:
+            return axis not in self._timers
+
+        return not self._timers
+
+    def _send(self, axis):
+        """ Send the queued pulse for `axis`, must hold the lock """
+        ms = self._queued.pop(axis, 0)
+
+        if abs(ms) < self.min_ms:
+            return
+
+        # Anything over the longest pulse goes after this one
+        if abs(ms) > self.max_ms:
+            leftover = ms - self.max_ms if ms > 0 else ms + self.max_ms
+            self._queued[axis] = leftover
+            ms = self.max_ms if ms > 0 else -self.max_ms
+
+        direction = self.directions[axis][0 if ms > 0 else 1]
+        duration = int(round(abs(ms)))
+
+        move_dir = 'move_ms_{}'.format(direction)
+        move_ms = "{:05.0f}".format(duration)
+        self.logger.debug("Adjusting tracking by {} to direction {}".format(move_ms, move_dir))
+
+        try:
+            self.mount.serial_query(move_dir, move_ms)
+        except Exception as e:
+            self.logger.warning("Can't send guide pulse {} {}: {}".format(move_dir, move_ms, e))
+            self._queued.pop(axis, None)
+            return
+
+        timer = threading.Timer(duration / 1000, self._pulse_done, args=(axis,))
+        timer.daemon = True
+        self._timers[axis] = (timer, time.monotonic() + duration / 1000)
+        timer.start()
+
+    def _pulse_done(self, axis):
+        with self._lock:
+            self._timers.pop(axis, None)
+
+            for next_axis in [axis] + [a for a in self._queued if a != axis]:
+                if next_axis in self._queued and self._can_send(next_axis):
+                    self._send(next_axis)
+
+            axis_done = axis not in self._timers and axis not in self._queued
+            self._update_idle()
+
+        if axis_done:
+            for callback in self._listeners:
+                try:
+                    callback('guide', axis)
+                except Exception as e:
+                    self.logger.debug("Correction listener failed: {}".format(e))
+
+    def _update_idle(self):
+        """ Set the idle flag if nothing is running, must hold the lock """
+        if not self._timers:
+            self._queued.clear()
+            self._idle.set()
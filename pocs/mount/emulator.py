@@ -0,0 +1,545 @@
+import math
+import os
+import pty
+import select
+import threading
+import time
+import tty
+import yaml
+
+from ..utils.logger import get_logger
+
+# Degrees the sky turns per second of time
+sidereal_rate = 360.0 / 86164.0905
+
+
+class IOptronEmulator(object):
+
+    """ An iOptron mount on a pseudo-terminal
+
+    This answers the commands of the iOptron commands file
+    (`resources/conf_files/mounts/ioptron.yaml`) like the mount does, so the real serial mount
+    (`pocs.mount.ioptron.Mount` with `port` set to `port`) can be run, tested and profiled
+    without hardware. Use `pocs.mount.simulator.Mount` instead to skip the serial layer.
+
+    The mount is a pair of axes, hour angle and declination:
+
+        * Slews (`slew_to_target`, `goto_home`, `park`) move each axis at `slew_rate`
+          towards the target, which tracks the sky, then the mount tracks (or parks).
+        * Tracking moves the hour angle axis at the sidereal rate, or the custom rate. When
+          the mount isn't tracking the hour angle axis stands still, so RA drifts.
+        * Guide pulses (`move_ms_<direction>`) move an axis at the guide rate for their
+          length, the button moves (`move_<direction>`) at the button rate until stopped.
+
+    Each response is sent `latency` seconds after the command has arrived plus the time the
+    characters take at `baudrate`. The answers of 0 or 1 and the mount info are sent
+    without the # terminator, like the mount does.
+
+    Args:
+        commands_file(str): The commands file, defaults to the iOptron one in `$POCS`.
+        model(int):         Mount model for `mount_info`, defaults to 30.
+        latency(float):     Seconds the mount takes to answer, defaults to 0.003.
+        baudrate(int):      Baud rate for the time the characters take, defaults to 9600.
+            None to send them at once.
+        slew_rate(float):   Degrees per second on each axis when slewing, defaults to 4.
+        latitude(float):    Site latitude in degrees until it is set with `set_lat`.
+        longitude(float):   Site longitude in degrees (east) until it is set with `set_long`.
+    """
+
+    # Commands that are answered without the terminator
+    unterminated = ['mount_info']
+
+    # Button moving rates (`set_button_moving_rate`) in multiples of sidereal
+    button_rates = {1: 1, 2: 2, 3: 8, 4: 16, 5: 64, 6: 128, 7: 256, 8: 512, 9: 1440}
+
+    # Mount position (hour angle, declination) for `goto_home`
+    home_position = (0.0, 90.0)
+
+    def __init__(self, commands_file=None, model=30, latency=0.003, baudrate=9600, slew_rate=4.0,
+                 latitude=19.54, longitude=-155.58):
+        self.logger = get_logger(self)
+
+        if commands_file is None:
+            commands_file = os.path.join(os.getenv('POCS', '.'), 'resources', 'conf_files', 'mounts', 'ioptron.yaml')
+
+        with open(commands_file, 'r') as f:
+            self.commands = yaml.safe_load(f.read())
+
+        self._pre_cmd = self.commands.pop('cmd_pre', ':')
+        self._post_cmd = self.commands.pop('cmd_post', '#')
+
+        # Commands without params are matched on the whole command, the others on the start
+        self._exact = dict((str(info['cmd']), name) for name, info in self.commands.items() if 'params' not in info)
+        self._prefixes = sorted(((str(info['cmd']), name) for name, info in self.commands.items() if 'params' in info),
+                                key=lambda item: len(item[0]), reverse=True)
+
+        self.model = model
+        self.latency = latency
+        self.baudrate = baudrate
+        self.slew_rate = slew_rate
+
+        self.latitude = latitude
+        self.longitude = longitude
+        self.gmt_offset = 0
+        self.guide_rate = 0.9
+        self.button_rate = 9
+
+        # Mount state, see `_update`
+        self.ha, self.dec = self.home_position
+        self.state = '7'
+        self.tracking = True
+        self.tracking_mode = '0'
+        self.custom_rate = {'ra': 0.0, 'dec': 0.0}
+        self.target = None
+        self._slew_to = None
+        self._moves = {}
+        self._last_update = time.time()
+
+        self.received = []
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._master = None
+        self._slave = None
+
+    @property
+    def port(self):
+        """ Device of the pseudo-terminal to connect to, None if not started """
+        return os.ttyname(self._slave) if self._slave is not None else None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Open the pseudo-terminal and answer commands in a background thread
+
+        Returns:
+            str:    The `port` to connect to.
+        """
+        if self.is_running:
+            return self.port
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ioptron_emulator')
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.logger.debug("iOptron emulator on {}".format(self.port))
+
+        return self.port
+
+    def stop(self):
+        """ Stop answering and close the pseudo-terminal """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+        for fd in [self._master, self._slave]:
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+        self._master = None
+        self._slave = None
+
+    def get_position(self):
+        """ Where the mount points now
+
+        Returns:
+            tuple:  RA and Dec in degrees.
+        """
+        with self._lock:
+            self._update()
+            return (self._lst() - self.ha) % 360, self.dec
+
+    def handle(self, command):
+        """ Answer a command
+
+        Args:
+            command(str):   A full command, e.g. ':GEC#'.
+
+        Returns:
+            str:    The response, None for commands without one.
+        """
+        body = command
+        if body.startswith(self._pre_cmd):
+            body = body[len(self._pre_cmd):]
+        if body.endswith(self._post_cmd):
+            body = body[:-len(self._post_cmd)]
+
+        name, params = self._lookup(body)
+        if name is None:
+            self.logger.debug("Emulator got unknown command: {}".format(command))
+            return None
+
+        with self._lock:
+            self._update()
+            response = getattr(self, '_cmd_{}'.format(name), self._cmd_default)(name, params)
+
+        if 'response' not in self.commands[name]:
+            return None
+
+        response = str(response)
+        if response not in ['0', '1'] and name not in self.unterminated:
+            response = response + self._post_cmd
+
+        return response
+
+    def _lookup(self, body):
+        if body in self._exact:
+            return self._exact[body], None
+
+        for cmd, name in self._prefixes:
+            if body.startswith(cmd):
+                return name, body[len(cmd):]
+
+        return None, None
+
+    def _run(self):
+        buffer = ''
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._master], [], [], 0.1)
+                if not ready:
+                    continue
+
+                buffer += os.read(self._master, 1024).decode()
+            except (OSError, ValueError):
+                break
+
+            while self._post_cmd in buffer:
+                command, buffer = buffer.split(self._post_cmd, 1)
+                command = command[command.rfind(self._pre_cmd):] + self._post_cmd
+                self.received.append(command)
+
+                response = self.handle(command)
+                if response is None:
+                    continue
+
+                delay = self.latency
+                if self.baudrate:
+                    delay += len(response) * 10 / self.baudrate
+                time.sleep(delay)
+
+                try:
+                    os.write(self._master, response.encode())
+                except OSError:
+                    break
+
+    ##################################################################################################
+    # Kinematics
+    ##################################################################################################
+
+    def _lst(self, now=None):
+        """ Local sidereal time in degrees """
+        if now is None:
+            now = time.time()
+
+        days = now / 86400.0 + 2440587.5 - 2451545.0
+
+        return (280.46061837 + 360.98564736629 * days + self.longitude) % 360
+
+    def _update(self):
+        """ Move the axes to where they are now """
+        now = time.time()
+        dt = now - self._last_update
+        self._last_update = now
+
+        if dt <= 0:
+            return
+
+        if self.state == '2' and self._slew_to is not None:
+            ha, dec = self._slew_target()
+            self.ha = _step(self.ha, _wrap(ha - self.ha), self.slew_rate * dt)
+            self.dec = _step(self.dec, dec - self.dec, self.slew_rate * dt)
+
+            if abs(_wrap(ha - self.ha)) < 1e-6 and abs(dec - self.dec) < 1e-6:
+                self._end_slew()
+            return
+
+        if self.state in ['1', '5', '3']:
+            rate = 1.0 + self.custom_rate['ra'] if self.tracking_mode == '4' else 1.0
+            self.ha += rate * sidereal_rate * dt
+            if self.tracking_mode == '4':
+                self.dec += self.custom_rate['dec'] * sidereal_rate * dt
+
+        for axis, (rate, end_time) in list(self._moves.items()):
+            moving = min(now, end_time) - (now - dt) if end_time is not None else dt
+            if moving > 0:
+                if axis == 'ra':
+                    self.ha += rate * moving
+                else:
+                    self.dec += rate * moving
+
+            if end_time is not None and end_time <= now:
+                del self._moves[axis]
+
+        if self.state == '3' and not self._moves:
+            self.state = '1'
+
+        self.ha = _wrap(self.ha)
+        self.dec = max(min(self.dec, 90.0), -90.0)
+
+    def _slew_target(self):
+        """ Hour angle and declination the slew is going to """
+        kind, position = self._slew_to
+        if kind == 'sky':
+            ra, dec = position
+            return _wrap(self._lst() - ra), dec
+
+        return position
+
+    def _start_slew(self, kind, position):
+        self._moves.clear()
+        self._slew_to = (kind, position)
+        self.state = '2'
+
+    def _end_slew(self):
+        kind = self._slew_to[0]
+        self._slew_to = None
+
+        if kind == 'park':
+            self.state = '6'
+        elif kind == 'home':
+            self.state = '7'
+        else:
+            self.state = '1' if self.tracking else '0'
+
+    def _move(self, axis, sign, rate, seconds=None):
+        """ Move an axis at `rate` (multiple of sidereal) for `seconds`, or until stopped """
+        end_time = time.time() + seconds if seconds is not None else None
+        self._moves[axis] = (sign * rate * sidereal_rate, end_time)
+
+    ##################################################################################################
+    # Commands
+    ##################################################################################################
+
+    def _cmd_default(self, name, params):
+        return 1
+
+    def _cmd_get_status(self, name, params):
+        hemisphere = '1' if self.latitude >= 0 else '0'
+        return '0{}{}{}1{}'.format(self.state, self.tracking_mode, self.button_rate, hemisphere)
+
+    def _cmd_version(self, name, params):
+        return self.commands[name]['response']
+
+    def _cmd_mount_info(self, name, params):
+        return '{:04d}'.format(self.model)
+
+    def _cmd_firmware_motor(self, name, params):
+        return '140101140101'
+
+    _cmd_firmware_radec = _cmd_firmware_motor
+
+    def _cmd_set_long(self, name, params):
+        self.longitude = _from_arcsec(params) / 3600
+        return 1
+
+    def _cmd_set_lat(self, name, params):
+        self.latitude = _from_arcsec(params) / 3600
+        return 1
+
+    def _cmd_get_long(self, name, params):
+        return '{:+07.0f}'.format(self.longitude * 3600)
+
+    def _cmd_get_lat(self, name, params):
+        return '{:+07.0f}'.format(self.latitude * 3600)
+
+    def _cmd_set_gmt_offset(self, name, params):
+        self.gmt_offset = int(params)
+        return 1
+
+    def _cmd_get_local_time(self, name, params):
+        local = time.gmtime(time.time() + self.gmt_offset * 60)
+        return '{:+04d}{}'.format(self.gmt_offset, time.strftime('%y%m%d%H%M%S', local))
+
+    def _cmd_set_ra(self, name, params):
+        ra = int(params) / 1000 / 3600 * 15
+        self.target = (ra, self.target[1] if self.target else 0.0)
+        return 1
+
+    def _cmd_set_dec(self, name, params):
+        dec = _from_arcsec(params) / 100 / 3600
+        self.target = (self.target[0] if self.target else 0.0, dec)
+        return 1
+
+    def _cmd_get_coordinates(self, name, params):
+        ra = (self._lst() - self.ha) % 360
+        return '{:+09.0f}{:08.0f}'.format(self.dec * 3600 * 100, ra / 15 * 3600 * 1000)
+
+    def _cmd_get_coordinates_altaz(self, name, params):
+        alt, az = _altaz(self.ha, self.dec, self.latitude)
+        return '{:+09.0f}{:09.0f}'.format(alt * 3600 * 100, az * 3600 * 100)
+
+    def _cmd_slew_to_target(self, name, params):
+        if self.state == '6' or self.target is None:
+            return 0
+
+        self._start_slew('sky', self.target)
+        return 1
+
+    def _cmd_calibrate_mount(self, name, params):
+        if self.target is None:
+            return 0
+
+        ra, self.dec = self.target
+        self.ha = _wrap(self._lst() - ra)
+        return 1
+
+    def _cmd_goto_home(self, name, params):
+        if self.state == '6':
+            return 0
+
+        self._start_slew('home', self.home_position)
+        return 1
+
+    def _cmd_park(self, name, params):
+        if self.target is None:
+            return 0
+
+        ra, dec = self.target
+        self._start_slew('park', (_wrap(self._lst() - ra), dec))
+        return 1
+
+    def _cmd_unpark(self, name, params):
+        if self.state == '6':
+            self.state = '0'
+        return 1
+
+    def _cmd_is_parked(self, name, params):
+        return 1 if self.state == '6' else 0
+
+    def _cmd_set_zero_position(self, name, params):
+        self.state = '7'
+        return 1
+
+    def _cmd_stop_slewing(self, name, params):
+        if self.state == '2':
+            self._slew_to = None
+            self.state = '1' if self.tracking else '0'
+        return 1
+
+    def _cmd_stop_moving(self, name, params):
+        self._cmd_stop_slewing(name, params)
+        self._moves.clear()
+        return 1
+
+    def _cmd_stop_moving_horizontal(self, name, params):
+        self._moves.pop('ra', None)
+        return 1
+
+    def _cmd_stop_moving_vertical(self, name, params):
+        self._moves.pop('dec', None)
+        return 1
+
+    def _cmd_start_tracking(self, name, params):
+        self.tracking = True
+        if self.state in ['0', '7']:
+            self.state = '1'
+        return 1
+
+    def _cmd_stop_tracking(self, name, params):
+        self.tracking = False
+        if self.state in ['1', '3', '5']:
+            self.state = '0'
+        return 1
+
+    def _cmd_set_sidereal_tracking(self, name, params):
+        self.tracking_mode = '0'
+        return 1
+
+    def _cmd_set_custom_tracking(self, name, params):
+        self.tracking_mode = '4'
+        return 1
+
+    def _cmd_set_custom_ra_tracking_rate(self, name, params):
+        self.custom_rate['ra'] = float(params)
+        return 1
+
+    def _cmd_set_custom_dec_tracking_rate(self, name, params):
+        self.custom_rate['dec'] = float(params)
+        return 1
+
+    def _cmd_set_button_moving_rate(self, name, params):
+        self.button_rate = int(params)
+        return 1
+
+    def _cmd_set_guide_rate(self, name, params):
+        self.guide_rate = int(params) / 100
+        return 1
+
+    def _cmd_get_guide_rate(self, name, params):
+        return '{:03.0f}'.format(self.guide_rate * 100)
+
+    def _pulse(self, name, params):
+        axis, sign = _directions[name.split('_')[-1]]
+        self._move(axis, sign, self.guide_rate, seconds=int(params) / 1000)
+        if self.state in ['1', '5']:
+            self.state = '3'
+        return 1
+
+    _cmd_move_ms_north = _cmd_move_ms_south = _cmd_move_ms_east = _cmd_move_ms_west = _pulse
+
+    def _button(self, name, params):
+        axis, sign = _directions[name.split('_')[-1]]
+        self._move(axis, sign, self.button_rates.get(self.button_rate, 1))
+        return 1
+
+    _cmd_move_north = _cmd_move_south = _cmd_move_east = _cmd_move_west = _button
+
+
+# Axis and sign of the moves, west is towards higher hour angle
+_directions = {
+    'north': ('dec', 1),
+    'south': ('dec', -1),
+    'east': ('ra', -1),
+    'west': ('ra', 1),
+}
+
+
+def _wrap(degrees):
+    """ Angle in degrees wrapped to [-180, 180) """
+    return (degrees + 180) % 360 - 180
+
+
+def _step(value, distance, max_step):
+    """ Move `value` by `distance`, at most `max_step` """
+    return value + max(min(distance, max_step), -max_step)
+
+
+def _from_arcsec(params):
+    """ Signed integer as sent in the commands, e.g. '+0070344' """
+    return int(params.lstrip('+'))
+
+
+def _altaz(ha, dec, latitude):
+    """ Altitude and azimuth (from north, through east) in degrees """
+    h, d, phi = math.radians(ha), math.radians(dec), math.radians(latitude)
+
+    sin_alt = math.sin(d) * math.sin(phi) + math.cos(d) * math.cos(phi) * math.cos(h)
+    alt = math.asin(max(min(sin_alt, 1), -1))
+
+    az = math.atan2(-math.cos(d) * math.sin(h), math.sin(d) * math.cos(phi) - math.cos(d) * math.cos(h) * math.sin(phi))
+
+    return math.degrees(alt), math.degrees(az) % 360
+
+
+if __name__ == '__main__':
+    emulator = IOptronEmulator()
+    print("iOptron emulator on {}".format(emulator.start()))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
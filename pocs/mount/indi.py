@@ -189,11 +189,12 @@ class Mount(PanIndiDevice, AbstractMount):
 
         return self._target_coordinates
 
-    def set_target_coordinates(self, coords):
+    def set_target_coordinates(self, coords, apply_model=True):
         """ Sets the RA and Dec for the mount's current target.
 
         Args:
             coords (astropy.coordinates.SkyCoord): coordinates specifying target location
+            apply_model (bool): Not used, the pointing model isn't supported with INDI
 
         Returns:
             SkyCoord:  Return the coordinates if successful
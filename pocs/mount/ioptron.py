@@ -206,8 +206,8 @@ class Mount(AbstractSerialMount):
 
         # Location
         # Adjust the lat/long for format expected by iOptron
-        lat = '{:+07.0f}'.format(self.location.latitude.to(u.arcsecond).value)
-        lon = '{:+07.0f}'.format(self.location.longitude.to(u.arcsecond).value)
+        lat = '{:+07.0f}'.format(self.location.lat.to(u.arcsecond).value)
+        lon = '{:+07.0f}'.format(self.location.lon.to(u.arcsecond).value)
 
         self.serial_query('set_long', lon)
         self.serial_query('set_lat', lat)
@@ -215,8 +215,9 @@ class Mount(AbstractSerialMount):
         # Time
         self.serial_query('disable_daylight_savings')
 
-        gmt_offset = self.config.get('location').get('gmt_offset', 0)
-        self.serial_query('set_gmt_offset', gmt_offset)
+        # The mount wants minutes, `utc_offset` is in hours (see `Observatory._create_mount`)
+        gmt_offset = float(self.config.get('utc_offset', 0)) * 60
+        self.serial_query('set_gmt_offset', '{:+04.0f}'.format(gmt_offset))
 
         now = current_time() + gmt_offset * u.minute
 
@@ -78,6 +78,11 @@ class AbstractMount(object):
         self._current_coordinates = None
         self._park_coordinates = None
 
+        # Optional `PointingModel` applied to the target coordinates
+        self.pointing_model = None
+        self._pointing_correction = None
+        self._pointing_offset = None
+
     def connect(self):
         raise NotImplementedError()
 
@@ -212,17 +217,82 @@ class AbstractMount(object):
         """
         return self._target_coordinates
 
-    def set_target_coordinates(self, coords):
+    def set_target_coordinates(self, coords, apply_model=True):
         """ Sets the RA and Dec for the mount's current target.
 
         Args:
             coords (astropy.coordinates.SkyCoord): coordinates specifying target location
+            apply_model (bool): Correct the coordinates with the `pointing_model`, if there is
+                one. Defaults to True, turn off when syncing to a solved position.
 
         Returns:
             bool:  Boolean indicating success
         """
         self._target_coordinates = coords
 
+    def add_pointing(self, solved):
+        """ Add a solved position of the current target to the `pointing_model`
+
+        Args:
+            solved (astropy.coordinates.SkyCoord): Where the mount was found to point when
+                sent to the target.
+
+        Returns:
+            str: The side of the model the point was added to, None if it wasn't added.
+        """
+        if self.pointing_model is None or self._target_coordinates is None:
+            return None
+
+        side = self.pointing_model.add_point(self._target_coordinates, solved, self._get_lst(),
+                                             applied=self._pointing_correction)
+        if side is not None:
+            self.logger.debug("Pointing model {} side: {}".format(side, self.pointing_model.get_terms(side)))
+
+        return side
+
+    def has_pointing_model(self):
+        """ Whether the `pointing_model` is correcting the slews to the current target """
+        if self.pointing_model is None or self._target_coordinates is None:
+            return False
+
+        return self.pointing_model.is_active(self._get_lst() - self._target_coordinates.ra,
+                                             self._target_coordinates.dec)
+
+    def offset_pointing(self, solved):
+        """ Take what the `pointing_model` left off the next slews to the current target
+
+        This is used instead of a sync once the model is in use, as a sync would move the
+        zero point the model was fitted with. The offsets add up over the iterations and
+        are dropped when the target changes.
+
+        Args:
+            solved (astropy.coordinates.SkyCoord): Where the mount was found to point when
+                sent to the target.
+        """
+        if self.pointing_model is None or self._target_coordinates is None:
+            return
+
+        err_ha, err_dec = self.pointing_model.get_error(self._target_coordinates, solved)
+
+        d_ha, d_dec = self._get_pointing_offset(self._target_coordinates) or (0 * u.arcsec, 0 * u.arcsec)
+
+        self._pointing_offset = (self._target_coordinates, (d_ha + err_ha * u.arcsec, d_dec + err_dec * u.arcsec))
+        self.logger.debug("Pointing offset (HA, Dec): {}".format(self._pointing_offset[1]))
+
+    def sync_pointing(self, solved):
+        """ Keep the `pointing_model` in step with a sync of the mount to `solved`
+
+        Call this before the mount is synced (`calibrate_mount`), see `PointingModel.sync`.
+
+        Args:
+            solved (astropy.coordinates.SkyCoord): Where the mount is being synced to.
+        """
+        if self.pointing_model is None or self._target_coordinates is None:
+            return
+
+        self.pointing_model.sync(self._target_coordinates, solved, self._get_lst(),
+                                 applied=self._pointing_correction)
+
     def get_current_coordinates(self):
         """ Reads out the current coordinates from the mount.
 
@@ -349,6 +419,41 @@ class AbstractMount(object):
 # Private Methods
 ##################################################################################################
 
+    def _get_lst(self):
+        now = current_time()
+        now.location = self.location
+
+        return now.sidereal_time('apparent')
+
+    def _get_mount_target(self, coords, apply_model=True):
+        """ Coordinates to send to the mount for a target, corrected with the `pointing_model` """
+        self._pointing_correction = None
+
+        if not apply_model or self.pointing_model is None:
+            return coords
+
+        try:
+            corrected, self._pointing_correction = self.pointing_model.correct(
+                coords, self._get_lst(), offset=self._get_pointing_offset(coords))
+        except Exception as e:
+            self.logger.warning("Can't apply pointing model: {}".format(e))
+            return coords
+
+        self.logger.debug("Pointing model correction (HA, Dec): {}".format(self._pointing_correction))
+
+        return corrected
+
+    def _get_pointing_offset(self, coords):
+        """ The `offset_pointing` for `coords`, None (and dropped) if it was for another target """
+        if self._pointing_offset is None:
+            return None
+
+        if self._pointing_offset[0].separation(coords) > 1 * u.arcsec:
+            self._pointing_offset = None
+            return None
+
+        return self._pointing_offset[1]
+
     def _setup_location_for_mount(self):
         """ Sets the current location details for the mount. """
         raise NotImplementedError()
@@ -1,4 +1,5 @@
 import os
+import threading
 import time
 import yaml
 
@@ -36,6 +37,13 @@ class AbstractSerialMount(AbstractMount):
 
         # Setup our serial connection at the given port
         self._port = self.config.get('port')
+
+        # The status poller queries the mount from another thread, so each query
+        # (write and read) has to be done as a unit
+        self._serial_lock = threading.RLock()
+
+        # Longest wait for a response in seconds, the mount usually answers in a few ms
+        self._serial_timeout = self.config.get('serial_timeout', 1.0)
         try:
             self.serial = rs232.SerialData(port=self._port)
         except Exception as err:
@@ -90,7 +98,14 @@ class AbstractSerialMount(AbstractMount):
 
     def _update_status(self):
         """ """
-        self._raw_status = self.serial_query('get_status')
+        # One round trip for the status, guide rate and position
+        responses = self.serial_transaction('get_status', 'get_guide_rate', 'get_coordinates')
+
+        return self._parse_status(*responses)
+
+    def _parse_status(self, raw_status, guide_rate, mount_coords):
+        """ Updates the mount state from the responses to the status queries """
+        self._raw_status = raw_status
 
         status = dict()
 
@@ -110,15 +125,27 @@ class AbstractSerialMount(AbstractMount):
             self._is_tracking = 'Tracking' in self._state
             self._is_slewing = 'Slewing' in self._state
 
-            self.guide_rate = int(self.serial_query('get_guide_rate')) / 1000
+            try:
+                self.guide_rate = int(guide_rate) / 100
+            except ValueError:
+                self.logger.debug("Bad guide rate from mount: {}".format(guide_rate))
+
+        if mount_coords:
+            coords = self._mount_coord_to_skycoord(mount_coords)
+            if coords is not None:
+                self._current_coordinates = coords
 
         return status
 
-    def set_target_coordinates(self, coords):
+    def set_target_coordinates(self, coords, apply_model=True):
         """ Sets the RA and Dec for the mount's current target.
 
+        The coordinates sent to the mount are corrected with the `pointing_model`, the
+        target coordinates that are kept are the ones given.
+
         Args:
             coords (astropy.coordinates.SkyCoord): coordinates specifying target location
+            apply_model (bool): Correct the coordinates with the `pointing_model`, defaults to True.
 
         Returns:
             bool:  Boolean indicating success
@@ -129,7 +156,7 @@ class AbstractSerialMount(AbstractMount):
         self._target_coordinates = coords
 
         # Get coordinate format from mount specific class
-        mount_coords = self._skycoord_to_mount_coord(self._target_coordinates)
+        mount_coords = self._skycoord_to_mount_coord(self._get_mount_target(coords, apply_model=apply_model))
 
         # Send coordinates to mount
         try:
@@ -368,15 +395,7 @@ class AbstractSerialMount(AbstractMount):
 
     def set_tracking_rate(self, direction='ra', delta=0.0):
 
-        delta = round(float(delta), 4)
-
-        # Restrict range
-        if delta > 0.01:
-            delta = 0.01
-        elif delta < -0.01:
-            delta = -0.01
-
-        delta_str = '{:+0.04f}'.format(delta)
+        delta, delta_str = self._get_tracking_delta(delta)
 
         self.logger.debug("Setting tracking rate to sidereal {}".format(delta_str))
         if self.serial_query('set_custom_tracking'):
@@ -411,6 +430,10 @@ class AbstractSerialMount(AbstractMount):
             >>> mount.serial_query('get_local_time')            #doctest: +SKIP
             '101503'
 
+        Commands without a `response` in the commands file (e.g. the guide pulses) don't
+        wait for one and return ''. The time each query takes is added to the latency
+        histogram of the command, see `get_serial_latency`.
+
         Returns:
             bool: indicating success
         """
@@ -422,16 +445,97 @@ class AbstractSerialMount(AbstractMount):
 
         # self.logger.debug('Mount Query & Params: {} {}'.format(cmd, params))
 
-        self.serial.clear_buffer()
-
         full_command = self._get_command(cmd, params=params)
+        expected = self.commands.get(cmd, {}).get('response')
+
+        start_time = time.monotonic()
 
-        self.serial_write(full_command)
+        with self._serial_lock:
+            self.serial.clear_buffer()
 
-        response = self.serial_read()
+            self.serial_write(full_command)
+
+            response = self.serial_read(expected) if expected is not None else ''
+
+        self.serial.record_latency(cmd, time.monotonic() - start_time)
 
         return response
 
+    def serial_transaction(self, *queries):
+        """ Sends several queries back to back and returns their responses in order.
+
+        All the commands are written at once and the responses are split up as they arrive,
+        so the queries take about one round trip instead of one each. The serial lock is held
+        for the whole transaction so queries from other threads can't get in between.
+
+        Responses are split on the line ending (`cmd_post`, e.g. #). A response with a one
+        character format in the commands file (e.g. '1') is one character, as the mount sends
+        those without a line ending. Commands without a response don't wait for one.
+
+        Args:
+            *queries: Commands to send, each the name of a command or a (name, params) tuple.
+
+        Examples:
+            >>> mount.serial_transaction('get_status', ('set_ra', '54607210'))  #doctest: +SKIP
+            ['011911', 1]
+
+        Returns:
+            list: The response to each query, as from `serial_query`. What has arrived so far
+                (usually '') for a query the mount didn't answer in time.
+        """
+        assert self.is_initialized, self.logger.warning('Mount has not been initialized')
+
+        commands = list()
+        for query in queries:
+            if isinstance(query, str):
+                query = (query,)
+
+            cmd = query[0]
+            params = query[1] if len(query) > 1 else None
+
+            commands.append((cmd, self._get_command(cmd, params=params), self.commands.get(cmd, {}).get('response')))
+
+        responses = list()
+
+        start_time = time.monotonic()
+        end_time = start_time + self._serial_timeout
+
+        with self._serial_lock:
+            self.serial.clear_buffer()
+
+            self.serial_write(''.join(full_command for cmd, full_command, expected in commands))
+
+            buffer = ''
+            for cmd, full_command, expected in commands:
+                if expected is None:
+                    responses.append('')
+                    continue
+
+                response, buffer = self._split_response(buffer, expected)
+                while response is None:
+                    if time.monotonic() > end_time:
+                        self.logger.warning("No response to {} from mount".format(cmd))
+                        response, buffer = buffer, ''
+                        break
+
+                    response, buffer = self._split_response(buffer + self.serial.read_waiting(), expected)
+
+                responses.append(self._parse_response(response))
+
+        self.serial.record_latency(','.join(cmd for cmd, full_command, expected in commands),
+                                   time.monotonic() - start_time)
+
+        return responses
+
+    def get_serial_latency(self, cmd=None):
+        """ Response times of the mount for a command, or for all commands
+
+        Returns:
+            dict:   Count, mean, percentiles and max in ms plus a histogram, see
+                `pocs.utils.rs232.LatencyHistogram`. For all commands, keyed by command.
+        """
+        return self.serial.get_latency(cmd)
+
     def serial_write(self, cmd):
         """ Sends a string command to the mount via the serial port.
 
@@ -450,9 +554,16 @@ class AbstractSerialMount(AbstractMount):
         # self.logger.debug("Mount Query: {}".format(cmd))
         self.serial.write(cmd)
 
-    def serial_read(self):
+    def serial_read(self, expected=None):
         """ Reads from the serial connection
 
+        The response is complete when the line ending (`cmd_post`, e.g. #) arrives. Some
+        responses (e.g. '1') don't have one, so a response that is at least as long as the
+        `expected` one from the commands file is also complete once nothing more arrives.
+
+        Args:
+            expected (str): The response format from the commands file.
+
         Returns:
             str: Response from mount
         """
@@ -460,11 +571,33 @@ class AbstractSerialMount(AbstractMount):
 
         response = ''
 
-        response = self.serial.read()
+        response = self.serial.read(terminator=self._post_cmd,
+                                    min_size=len(str(expected)) if expected is not None else None,
+                                    timeout=self._serial_timeout)
 
         # self.logger.debug("Mount Read: {}".format(response))
 
-        # Strip the line ending (#) and return
+        return self._parse_response(response)
+
+
+##################################################################################################
+# Private Methods
+##################################################################################################
+
+    def _get_tracking_delta(self, delta):
+        """ Tracking rate delta restricted to +/-0.01 and formatted for the mount """
+        delta = round(float(delta), 4)
+
+        # Restrict range
+        if delta > 0.01:
+            delta = 0.01
+        elif delta < -0.01:
+            delta = -0.01
+
+        return delta, '{:+0.04f}'.format(delta)
+
+    def _parse_response(self, response):
+        """ Strips the line ending (#) and turns 0 and 1 into integers """
         response = response.rstrip('#')
 
         # If it is an integer, turn it into one
@@ -476,10 +609,27 @@ class AbstractSerialMount(AbstractMount):
 
         return response
 
+    def _split_response(self, buffer, expected):
+        """ Splits the next response off the start of `buffer`
 
-##################################################################################################
-# Private Methods
-##################################################################################################
+        Returns:
+            tuple: The response (None if it hasn't all arrived) and the rest of the buffer.
+        """
+        # The line ending of a one character response that did have one
+        if buffer.startswith(self._post_cmd):
+            buffer = buffer[len(self._post_cmd):]
+
+        if len(str(expected)) == 1:
+            if buffer:
+                return buffer[0], buffer[1:]
+
+            return None, buffer
+
+        end = buffer.find(self._post_cmd)
+        if end < 0:
+            return None, buffer
+
+        return buffer[:end], buffer[end + len(self._post_cmd):]
 
     def _setup_commands(self, commands):
         """
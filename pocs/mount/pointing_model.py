@@ -0,0 +1,311 @@
+import json
+import os
+
+from warnings import warn
+
+import numpy as np
+
+from astropy import units as u
+from astropy.coordinates import Angle
+from astropy.coordinates import SkyCoord
+
+
+class PointingModel(object):
+
+    """ A TPoint-style pointing model, learned from the solved pointing images
+
+    The pointing error of an equatorial mount is mostly a few geometric terms:
+
+        * IH, ID: Index errors (zero points) in hour angle and declination.
+        * CH: Collimation, the optical axis not at right angles to the Dec axis.
+        * NP: Non-perpendicularity of the HA and Dec axes.
+        * MA, ME: Polar axis misaligned left-right (azimuth) and up-down (elevation).
+        * TF: Tube flexure, sagging with the cosine of the altitude.
+
+    A German equatorial mount flips to the other side of the pier at the meridian and the
+    terms are different on each side, so there is a set for targets `east` of the meridian
+    (hour angle < 0) and one for targets to the `west`.
+
+    Each solved image adds a point with `add_point` and the terms of that side are refit.
+    The fit is least squares through the normal equations, which are updated with each
+    point, so a refit is solving a 7x7 system however many points there are. Older points
+    are down-weighted by `decay` so the model follows slow changes in the mount. A sync of
+    the mount to a solve moves its zero point, which is taken off the index terms of the
+    existing points with `sync`. The terms are only used once a side has `min_points`.
+
+    Args:
+        latitude(`astropy.units.Quantity`): Latitude of the site.
+        model_file(str):    JSON file the model is saved to after each point and loaded
+            from when created, defaults to None (not saved).
+        decay(float):       Weight of the existing points when one is added, defaults to 0.98.
+        min_points(int):    Points needed on a side before it is used, defaults to 5.
+        max_dec(float):     Points and targets above this |declination| (degrees) are
+            ignored as the terms blow up at the pole, defaults to 85.
+    """
+
+    terms = ['IH', 'ID', 'CH', 'NP', 'MA', 'ME', 'TF']
+
+    sides = ['east', 'west']
+
+    # Keeps the fit solvable while a side only has a few points (relative to their weight)
+    ridge = 1e-6
+
+    def __init__(self, latitude, model_file=None, decay=0.98, min_points=5, max_dec=85):
+        self.latitude = Angle(latitude)
+        self.model_file = model_file
+        self.decay = decay
+        self.min_points = min_points
+        self.max_dec = max_dec
+
+        self._fits = dict((side, self._empty_fit()) for side in self.sides)
+
+        if model_file is not None and os.path.exists(model_file):
+            self.load(model_file)
+
+    def get_side(self, ha):
+        """ 'east' for a target east of the meridian (`ha` < 0), else 'west' """
+        return 'east' if _wrap(Angle(ha).degree) < 0 else 'west'
+
+    def is_active(self, ha, dec):
+        """ Whether the terms are used for a position, see `predict` """
+        if abs(Angle(dec).degree) > self.max_dec:
+            return False
+
+        return self._fits[self.get_side(ha)]['count'] >= self.min_points
+
+    def get_terms(self, side):
+        """ The fitted terms (arcsec) for a side, all 0 until it has `min_points` """
+        fit = self._fits[side]
+        if fit['count'] < self.min_points:
+            return dict((term, 0.0) for term in self.terms)
+
+        return dict(zip(self.terms, fit['terms']))
+
+    def predict(self, ha, dec):
+        """ Pointing error of the mount at a position
+
+        Args:
+            ha(`astropy.coordinates.Angle`):    Hour angle.
+            dec(`astropy.coordinates.Angle`):   Declination.
+
+        Returns:
+            tuple:  The error in hour angle and in declination as `astropy.units.Quantity`
+                (arcsec), i.e. where the mount ends up minus where it was sent.
+        """
+        ha = Angle(ha)
+        dec = Angle(dec)
+
+        if not self.is_active(ha, dec):
+            return 0 * u.arcsec, 0 * u.arcsec
+
+        d_ha, d_dec = self._design(ha, dec).dot(self._fits[self.get_side(ha)]['terms'])
+
+        return d_ha * u.arcsec, d_dec * u.arcsec
+
+    def correct(self, coords, lst, offset=None):
+        """ Coordinates to send the mount to so it ends up at `coords`
+
+        Args:
+            coords(`astropy.coordinates.SkyCoord`): Where the mount should point.
+            lst(`astropy.coordinates.Angle`):       Local sidereal time of the slew.
+            offset(tuple):  A further error in hour angle and declination (`Quantity`) to
+                take off, e.g. what was left after the model on the last slew to `coords`.
+
+        Returns:
+            tuple:  The corrected `SkyCoord` and the predicted error in hour angle and
+                declination (see `predict`), which is what was taken off.
+        """
+        ha = Angle(lst) - coords.ra
+        d_ha, d_dec = self.predict(ha, coords.dec)
+
+        if offset is not None:
+            d_ha = d_ha + offset[0]
+            d_dec = d_dec + offset[1]
+
+        # RA goes the other way to hour angle
+        corrected = SkyCoord(ra=(coords.ra + d_ha).wrap_at(360 * u.degree), dec=coords.dec - d_dec)
+
+        return corrected, (d_ha, d_dec)
+
+    def add_point(self, commanded, solved, lst, applied=None):
+        """ Add a solved pointing and refit the terms of its side
+
+        Args:
+            commanded(`astropy.coordinates.SkyCoord`): Where the mount was meant to point.
+            solved(`astropy.coordinates.SkyCoord`):    Where the image was solved to be.
+            lst(`astropy.coordinates.Angle`):          Local sidereal time of the image.
+            applied(tuple):     The correction that was taken off `commanded` for the slew
+                (as returned by `correct`), so the full error of the mount is fitted.
+
+        Returns:
+            str:    The side the point was added to, None if it was ignored.
+        """
+        ha = Angle(lst) - commanded.ra
+        dec = commanded.dec
+
+        if abs(dec.degree) > self.max_dec:
+            return None
+
+        err_ha, err_dec = self.get_error(commanded, solved, applied=applied)
+
+        side = self.get_side(ha)
+        fit = self._fits[side]
+
+        rows = self._design(ha, dec)
+        fit['ata'] = self.decay * fit['ata'] + rows.T.dot(rows)
+        fit['atb'] = self.decay * fit['atb'] + rows.T.dot([err_ha, err_dec])
+        fit['weight'] = self.decay * fit['weight'] + 1
+        fit['count'] += 1
+
+        self._refit(side)
+
+        if self.model_file is not None:
+            self.save(self.model_file)
+
+        return side
+
+    def get_error(self, commanded, solved, applied=None):
+        """ Pointing error of the mount, as fitted by the model
+
+        Args:
+            commanded(`astropy.coordinates.SkyCoord`): Where the mount was meant to point.
+            solved(`astropy.coordinates.SkyCoord`):    Where the image was solved to be.
+            applied(tuple):     The correction that was taken off `commanded`, see `add_point`.
+
+        Returns:
+            tuple:  The error in hour angle and in declination (arcsec, as floats).
+        """
+        err_ha = -_wrap((solved.ra - commanded.ra).to(u.degree).value) * 3600
+        err_dec = (solved.dec - commanded.dec).to(u.arcsec).value
+
+        if applied is not None:
+            err_ha += applied[0].to(u.arcsec).value
+            err_dec += applied[1].to(u.arcsec).value
+
+        return err_ha, err_dec
+
+    def sync(self, commanded, solved, lst, applied=None):
+        """ Move the points to the frame of a mount that is synced to a solve
+
+        Syncing (`calibrate_mount`) moves the zero points of the mount axes by the error at
+        the sync position, so the errors measured afterwards are smaller by that much. The
+        same is taken off the index terms (IH, ID) of the existing points. The declination
+        axis is flipped on the other side of the pier, so ID moves the other way there.
+
+        Args:
+            commanded(`astropy.coordinates.SkyCoord`): Where the mount was meant to point.
+            solved(`astropy.coordinates.SkyCoord`):    Where it is and is being synced to.
+            lst(`astropy.coordinates.Angle`):          Local sidereal time of the sync.
+            applied(tuple):     The correction that was taken off `commanded`, see `add_point`.
+        """
+        err_ha, err_dec = self.get_error(commanded, solved, applied=applied)
+        synced_side = self.get_side(Angle(lst) - commanded.ra)
+
+        for side, fit in self._fits.items():
+            shift = np.zeros(len(self.terms))
+            shift[0] = err_ha
+            shift[1] = err_dec if side == synced_side else -err_dec
+
+            # Same as taking `shift` off the error of every point that is in the fit
+            fit['atb'] = fit['atb'] - fit['ata'].dot(shift)
+            self._refit(side)
+
+        if self.model_file is not None:
+            self.save(self.model_file)
+
+    def reset(self, side=None):
+        """ Forget the points of a side, or of both sides """
+        for name in ([side] if side else self.sides):
+            self._fits[name] = self._empty_fit()
+
+    def to_dict(self):
+        return {
+            'latitude': self.latitude.degree,
+            'sides': dict((side, {
+                'ata': fit['ata'].tolist(),
+                'atb': fit['atb'].tolist(),
+                'weight': fit['weight'],
+                'count': fit['count'],
+                'terms': dict(zip(self.terms, fit['terms'].tolist())),
+            }) for side, fit in self._fits.items()),
+        }
+
+    def save(self, fname):
+        """ Write the model to a JSON file """
+        try:
+            tmp_file = '{}.tmp'.format(fname)
+            with open(tmp_file, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            os.replace(tmp_file, fname)
+        except OSError as e:
+            warn("Can't save pointing model: {}".format(e))
+
+    def load(self, fname):
+        """ Read the points of a model written with `save`
+
+        Returns:
+            bool:   Whether the model was loaded, it isn't if it is for another latitude.
+        """
+        try:
+            with open(fname, 'r') as f:
+                info = json.load(f)
+
+            if not np.isclose(info['latitude'], self.latitude.degree):
+                warn("Pointing model in {} is for another site, not using it".format(fname))
+                return False
+
+            for side in self.sides:
+                saved = info['sides'][side]
+                self._fits[side] = {
+                    'ata': np.array(saved['ata'], dtype=float),
+                    'atb': np.array(saved['atb'], dtype=float),
+                    'weight': float(saved['weight']),
+                    'count': int(saved['count']),
+                    'terms': np.zeros(len(self.terms)),
+                }
+                self._refit(side)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            warn("Can't load pointing model: {}".format(e))
+            return False
+
+        return True
+
+    def _empty_fit(self):
+        n_terms = len(self.terms)
+        return {
+            'ata': np.zeros((n_terms, n_terms)),
+            'atb': np.zeros(n_terms),
+            'weight': 0.0,
+            'count': 0,
+            'terms': np.zeros(n_terms),
+        }
+
+    def _refit(self, side):
+        fit = self._fits[side]
+        if fit['count'] == 0:
+            return
+
+        regularised = fit['ata'] + self.ridge * fit['weight'] * np.eye(len(self.terms))
+        try:
+            fit['terms'] = np.linalg.solve(regularised, fit['atb'])
+        except np.linalg.LinAlgError as e:
+            warn("Can't fit pointing model for the {} side: {}".format(side, e))
+
+    def _design(self, ha, dec):
+        """ How each term moves the pointing in hour angle (first row) and declination """
+        h = Angle(ha).radian
+        d = Angle(dec).radian
+        phi = self.latitude.radian
+
+        sec_d = 1 / np.cos(d)
+        tan_d = np.tan(d)
+
+        return np.array([
+            [1, 0, sec_d, tan_d, -np.cos(h) * tan_d, np.sin(h) * tan_d, np.cos(phi) * np.sin(h) * sec_d],
+            [0, 1, 0, 0, np.sin(h), np.cos(h), np.cos(phi) * np.cos(h) * np.sin(d) - np.sin(phi) * np.cos(d)],
+        ])
+
+
+def _wrap(degrees):
+    """ Angle in degrees wrapped to [-180, 180) """
+    return (degrees + 180) % 360 - 180
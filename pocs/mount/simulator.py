@@ -84,17 +84,19 @@ class Mount(AbstractMount):
 
         return status
 
-    def set_target_coordinates(self, coords):
+    def set_target_coordinates(self, coords, apply_model=True):
         """ Sets the RA and Dec for the mount's current target.
 
         Args:
             coords (astropy.coordinates.SkyCoord): coordinates specifying target location
+            apply_model (bool): Correct the coordinates with the `pointing_model`, defaults to True.
 
         Returns:
             bool:  Boolean indicating success
         """
         self.logger.debug("Setting coords to {}".format(coords))
         self._target_coordinates = coords
+        self._get_mount_target(coords, apply_model=apply_model)
 
         return True
 
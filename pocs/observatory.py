@@ -2,20 +2,27 @@ import glob
 import os
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from astropy import units as u
 from astropy.coordinates import EarthLocation
 from astropy.coordinates import SkyCoord
-from astropy.coordinates import get_sun
 from astropy.io import fits
 
+from .guider import CameraOffsets
+from .guider import Guider
+from .guider import get_guide_wcsinfo
+from .mount.corrections import CorrectionScheduler
+from .mount.pointing_model import PointingModel
+from .scheduler.twilight import TwilightTimetable
 from .utils import current_time
 from .utils import error
 from .utils import images
 from .utils import list_connected_cameras
 from .utils import load_module
 from .utils.logger import get_logger
+from .utils.status import StatusPoller
 
 
 class Observatory(object):
@@ -43,21 +50,50 @@ class Observatory(object):
         self.mount = None
         self._create_mount()
 
+        guiding_config = self.config.get('guiding', {})
+        self.corrections = CorrectionScheduler(self.mount,
+                                               min_ms=guiding_config.get('min_ms', 10),
+                                               max_ms=guiding_config.get('max_ms', 5000),
+                                               concurrent_axes=guiding_config.get('concurrent_axes', False))
+
+        self._create_pointing_model()
+
         self.logger.info('\t\t Setting up cameras')
         self.cameras = dict()
         self._primary_camera = None
         self._create_cameras(**kwargs)
 
+        self.logger.info('\t\t Setting up guider')
+        self.guider = None
+        self._guided_target = None
+        self._create_guider()
+
         self.logger.info('\t\t Setting up scheduler')
         self.scheduler = None
         self._create_scheduler()
 
         self.mount.observer = self.scheduler
 
+        self.logger.info('\t\t Setting up twilight timetable')
+        self._twilight = None
+        self._twilight_file = os.path.join(self.config['directories'].get('data', '/var/panoptes/data'), 'twilight.json')
+        self._load_twilight()
+
+        self.logger.info('\t\t Setting up status poller')
+        self.status_poller = None
+        self._create_status_poller()
+
         # The current target
         self.observed_targets = []
         self.current_target = None
 
+        # Analysis of the exposures while observing, see `start_analysis`
+        self.pipeline = self.config.get('observing', {}).get('pipeline', False)
+        self._analysis_executor = None
+        self._analyses = []
+        self._exposure_count = 0
+        self._corrected_at = 0
+
         self._image_dir = self.config['directories']['images']
         self.logger.info('\t Observatory initialized')
 
@@ -70,15 +106,25 @@ class Observatory(object):
         horizon = self.location.get('twilight_horizon', -18 * u.degree)
 
         time = current_time()
-        is_dark = self.scheduler.is_night(time, horizon=horizon)
+        is_dark = self.twilight.is_dark(time)
 
         self.logger.debug("Is dark (☉ < {}): {}".format(horizon, is_dark))
         if not is_dark:
-            sun_pos = self.scheduler.altaz(time, target=get_sun(time)).alt
-            self.logger.debug("Sun position: {:.02f}".format(sun_pos))
+            self.logger.debug("Seconds until dark: {}".format(self.twilight.time_until_dark(time)))
 
         return is_dark
 
+    @property
+    def twilight(self):
+        """ `pocs.scheduler.twilight.TwilightTimetable` for the current (or next) night
+
+        A new timetable is worked out once the night is over.
+        """
+        if self._twilight is None or not self._twilight.covers(current_time()):
+            self.update_twilight()
+
+        return self._twilight
+
     @property
     def sidereal_time(self):
         return self.scheduler.local_sidereal_time(current_time())
@@ -92,36 +138,76 @@ class Observatory(object):
 # Methods
 ##################################################################################################
 
+    def update_twilight(self, time=None, next_night=False):
+        """ Work out (and save) the twilight timetable for the night at or after `time`
+
+        This is done at startup and in the `housekeeping` state, then whenever the
+        timetable is out of date.
+
+        Args:
+            time(`astropy.time.Time`):  Defaults to now.
+            next_night(bool):   The night after the next sunset even if the sun is still
+                down, see `TwilightTimetable.compute`. Defaults to False.
+
+        Returns:
+            `pocs.scheduler.twilight.TwilightTimetable`:    The new timetable.
+        """
+        horizon = self.location.get('twilight_horizon', -18 * u.degree)
+
+        self._twilight = TwilightTimetable.compute(self.scheduler, time=time, horizon=horizon,
+                                                   next_night=next_night)
+        self.logger.debug("Twilight timetable: {}".format(self._twilight))
+
+        self._twilight.save(self._twilight_file)
+
+        return self._twilight
+
     def power_down(self):
         self.logger.debug("Shutting down observatory")
 
+        self.stop_guiding()
+        self.status_poller.stop()
+        self.corrections.cancel()
+
+        if self._analysis_executor is not None:
+            self._analysis_executor.shutdown(wait=False)
+            self._analysis_executor = None
+
         # Stop cameras if exposing
 
     def status(self):
-        """ """
+        """ Status of the observatory
+
+        The mount values come from the snapshot kept by `status_poller`, so this doesn't
+        talk to the mount. The age of each mount value (in seconds) is in `mount.age`.
+        """
         status = {}
         try:
             t = current_time()
             local_time = str(datetime.now()).split('.')[0]
 
             if self.mount.is_initialized:
-                status['mount'] = self.mount.status()
+                if not self.status_poller.is_running:
+                    # Fill the snapshot before the first status
+                    self.status_poller.poll()
+                    self.status_poller.start()
+
+                snapshot = self.status_poller.get_snapshot()
+
+                status['mount'] = dict(snapshot.get('mount', {}))
 
                 status['mount']['tracking_rate'] = '{:0.04f}'.format(self.mount.tracking_rate)
                 status['mount']['guide_rate'] = self.mount.guide_rate
 
-                current_coord = self.mount.get_current_coordinates()
-                status['mount']['current_ra'] = current_coord.ra
-                status['mount']['current_dec'] = current_coord.dec
-                status['mount']['current_ha'] = self.scheduler.target_hour_angle(t, current_coord)
+                status['mount'].update(snapshot.get('current_coordinates', {}))
 
                 if self.mount.has_target:
-                    target_coord = self.mount.get_target_coordinates()
-                    status['mount']['mount_target_ra'] = target_coord.ra
-                    status['mount']['mount_target_dec'] = target_coord.dec
-                    status['mount']['mount_target_ha'] = self.scheduler.target_hour_angle(t, target_coord)
+                    status['mount'].update(snapshot.get('target_coordinates', {}))
+
+                if 'mount_time' in snapshot:
+                    status['mount']['timestamp'] = snapshot['mount_time']
 
-                status['mount']['timestamp'] = self.mount.serial_query('get_local_time')
+                status['mount']['age'] = snapshot['age']
 
             if self.current_target:
                 status['target'] = self.current_target.status()
@@ -130,10 +216,10 @@ class Observatory(object):
                 'siderealtime': str(self.sidereal_time),
                 'utctime': t,
                 'localtime': local_time,
-                'local_evening_astro_time': self.scheduler.twilight_evening_astronomical(t, which='next'),
-                'local_morning_astro_time': self.scheduler.twilight_morning_astronomical(t, which='next'),
-                'local_sun_set_time': self.scheduler.sun_set_time(t),
-                'local_sun_rise_time': self.scheduler.sun_rise_time(t),
+                'local_evening_astro_time': self.twilight.get_time('astronomical_evening'),
+                'local_morning_astro_time': self.twilight.get_time('astronomical_morning'),
+                'local_sun_set_time': self.twilight.get_time('sunset'),
+                'local_sun_rise_time': self.twilight.get_time('sunrise'),
                 'local_moon_alt': self.scheduler.moon_altaz(t).alt,
                 'local_moon_illumination': self.scheduler.moon_illumination(t),
                 'local_moon_phase': self.scheduler.moon_phase(t),
@@ -188,6 +274,8 @@ class Observatory(object):
                     # We split filename so camera name is appended
                     self.logger.debug("Taking exposure for visit")
                     images = visit.take_exposures()
+                    if images:
+                        self._exposure_count += 1
                 except Exception as e:
                     self.logger.error("Problem with observing: {}".format(e))
             else:
@@ -229,61 +317,201 @@ class Observatory(object):
         self.logger.debug("Returning new target")
         return target
 
-    def analyze_recent(self, **kwargs):
+    def analyze_recent(self, exposure=None, background=False, **kwargs):
         """ Analyze the most recent `exposure`
 
-        Converts the raw CR2 images into FITS and measures the offset. Does some
-        bookkeeping. Information about the exposure, including the offset from the
-        `reference_image` is returned.
+        Measures the offset from the `reference_image`, then converts the raw CR2 images
+        into FITS. The images are only plate-solved when the WCS can't be propagated from
+        the last solve (see `Target.needs_solve`). Does some bookkeeping. Information about
+        the exposure, including the offset from the `reference_image` is returned.
+
+        Args:
+            exposure(`Observation.Exposure`):   Exposure to analyze, defaults to the current
+                exposure of the current visit.
+            background(bool):   Analyzing in the background (see `start_analysis`), so the
+                offset isn't stored on the target and the drift plot isn't drawn.
         """
         target = self.current_target
         self.logger.debug("For analyzing: Target: {}".format(target))
 
-        observation = target.current_visit
-        self.logger.debug("For analyzing: Observation: {}".format(observation))
+        if exposure is None:
+            observation = target.current_visit
+            self.logger.debug("For analyzing: Observation: {}".format(observation))
+
+            exposure = observation.current_exposure
 
-        exposure = observation.current_exposure
         self.logger.debug("For analyzing: Exposure: {}".format(exposure))
 
+        self.logger.debug("Getting offset from guide")
+        offset_info = target.get_image_offset(exposure, with_plot=not background, update=not background)
+
         # Get the standard FITS headers. Includes information about target
         fits_headers = self._get_standard_headers(target=target)
         fits_headers['title'] = target.name
 
+        solve = target.needs_solve(offset_info)
+
         try:
             kwargs = {}
-            if 'ra_center' in target.guide_wcsinfo:
-                kwargs['ra'] = target.guide_wcsinfo['ra_center'].value
-            if 'dec_center' in target.guide_wcsinfo:
-                kwargs['dec'] = target.guide_wcsinfo['dec_center'].value
-            if 'fieldw' in target.guide_wcsinfo:
-                kwargs['radius'] = target.guide_wcsinfo['fieldw'].value
+
+            # Use the propagated WCS as the solve hint if we have one
+            wcs_info = target.get_frame_wcsinfo(offset_info) or target.guide_wcsinfo
+
+            if 'ra_center' in wcs_info:
+                kwargs['ra'] = wcs_info['ra_center'].value
+            if 'dec_center' in wcs_info:
+                kwargs['dec'] = wcs_info['dec_center'].value
+            if 'fieldw' in wcs_info:
+                kwargs['radius'] = wcs_info['fieldw'].value
             else:
                 kwargs['radius'] = 15.0
 
-            # Process the raw images (just makes a pretty right now - we solved above and offset below)
-            self.logger.debug("Starting image processing")
-            exposure.process_images(fits_headers=fits_headers, solve=False, **kwargs)
+            # Process the raw images
+            self.logger.debug("Starting image processing (solve={})".format(solve))
+            exposure.process_images(fits_headers=fits_headers, solve=solve, **kwargs)
+
+            target.update_frame_wcs(exposure, solved=solve, offset_info=offset_info)
         except Exception as e:
             self.logger.warning("Problem analyzing: {}".format(e))
 
-        self.logger.debug("Getting offset from guide")
-        offset_info = target.get_image_offset(exposure, with_plot=True)
+        return offset_info
+
+    def start_guiding(self):
+        """ Start the guider on the current target
+
+        Does nothing if there is no guider (see the `guider` config entry) or it is already
+        guiding on the current target. A new target gets a new guide reference.
+
+        Returns:
+            bool:   Whether the guider is running.
+        """
+        if self.guider is None or self.current_target is None:
+            return False
+
+        if self.guider.is_running and self._guided_target is self.current_target:
+            return True
+
+        self.guider.stop()
+        self.guider.measure.reset()
+        self.guider.start()
+        self._guided_target = self.current_target
+
+        self.logger.debug("Guiding on {}".format(self.current_target))
+
+        return True
+
+    def stop_guiding(self):
+        """ Stop the guider, e.g. before slewing """
+        if self.guider is not None and self.guider.is_running:
+            self.logger.debug("Stopping guider, RMS (arcsec): {}".format(self.guider.get_rms()))
+            self.guider.stop()
+
+        self._guided_target = None
+
+    def start_analysis(self):
+        """ Analyze the exposure that was just taken in the background
+
+        Used when observing is pipelined (the `observing.pipeline` config entry): the next
+        exposure is started as soon as this one is read out while this one is analyzed
+        (see `analyze_recent`). The exposures are analyzed one at a time, in order. The
+        tracking corrections from the analysis are applied between exposures with
+        `apply_corrections`.
+
+        Returns:
+            `concurrent.futures.Future`:    Future for the offset information.
+        """
+        exposure = self.current_target.current_visit.current_exposure
+
+        if self._analysis_executor is None:
+            self._analysis_executor = ThreadPoolExecutor(max_workers=1)
+
+        future = self._analysis_executor.submit(self.analyze_recent, exposure=exposure, background=True)
+        self._analyses.append((self._exposure_count, future))
+
+        return future
+
+    @property
+    def has_pending_analysis(self):
+        return len(self._analyses) > 0
+
+    def apply_corrections(self, wait=False):
+        """ Apply the tracking corrections from the finished background analyses
+
+        This must only be called between exposures. Each offset is measured from the
+        `reference_image`, so only the most recent one is applied. Exposures that were
+        started before the last correction still show the old offset, so their results
+        are ignored.
+
+        Args:
+            wait(bool): Wait for all of the analyses to finish first, defaults to False.
+
+        Returns:
+            dict:   The most recent offset information, None if no analysis has finished.
+        """
+        finished = []
+        pending = []
+
+        for exp_count, future in self._analyses:
+            if not wait and not future.done():
+                pending.append((exp_count, future))
+                continue
+
+            try:
+                finished.append((exp_count, future.result()))
+            except Exception as e:
+                self.logger.warning("Problem analyzing exposure {}: {}".format(exp_count, e))
+
+        self._analyses = pending
+
+        if not finished:
+            return None
+
+        exp_count, offset_info = finished[-1]
+
+        if exp_count > self._corrected_at:
+            if self.update_tracking(offset_info=offset_info):
+                self._corrected_at = self._exposure_count
+        else:
+            self.logger.debug("Exposure {} was taken before the last correction, skipping".format(exp_count))
+
+        # Everything has been dealt with, don't let `tracking` apply the offset again
+        if not self._analyses:
+            self.current_target.offset_info = {}
 
         return offset_info
 
-    def update_tracking(self):
+    def update_tracking(self, offset_info=None):
+        """ Adjust the tracking from the measured offset
+
+        The guide pulses are sent by `corrections` and this returns straight away, use
+        `corrections.wait` (or `corrections.is_busy`) to know when they have finished.
+
+        Args:
+            offset_info(dict):  Offset information (see `Target.get_image_offset`), defaults
+                to the `offset_info` of the current target.
+
+        Returns:
+            bool:   Whether the mount was adjusted.
+        """
         target = self.current_target
-        pass
+        adjusted = False
+
+        if self.guider is not None and self.guider.is_running:
+            self.logger.debug("Guider is correcting the tracking")
+            target.offset_info = {}
+            return adjusted
 
         # Make sure we have a target
         if target.current_visit is not None:
 
-            offset_info = target.offset_info
+            if offset_info is None:
+                offset_info = target.offset_info
 
             ra_delta_rate = offset_info.get('ra_delta_rate', 0.0)
             if ra_delta_rate != 0.0:
                 self.logger.debug("Delta RA Rate: {}".format(ra_delta_rate))
                 self.mount.set_tracking_rate(delta=ra_delta_rate)
+                adjusted = True
 
             # Get the delay for the RA and Dec and adjust mount accordingly.
             for direction in ['dec', 'ra']:
@@ -314,35 +542,19 @@ class Observatory(object):
                         ms_offset = ms_offset + processing_time_delay
                         self.logger.debug("Total offset: {}".format(ms_offset))
 
-                        if direction == 'ra':
-                            if ms_offset > 0:
-                                direction_cardinal = 'west'
-                            else:
-                                direction_cardinal = 'east'
-                        elif direction == 'dec':
-                            if ms_offset > 0:
-                                direction_cardinal = 'south'
-                            else:
-                                direction_cardinal = 'north'
-
-                        # Now that we have direction, all ms are positive
-                        ms_offset = abs(ms_offset)
-
-                        move_dir = 'move_ms_{}'.format(direction_cardinal)
-                        move_ms = "{:05.0f}".format(ms_offset)
-                        self.logger.debug("Adjusting tracking by {} to direction {}".format(move_ms, move_dir))
-
-                        self.mount.serial_query(move_dir, move_ms)
-
-                        # The above is a non-blocking command but if we issue the next command (via the for loop)
-                        # then it will override the above, so we manually block for one second
-                        time.sleep(abs(ms_offset) / 1000)
+                        # Positive is west (RA) or south (Dec). The move is non-blocking, but if we issue
+                        # the next command (via the for loop) then it will override the above, so unless
+                        # `guiding.concurrent_axes` is set the pulses are sent one after the other.
+                        self.corrections.add(direction, ms_offset)
+                        adjusted = True
                     else:
                         self.logger.debug("Offset not in range")
 
         # Reset offset_info
         target.offset_info = {}
 
+        return adjusted
+
     def get_separation(self, guide_image, return_center=False):
         """ Adjusts pointing error from the most recent image.
 
@@ -386,6 +598,9 @@ class Observatory(object):
         if 'fieldw' in target.guide_wcsinfo:
             kwargs['radius'] = target.guide_wcsinfo['fieldw'].value
 
+        # The pointing depends on this solve
+        kwargs['priority'] = 'critical'
+
         self.logger.debug("Processing CR2 files with kwargs: {}".format(kwargs))
         processed_info = images.process_cr2(fname, fits_headers=fits_headers, timeout=45, **kwargs)
         # self.logger.debug("Processed info: {}".format(processed_info))
@@ -428,6 +643,65 @@ class Observatory(object):
 # Private Methods
 ##################################################################################################
 
+    def _load_twilight(self):
+        """ Use the saved twilight timetable if it is still current, otherwise make a new one """
+        twilight = TwilightTimetable.load(self._twilight_file)
+
+        site = {
+            'latitude': self.earth_location.lat.to(u.degree).value,
+            'longitude': self.earth_location.lon.to(u.degree).value,
+        }
+        horizon = self.location.get('twilight_horizon', -18 * u.degree).to(u.degree).value
+
+        if twilight is not None and twilight.matches(site, horizon) and twilight.covers(current_time()):
+            self.logger.debug("Using saved twilight timetable")
+            self._twilight = twilight
+        else:
+            self.update_twilight()
+
+    def _create_status_poller(self):
+        """ Set up the background polling of the mount status
+
+        The poll interval and the time to live of each field (in seconds) come from the
+        `status` config entry.
+        """
+        status_config = self.config.get('status', {})
+        ttl = status_config.get('ttl', {})
+
+        self.status_poller = StatusPoller(interval=status_config.get('poll_interval', 1.0))
+
+        def when_initialized(getter):
+            def get_value():
+                if self.mount.is_initialized:
+                    return getter()
+
+            return get_value
+
+        def get_current_coordinates():
+            coord = self.mount.get_current_coordinates()
+            return {
+                'current_ra': coord.ra,
+                'current_dec': coord.dec,
+                'current_ha': self.scheduler.target_hour_angle(current_time(), coord),
+            }
+
+        def get_target_coordinates():
+            if self.mount.has_target:
+                coord = self.mount.get_target_coordinates()
+                return {
+                    'mount_target_ra': coord.ra,
+                    'mount_target_dec': coord.dec,
+                    'mount_target_ha': self.scheduler.target_hour_angle(current_time(), coord),
+                }
+
+        self.status_poller.add_field('mount', when_initialized(self.mount.status), ttl=ttl.get('mount', 2))
+        self.status_poller.add_field('current_coordinates', when_initialized(get_current_coordinates),
+                                     ttl=ttl.get('current_coordinates', 2))
+        self.status_poller.add_field('target_coordinates', when_initialized(get_target_coordinates),
+                                     ttl=ttl.get('target_coordinates', 10))
+        self.status_poller.add_field('mount_time', when_initialized(lambda: self.mount.serial_query('get_local_time')),
+                                     ttl=ttl.get('mount_time', 30))
+
     def _setup_location(self):
         """
         Sets up the site and location details for the observatory
@@ -540,6 +814,23 @@ class Observatory(object):
         self.mount = mount
         self.logger.debug('Mount created')
 
+    def _create_pointing_model(self):
+        """ Give the mount a pointing model if there is `pointing.model` in the config
+
+        The model is kept in the data directory so it carries over between nights.
+        """
+        model_config = self.config.get('pointing', {}).get('model', None)
+        if not model_config:
+            return
+
+        model_file = os.path.join(self.config['directories'].get('data', '/var/panoptes/data'), 'pointing_model.json')
+
+        self.mount.pointing_model = PointingModel(self.earth_location.lat,
+                                                  model_file=model_file,
+                                                  decay=model_config.get('decay', 0.98),
+                                                  min_points=model_config.get('min_points', 5))
+        self.logger.debug("Pointing model: {}".format(model_file))
+
     def _create_cameras(self, **kwargs):
         """Creates a camera object(s)
 
@@ -625,6 +916,42 @@ class Observatory(object):
 
         self.logger.debug("Cameras created.")
 
+    def _create_guider(self):
+        """ Sets up the guider if the `guider` config entry names a guide camera
+
+        The guide camera is taken out of `cameras` so it isn't used for the visits.
+        """
+        guider_config = self.config.get('guider', {})
+        camera_name = guider_config.get('camera')
+
+        if not camera_name:
+            return
+
+        if camera_name == self._primary_camera:
+            self.logger.warning("The primary camera can't be the guide camera")
+            return
+
+        try:
+            wcs_info = get_guide_wcsinfo(guider_config)
+        except Exception as e:
+            self.logger.warning("Can't read guide camera WCS: {}".format(e))
+            wcs_info = {}
+
+        if 'cd11' not in wcs_info:
+            self.logger.warning("Guide camera needs guider.pixscale or guider.wcs_file, guiding once per exposure")
+            return
+
+        camera = self.cameras.pop(camera_name, None)
+        if camera is None:
+            self.logger.warning("No guide camera {}, guiding once per exposure".format(camera_name))
+            return
+
+        measure = CameraOffsets(camera, wcs_info,
+                                exptime=guider_config.get('exptime', 5),
+                                image_dir='{}/guide'.format(self.config['directories']['images']))
+
+        self.guider = Guider(self.mount, measure, corrections=self.corrections, config=guider_config)
+
     def _create_scheduler(self):
         """ Sets up the scheduler that will be used by the observatory """
 
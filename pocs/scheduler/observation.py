@@ -1,5 +1,6 @@
 import os.path
 import subprocess
+import time
 
 from astropy import units as u
 
@@ -9,6 +10,7 @@ from ..utils import current_time
 from ..utils import error
 from ..utils.config import load_config
 from ..utils.images import calculations
+from ..utils.images import stacking
 from ..utils.logger import get_logger
 
 
@@ -30,6 +32,11 @@ class Observation(object):
                 secondary_exptime: 300
                 secondary_filter: null
                 secondary_nexp: 3
+                stack: clipped_mean
+
+        The primary frames of an observation are co-added as they are analyzed (see
+        `add_to_stack`). The `stack` can be 'mean', 'clipped_mean' (the default) or
+        null to turn off stacking.
 
         Args:
             obs_config (dictionary): a dictionary describing the observation as read from
@@ -58,6 +65,15 @@ class Observation(object):
         else:
             self._visit_num = visit_num
 
+        # Running co-add of the visit
+        stack_method = obs_config.get('stack', 'clipped_mean')
+        if stack_method is not None:
+            self.stack = stacking.ImageStack(method=stack_method)
+        else:
+            self.stack = None
+
+        self.stack_file = None
+
         self.reset_exposures()
 
 ##################################################################################################
@@ -127,6 +143,39 @@ class Observation(object):
         self._is_exposing = False
         self._exp_num = 0
 
+        if self.stack is not None:
+            self.stack.reset()
+        self.stack_file = None
+
+        self._exposure_times = list()
+
+    def get_duty_cycle(self):
+        """ How much of the time the shutter was open during the visit
+
+        The time is counted from the start of the first exposure to the end of the readout
+        of the last one, so any time spent between exposures (readout, analysis, tracking
+        corrections) lowers the fraction.
+
+        Returns:
+            dict:   `visit_num`, number of `exposures`, `shutter_open` and `elapsed` time
+                (in seconds), `shutter_open_fraction` and the longest `gap` (in seconds)
+                between the end of one exposure and the start of the next.
+        """
+        times = self._exposure_times
+
+        shutter_open = sum(t['exptime'] for t in times)
+        elapsed = times[-1]['end'] - times[0]['start'] if times else 0.0
+        gaps = [later['start'] - earlier['end'] for earlier, later in zip(times[:-1], times[1:])]
+
+        return {
+            'visit_num': self.visit_num,
+            'exposures': len(times),
+            'shutter_open': shutter_open,
+            'elapsed': elapsed,
+            'shutter_open_fraction': shutter_open / elapsed if elapsed > 0 else 0.0,
+            'gap': max(gaps) if gaps else 0.0,
+        }
+
     def take_exposures(self, filename=None):
         """ Take the next exposure """
         try:
@@ -144,6 +193,7 @@ class Observation(object):
                 fn = '{:03.0f}_{:03.0f}.cr2'.format(self.visit_num, self.exp_num)
 
             procs = list()
+            exposure_start = time.monotonic()
 
             # Take a picture with each camera
             for cam_name, cam in self.cameras.items():
@@ -181,6 +231,12 @@ class Observation(object):
                     self.logger.debug("Still waiting for camera")
                     proc.kill()
 
+            self._exposure_times.append({
+                'exptime': exposure.exptime.to(u.s).value,
+                'start': exposure_start,
+                'end': time.monotonic(),
+            })
+
         except error.InvalidCommand as e:
             self.logger.warning("{} is already running a command.".format(cam.name))
             self._is_exposing = False
@@ -190,6 +246,50 @@ class Observation(object):
         else:
             return exposure.images
 
+    def add_to_stack(self, data, shift=(0, 0)):
+        """ Shift-and-add a frame into the co-add for this observation
+
+        The stack is written once all of the exposures have been analyzed, see
+        `write_stack`.
+
+        Args:
+            data(np.array):     Frame data.
+            shift(tuple):       Offset of the frame from the reference image, as
+                measured by `Target.get_image_offset`.
+
+        Returns:
+            tuple:  The (row, column) shift applied or None if stacking is off.
+        """
+        if self.stack is None:
+            return None
+
+        applied_shift = self.stack.add(data, shift=shift)
+        self.logger.debug("Added frame {} to stack with shift {}".format(self.stack.num_frames, applied_shift))
+
+        return applied_shift
+
+    def write_stack(self, fits_headers={}):
+        """ Write the co-add for this observation to a FITS file
+
+        Args:
+            fits_headers{dict, optional}:   Key/value headers for the fits file.
+
+        Returns:
+            str:    The filename of the stack or None if there is nothing to write.
+        """
+        if self.stack is None or self.stack.num_frames == 0:
+            return None
+
+        stack_fn = '{}/stack_{:03.0f}.fits'.format(self._images_dir, self.visit_num)
+        self.logger.debug("Writing stack of {} frames: {}".format(self.stack.num_frames, stack_fn))
+
+        try:
+            self.stack_file = self.stack.write(stack_fn, fits_headers=fits_headers)
+        except Exception as e:
+            self.logger.warning("Problem writing stack: {}".format(e))
+
+        return self.stack_file
+
     def estimate_duration(self, overhead=0 * u.s):
         """Method to estimate the duration of a single observation.
 
@@ -315,6 +415,8 @@ class Observation(object):
                 self.logger.debug("Cam {} Info {}".format(cam_name, img_info))
 
                 fits_headers['detname'] = img_info.get('camera_id', '')
+                fits_headers['visit'] = img_info.get('visit_num')
+                fits_headers['exp_num'] = img_info.get('exp_num')
 
                 kwargs['primary'] = img_info.get('is_primary', False)
                 kwargs['make_pretty'] = img_info.get('is_primary', False)
@@ -3,6 +3,7 @@ import os
 
 from astropy import units as u
 from astropy.coordinates import SkyCoord
+from astropy.io import fits
 
 from astroplan import FixedTarget
 
@@ -83,6 +84,16 @@ class Target(FixedTarget):
         self.offset_info = {}
         self._reference_image = None
 
+        # The image the `guide_wcsinfo` was solved from, set by the pointing state
+        self.pointing_image = None
+
+        # Frames get their WCS from the most recent solve plus the measured shift, see `needs_solve`
+        wcs_config = self.config.get('wcs_propagation', {})
+        self._wcs_max_shift = wcs_config.get('max_shift', 200)
+        self._wcs_max_error = wcs_config.get('max_error', 0.5)
+        self._wcs_max_residual = wcs_config.get('max_residual', 30) * u.arcsec
+        self._reset_wcs_anchor()
+
         self._done_visiting = False
 
         self._dx = []
@@ -118,6 +129,9 @@ class Target(FixedTarget):
 
         self._guide_wcsinfo = wcs_info
 
+        # The mount has moved, so measure the anchor again from this pointing, see `_get_wcs_anchor`
+        self._reset_wcs_anchor()
+
     @property
     def has_reference_image(self):
         return self._reference_image is not None
@@ -149,7 +163,7 @@ class Target(FixedTarget):
                 if first_exp:
                     self.logger.debug("First visit images: {}".format(first_exp.images))
                     for cam_name, img_info in first_exp.images.items():
-                        if img_info.get('primary', False):
+                        if img_info.get('is_primary', False):
                             self.logger.debug("Reference image: {}".format(img_info))
 
                             img_data = images.read_image_data(img_info['img_file'])
@@ -236,13 +250,29 @@ class Target(FixedTarget):
 
         self._done_visiting = False
         self._guide_wcsinfo = {}
+        self.pointing_image = None
+        self._reset_wcs_anchor()
         self._dx = []
         self._dy = []
         self._num_col = 0
         self._num_row = 0
 
-    def get_image_offset(self, exposure, with_plot=False):
-        """ Gets the offset information for the `exposure` """
+    def get_image_offset(self, exposure, with_plot=False, update=True):
+        """ Gets the offset information for the `exposure`
+
+        Args:
+            exposure(Observation.Exposure):     The exposure to measure.
+            with_plot(bool):    Add the frame to the drift plot, defaults to False. This uses
+                pyplot so only do it from the main thread.
+            update(bool):       Store the result as `offset_info`, defaults to True. Use False
+                when measuring in the background, `offset_info` belongs to the main thread.
+
+        Returns:
+            dict:   The offset information. If it couldn't be measured this is the previous
+                `offset_info`, or empty when not updating.
+        """
+        offset_info = {}
+
         d1 = self.reference_image
 
         self.logger.debug("Getting image offset from data: {}".format(type(d1)))
@@ -251,7 +281,7 @@ class Target(FixedTarget):
 
             d2 = None
             for cam_name, img_info in exposure.images.items():
-                if img_info.get('primary', False):
+                if img_info.get('is_primary', False):
                     self.logger.debug("Cropping image data: {}".format(img_info['img_file']))
                     img_data = images.read_image_data(img_info['img_file'])
                     d2 = images.crop_data(img_data, box_width=self._box_width)
@@ -259,10 +289,17 @@ class Target(FixedTarget):
 
             if d2 is not None:
                 # Do the actual phase translation
-                info = self.guide_wcsinfo
+                info = dict(self.guide_wcsinfo)
                 info['delta_time'] = exposure.exptime + (5.0 * u.second)
-                self.offset_info = images.measure_offset(d1, d2, info=info)
-                self.logger.debug("Updated offset info: {}".format(self.offset_info))
+                offset_info = images.measure_offset(d1, d2, info=info)
+                self.logger.debug("Updated offset info: {}".format(offset_info))
+
+                # Co-add the frame for the visit using the measured shift
+                if self.current_visit is not None:
+                    try:
+                        self.current_visit.add_to_stack(img_data, shift=offset_info['shift'])
+                    except Exception as e:
+                        self.logger.warning("Can't add image to stack: {}".format(e))
 
                 if with_plot:
                     try:
@@ -270,18 +307,127 @@ class Target(FixedTarget):
                     except Exception as e:
                         self.logger.warning("Can't generate drift plot: {}".format(e))
 
-            # Bookkeeping for graph
-            self.logger.debug("Bookkeeping")
-            self._num_col = self._num_col + 1
-            if self._num_col == self._max_col:
-                self._num_row = self._num_row + 1
-                self._num_col = 0
-                if self._num_row == self._max_row:
-                    plt.close(self._drift_fig)
+            if with_plot:
+                # Bookkeeping for graph
+                self.logger.debug("Bookkeeping")
+                self._num_col = self._num_col + 1
+                if self._num_col == self._max_col:
+                    self._num_row = self._num_row + 1
+                    self._num_col = 0
+                    if self._num_row == self._max_row:
+                        plt.close(self._drift_fig)
+
+        if not update:
+            return offset_info
+
+        if offset_info:
+            self.offset_info = offset_info
 
         self.logger.debug("Offset info: {}".format(self.offset_info))
         return self.offset_info
 
+    def needs_solve(self, offset_info=None):
+        """ Whether a frame needs a plate-solve or can use a propagated WCS
+
+        A frame gets its WCS from the most recent solve (at first the pointing solve) moved
+        by the measured shift (see `get_frame_wcsinfo`), so frames are usually not solved.
+        A real solve is only needed if the shift since the last solve or the registration
+        error is too large, or if the last solve showed the propagated WCS was off by more
+        than the residual limit. The limits are in the `wcs_propagation` config section.
+        Without a solve to propagate from nothing is solved, as the WCS is only a bonus.
+
+        Args:
+            offset_info(dict):  Offset information for the frame, defaults to `offset_info`.
+
+        Returns:
+            bool:   True if the frame should be solved.
+        """
+        if offset_info is None:
+            offset_info = self.offset_info
+
+        anchor = self._get_wcs_anchor()
+        if not anchor or 'shift' not in offset_info:
+            return False
+
+        shift = np.subtract(offset_info['shift'], anchor['shift'])
+
+        reasons = []
+        if np.hypot(*shift) > self._wcs_max_shift:
+            reasons.append('shift {}'.format(shift))
+        if offset_info.get('error', 0) > self._wcs_max_error:
+            reasons.append('registration error {:.02f}'.format(offset_info['error']))
+        if self._wcs_residual > self._wcs_max_residual:
+            reasons.append('residual {:.01f}'.format(self._wcs_residual))
+
+        if reasons:
+            self.logger.debug("Solving frame: {}".format(', '.join(reasons)))
+
+        return len(reasons) > 0
+
+    def get_frame_wcsinfo(self, offset_info=None):
+        """ WCS information for a frame propagated from the last solve
+
+        Args:
+            offset_info(dict):  Offset information for the frame, defaults to `offset_info`.
+
+        Returns:
+            dict:   WCS info, see `images.propagate_wcs`, or None if there is no solve to use.
+        """
+        if offset_info is None:
+            offset_info = self.offset_info
+
+        anchor = self._get_wcs_anchor()
+        if not anchor or 'shift' not in offset_info:
+            return None
+
+        shift = np.subtract(offset_info['shift'], anchor['shift'])
+
+        return images.propagate_wcs(anchor['wcs_info'], shift=shift,
+                                    rotation=offset_info.get('rotation', 0 * u.degree))
+
+    def update_frame_wcs(self, exposure, solved=False, offset_info=None):
+        """ Add WCS information to the primary image of `exposure`
+
+        If the frame was solved the solve becomes the new reference for propagation
+        and the difference from the propagated WCS is kept as the residual. Otherwise
+        the propagated WCS is written to the FITS header of the frame.
+
+        Args:
+            exposure(Observation.Exposure):     The exposure, after `get_image_offset`.
+            solved(bool):                       If the images were plate-solved.
+            offset_info(dict):  Offset information for the frame, defaults to `offset_info`.
+
+        Returns:
+            dict:   The WCS information for the frame or None.
+        """
+        for cam_name, img_info in exposure.images.items():
+            if not img_info.get('is_primary', False):
+                continue
+
+            wcs_info = None
+            if solved:
+                solved_fn = img_info.get('solved_fits_file', img_info['img_file'].replace('.cr2', '.new'))
+                if os.path.exists(solved_fn):
+                    wcs_info = images.get_wcsinfo(solved_fn)
+                    self._update_wcs_anchor(wcs_info, offset_info)
+                else:
+                    self.logger.warning("Frame did not solve, propagating WCS")
+
+            if wcs_info is None:
+                wcs_info = self.get_frame_wcsinfo(offset_info)
+
+                fits_fn = img_info['img_file'].replace('.cr2', '.fits')
+                if wcs_info is not None and os.path.exists(fits_fn):
+                    try:
+                        with fits.open(fits_fn, mode='update') as hdulist:
+                            hdulist[0].header.update(images.get_wcs_header(wcs_info))
+                    except Exception as e:
+                        self.logger.warning("Can't write WCS to {}: {}".format(fits_fn, e))
+
+            img_info['wcs_info'] = wcs_info
+
+            return wcs_info
+
     def estimate_visit_duration(self, overhead=0 * u.s):
         """Method to estimate the duration of a visit to the target.
 
@@ -404,6 +550,63 @@ class Target(FixedTarget):
     def _get_exp_image(self, img_num):
         return list(self.images.values())[img_num]
 
+    def _reset_wcs_anchor(self):
+        self._wcs_anchor = {}
+        self._wcs_residual = 0 * u.arcsec
+
+    def _get_wcs_anchor(self):
+        """ The solve the frame WCS is propagated from and its shift from the `reference_image`
+
+        The shifts of the frames are measured against the `reference_image` (the first
+        frame of the target), so the pointing solve is used with the shift of the pointing
+        image from the reference, which is measured once.
+
+        Returns:
+            dict:   With the `wcs_info` and `shift`, empty if there is nothing to propagate.
+        """
+        if self._wcs_anchor:
+            return self._wcs_anchor
+
+        if 'cd11' not in self._guide_wcsinfo or self.pointing_image is None:
+            return {}
+
+        reference = self.reference_image
+        if reference is None:
+            return {}
+
+        try:
+            img_data = images.read_image_data(self.pointing_image)
+            d2 = images.crop_data(img_data, box_width=self._box_width)
+            offset_info = images.measure_offset(reference, d2, info=dict(self._guide_wcsinfo))
+        except Exception as e:
+            self.logger.warning("Can't measure shift of pointing image, not propagating WCS: {}".format(e))
+            self.pointing_image = None
+            return {}
+
+        self.logger.debug("Pointing image shift from reference: {}".format(offset_info['shift']))
+        self._wcs_anchor = {'wcs_info': self._guide_wcsinfo, 'shift': tuple(offset_info['shift'])}
+
+        return self._wcs_anchor
+
+    def _update_wcs_anchor(self, wcs_info, offset_info=None):
+        """ Use a new solve as the reference for propagating the WCS """
+        if offset_info is None:
+            offset_info = self.offset_info
+
+        predicted = self.get_frame_wcsinfo(offset_info)
+        if predicted is not None:
+            solved_center = SkyCoord(wcs_info['ra_center'], wcs_info['dec_center'])
+            predicted_center = SkyCoord(predicted['ra_center'], predicted['dec_center'])
+
+            self._wcs_residual = solved_center.separation(predicted_center).to(u.arcsec)
+            self.logger.debug("Propagated WCS residual: {:.02f}".format(self._wcs_residual))
+
+        if 'shift' not in offset_info:
+            self.logger.debug("No shift measured for solved frame, not using it for propagation")
+            return
+
+        self._wcs_anchor = {'wcs_info': wcs_info, 'shift': tuple(offset_info['shift'])}
+
     def _get_target_position(self, wcs_file):
         """ Get the x, y coordinates for the solved WCS info for this target """
         assert os.path.exists(wcs_file), self.logger.warning("No WCS info for target")
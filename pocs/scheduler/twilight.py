@@ -0,0 +1,205 @@
+import json
+import os
+
+from warnings import warn
+
+import numpy as np
+
+from astropy import units as u
+from astropy.time import Time
+
+from ..utils import current_time
+
+
+class TwilightTimetable(object):
+
+    """ Sun set/rise and twilight times for one night
+
+    Working out whether the sun is below a given altitude needs a solar position (or a
+    rise/set search) every time. The times for a night only change once a day though, so
+    they are worked out once (see `compute`) and the checks during the night are just
+    comparisons of times.
+
+    The times are stored as unix timestamps. A time is None if the sun doesn't cross
+    that altitude during the night (e.g. no astronomical darkness at high latitudes in
+    the summer).
+
+    Args:
+        times(dict):        Unix time of each of the `events`, plus `dark_start` and
+            `dark_end` for the `horizon`.
+        horizon(float):     Altitude of the sun (degrees) below which it counts as dark.
+        location(dict):     `latitude` and `longitude` (degrees) the times are for.
+    """
+
+    events = [
+        'sunset',
+        'civil_evening',
+        'nautical_evening',
+        'astronomical_evening',
+        'astronomical_morning',
+        'nautical_morning',
+        'civil_morning',
+        'sunrise',
+    ]
+
+    def __init__(self, times, horizon=-18, location=None):
+        self.times = times
+        self.horizon = float(horizon)
+        self.location = location or {}
+
+    @classmethod
+    def compute(cls, observer, time=None, horizon=-18 * u.degree, next_night=False):
+        """ Work out the timetable for a night
+
+        Args:
+            observer(`astroplan.Observer`): Observer for the site, e.g. the scheduler.
+            time(`astropy.time.Time`):  The night that is in progress at `time` or, if it is
+                daytime, the next night. Defaults to now.
+            horizon(`astropy.units.Quantity`): Sun altitude for `dark_start` and `dark_end`,
+                defaults to -18 degrees.
+            next_night(bool):   Always the night after the next sunset, even if the sun is
+                still down at `time` (e.g. after `dark_end` but before sunrise). Defaults
+                to False.
+
+        Returns:
+            `TwilightTimetable`:    The timetable.
+        """
+        if time is None:
+            time = current_time()
+
+        # Start from the sunset before the night we're in, or the next one during the day
+        which = 'next'
+        if not next_night and observer.is_night(time, horizon=0 * u.degree):
+            which = 'previous'
+        sunset = observer.sun_set_time(time, which=which)
+
+        start = sunset - 1 * u.minute
+
+        times = {
+            'sunset': sunset,
+            'civil_evening': observer.twilight_evening_civil(start, which='next'),
+            'nautical_evening': observer.twilight_evening_nautical(start, which='next'),
+            'astronomical_evening': observer.twilight_evening_astronomical(start, which='next'),
+            'astronomical_morning': observer.twilight_morning_astronomical(start, which='next'),
+            'nautical_morning': observer.twilight_morning_nautical(start, which='next'),
+            'civil_morning': observer.twilight_morning_civil(start, which='next'),
+            'sunrise': observer.sun_rise_time(start, which='next'),
+            'dark_start': observer.sun_set_time(start, which='next', horizon=horizon),
+            'dark_end': observer.sun_rise_time(start, which='next', horizon=horizon),
+        }
+
+        # The morning events after sunrise are for the next night
+        sunrise = times['sunrise']
+        for name, event_time in times.items():
+            if not _is_valid(event_time) or (event_time > sunrise + 1 * u.minute):
+                times[name] = None
+            else:
+                times[name] = float(event_time.unix)
+
+        location = {
+            'latitude': float(observer.location.lat.to(u.degree).value),
+            'longitude': float(observer.location.lon.to(u.degree).value),
+        }
+
+        return cls(times, horizon=horizon.to(u.degree).value, location=location)
+
+    @property
+    def start(self):
+        """ `astropy.time.Time` of the sunset """
+        return self.get_time('sunset')
+
+    @property
+    def end(self):
+        """ `astropy.time.Time` of the sunrise """
+        return self.get_time('sunrise')
+
+    def get_time(self, name):
+        """ The time of an event as an `astropy.time.Time`, None if it doesn't happen """
+        value = self.times.get(name)
+        return Time(value, format='unix') if value is not None else None
+
+    def covers(self, time):
+        """ Whether `time` is before the end (sunrise) of the night """
+        end = self.times.get('sunrise')
+
+        return end is not None and _unix(time) < end
+
+    def is_dark(self, time=None):
+        """ Whether the sun is below `horizon` at `time` (default now) """
+        start = self.times.get('dark_start')
+        end = self.times.get('dark_end')
+
+        if start is None or end is None:
+            return False
+
+        return start <= _unix(time) < end
+
+    def is_night(self, time=None):
+        """ Whether the sun is set at `time` (default now) """
+        start = self.times.get('sunset')
+        end = self.times.get('sunrise')
+
+        if start is None or end is None:
+            return False
+
+        return start <= _unix(time) < end
+
+    def time_until_dark(self, time=None):
+        """ Seconds until `dark_start`, 0 if it is dark and None if it doesn't get dark """
+        start = self.times.get('dark_start')
+        if start is None:
+            return None
+
+        return max(start - _unix(time), 0)
+
+    def matches(self, location, horizon):
+        """ Whether the timetable is for the given site and darkness horizon """
+        same_site = all(np.isclose(self.location.get(k, np.nan), location[k]) for k in ['latitude', 'longitude'])
+
+        return same_site and np.isclose(self.horizon, float(horizon))
+
+    def to_dict(self):
+        return {
+            'times': self.times,
+            'horizon': self.horizon,
+            'location': self.location,
+        }
+
+    def save(self, fname):
+        """ Write the timetable to a JSON file """
+        try:
+            tmp_file = '{}.tmp'.format(fname)
+            with open(tmp_file, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            os.replace(tmp_file, fname)
+        except OSError as e:
+            warn("Can't save twilight timetable: {}".format(e))
+
+    @classmethod
+    def load(cls, fname):
+        """ Read a timetable written with `save`, None if there isn't a valid one """
+        try:
+            with open(fname, 'r') as f:
+                info = json.load(f)
+
+            return cls(info['times'], horizon=info['horizon'], location=info['location'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def __str__(self):
+        return ', '.join('{}: {}'.format(name, self.get_time(name).isot if self.times.get(name) else None)
+                         for name in self.events)
+
+
+def _unix(time):
+    if time is None:
+        time = current_time()
+
+    return float(time.unix)
+
+
+def _is_valid(time):
+    try:
+        return time is not None and not np.ma.is_masked(time.jd) and np.isfinite(time.jd)
+    except Exception:
+        return False
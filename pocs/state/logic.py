@@ -1,12 +1,11 @@
-import os
-import time
-
 from astropy import units as u
 from astropy.time import Time
 
 from ..utils import current_time
 from ..utils import error
 from ..utils import listify
+from ..utils.watcher import FileWatcher
+from ..utils.weather import WeatherCache
 
 
 class PanStateLogic(object):
@@ -19,6 +18,7 @@ class PanStateLogic(object):
         self._sleep_delay = kwargs.get('sleep_delay', 2.5)  # Loop delay
         self._safe_delay = kwargs.get('safe_delay', 60 * 5)  # Safety check delay
         self._is_safe = False
+        self._weather_cache = None
 
         # This should all move to the `states.pointing` module or somewhere else
         point_config = self.config.get('pointing', {})
@@ -27,6 +27,11 @@ class PanStateLogic(object):
         self._pointing_threshold = point_config.get('threshold', 0.01) * u.deg
         self._pointing_iteration = 0
 
+        # Solve a binned guide image first, see `pocs.utils.images.quick_solve`
+        self._pointing_quick = point_config.get('quick', {})
+        if self._pointing_quick:
+            self._pointing_exptime = self._pointing_quick.get('exptime', 10) * u.s
+
 
 ##################################################################################################
 # State Conditions
@@ -123,9 +128,26 @@ class PanStateLogic(object):
         self.logger.debug("Dark: {}".format(is_dark))
         return is_dark
 
+    @property
+    def weather_cache(self):
+        """ `pocs.utils.weather.WeatherCache` following the latest weather record
+
+        Created (and started) the first time it is used.
+        """
+        if self._weather_cache is None:
+            weather_config = self.config.get('weather', {})
+            self._weather_cache = WeatherCache(self.db, poll_interval=weather_config.get('poll_interval', 30))
+            self._weather_cache.add_listener(self._loop.post)
+            self._weather_cache.start()
+
+        return self._weather_cache
+
     def is_weather_safe(self, stale=180):
         """ Determines whether current weather conditions are safe or not
 
+        The latest weather record is kept in memory by `weather_cache`, so this doesn't query
+        the database.
+
         Args:
             stale(int): If reading is older than `stale` seconds, return False. Default 180 (seconds).
 
@@ -141,7 +163,7 @@ class PanStateLogic(object):
         self.logger.debug("Weather Safety:")
 
         try:
-            record = self.db.current.find_one({'type': 'weather'})
+            record = self.weather_cache.get_record()
 
             is_safe = record['data'].get('safe', False)
             self.logger.debug("\t is_safe: {}".format(is_safe))
@@ -188,10 +210,11 @@ class PanStateLogic(object):
     def sleep(self, delay=2.5, with_status=True):
         """ Send POCS to sleep
 
-        This just loops for `delay` number of seconds.
+        This runs the event loop for `delay` number of seconds, so command messages are
+        still handled. The sleep ends early if a command arrives.
 
         Keyword Arguments:
-            delay {float} -- Number of seconds to sleep (default: 2.5)
+            delay {float} -- Number of seconds to sleep, None for `sleep_delay` (default: 2.5)
             with_status {bool} -- Show system status while sleeping (default: {True if delay > 2.0})
         """
         if delay is None:
@@ -200,10 +223,53 @@ class PanStateLogic(object):
         if with_status and delay > 2.0:
             self.status()
 
-        time.sleep(delay)
+        commands = []
+
+        def got_command(name, msg):
+            commands.append(msg)
+
+        self._loop.on('command', got_command)
+        try:
+            self._loop.run_until(lambda: len(commands) > 0, timeout=delay)
+        finally:
+            self._loop.off('command', got_command)
+
+    def wait_until(self, condition, timeout=None, interval=None, with_status=False):
+        """ Wait until `condition()` is true
+
+        The event loop is run while waiting and `condition` is checked whenever anything
+        happens on the loop (e.g. a command message or an event posted by a device) and at
+        least every `interval` seconds, so there is no fixed delay between the condition
+        becoming true and returning.
+
+        Args:
+            condition:          Callable returning a bool.
+            timeout(float):     Seconds to wait, defaults to None (wait forever).
+            interval(float):    Longest time between checks of `condition` in seconds, defaults
+                to `sleep_delay`.
+            with_status(bool):  Update the status (which e.g. refreshes the mount state) before
+                each check, defaults to False.
+
+        Returns:
+            bool:   True if `condition` became true, False on timeout.
+        """
+        if interval is None:
+            interval = self._sleep_delay
+
+        def check():
+            if with_status:
+                self.status()
+            return condition()
+
+        return self._loop.run_until(check, timeout=timeout, interval=interval)
 
     def wait_until_files_exist(self, filenames, transition=None, callback=None, timeout=150):
-        """ Loop to wait for the existence of files on the system """
+        """ Wait for files to be written
+
+        The directories are watched with inotify (see `pocs.utils.watcher.FileWatcher`) so
+        this returns as soon as the files have been closed after writing, falling back to
+        checking the files every `poll_interval`.
+        """
         assert filenames, self.logger.error("Filename(s) required for loop")
 
         filenames = listify(filenames)
@@ -211,24 +277,26 @@ class PanStateLogic(object):
 
         _files_exist = False
 
-        # Check if all files exist
-        exist = [os.path.exists(f) for f in filenames]
-
         if type(timeout) is not u.Quantity:
             timeout = timeout * u.second
 
         end_time = Time.now() + timeout
         self.logger.debug("Timeout for files: {}".format(end_time))
 
-        while not all(exist):
-            if Time.now() > end_time:
-                # TODO Interrupt the camera properly
+        with FileWatcher(filenames) as watcher:
+            if watcher.uses_inotify:
+                self._loop.add_reader(watcher.fileno(), watcher.read_events)
 
-                raise error.Timeout("Timeout while waiting for files")
-                break
+            try:
+                written = self.wait_until(watcher.all_written, timeout=timeout.to(u.second).value,
+                                          interval=watcher.poll_interval)
+            finally:
+                if watcher.uses_inotify:
+                    self._loop.remove_reader(watcher.fileno())
 
-            self.sleep()
-            exist = [os.path.exists(f) for f in filenames]
+        if not written:
+            # TODO Interrupt the camera properly
+            raise error.Timeout("Timeout while waiting for files")
         else:
             self.logger.debug("All files exist, now exiting loop")
             _files_exist = True
@@ -256,8 +324,7 @@ class PanStateLogic(object):
         blocking until then.
         """
         if 'weather' not in self.config['simulator']:
-            while not self.is_safe():
-                self.sleep(delay=60)
+            self.wait_until(self.is_safe, interval=60)
         else:
             self.logger.debug("Weather simulator on, return safe")
 
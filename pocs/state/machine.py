@@ -1,7 +1,9 @@
 import os
+import threading
 import yaml
 import zmq
 
+from concurrent.futures import ThreadPoolExecutor
 from json import loads
 from transitions import Machine
 from transitions import State
@@ -11,6 +13,7 @@ from ..utils import error
 from ..utils import listify
 from ..utils import load_module
 from ..utils.database import PanMongo
+from ..utils.events import EventLoop
 
 
 class PanStateMachine(GraphMachine, Machine):
@@ -35,6 +38,10 @@ class PanStateMachine(GraphMachine, Machine):
         if not hasattr(self, 'db') or self.db is None:
             self.db = PanMongo()
 
+        # Everything waits on the event loop rather than sleeping
+        if not hasattr(self, '_loop') or self._loop is None:
+            self._loop = EventLoop()
+
         self._state_table_name = state_machine_table.get('name', 'default')
 
         # Setup Transitions
@@ -55,9 +62,31 @@ class PanStateMachine(GraphMachine, Machine):
 
         self._state_machine_table = state_machine_table
         self._next_state = None
+        self._interrupt = None
         self._keep_running = False
         self._do_states = True
 
+        # State diagrams are drawn in the background, see `render_state_graphs`
+        self._graph_render = self.config.get('state_graphs', {}).get('render', 'startup')
+        self._graph_lock = threading.Lock()
+        self._graph_pending = set()
+        self._graph_current = None
+        self._graph_executor = None
+        self._graph_template = None
+
+        if self._graph_render:
+            try:
+                self._graph_template = self.graph.copy()
+                self._graph_styles = self.graph.style_attributes
+            except Exception as e:
+                self.logger.warning("Can't set up state graphs, not drawing them: {}".format(e))
+                self._graph_render = False
+            else:
+                self._graph_executor = ThreadPoolExecutor(max_workers=1)
+
+            if self._graph_render == 'startup':
+                self.render_state_graphs()
+
         self.logger.debug("State machine created")
 
 ##################################################################################################
@@ -72,6 +101,11 @@ class PanStateMachine(GraphMachine, Machine):
     def do_states(self):
         return self._do_states
 
+    @property
+    def event_loop(self):
+        """ `pocs.utils.events.EventLoop` the machine waits on """
+        return self._loop
+
     @property
     def next_state(self):
         return self._next_state
@@ -90,6 +124,10 @@ class PanStateMachine(GraphMachine, Machine):
 
         This runs the state machine in a loop. Setting the machine proprety
         `is_running` to False will stop the loop.
+
+        The machine moves to the next state as soon as the previous transition has finished.
+        Between transitions (and while waiting inside a state, see `sleep` and `wait_until`)
+        it waits on the `event_loop`, so command messages are handled as soon as they arrive.
         """
         self._keep_running = True
 
@@ -98,19 +136,17 @@ class PanStateMachine(GraphMachine, Machine):
 
         _loop_iteration = 0
 
-        poller = zmq.Poller()
-        poller.register(self.cmd_subscriber.subscriber, zmq.POLLIN)
+        self._loop.add_reader(self.cmd_subscriber.subscriber, self._receive_command)
 
         while self.keep_running:
             # Send heartbeat
             # self.send_message('--heartbeat--')
 
-            # Check for any incoming messages between states
-            sockets = dict(poller.poll(500))  # 500 ms
-            if self.cmd_subscriber.subscriber in sockets and sockets[self.cmd_subscriber.subscriber] == zmq.POLLIN:
-                self.logger.info("Command message received")
-                msg_type, msg = self.cmd_subscriber.subscriber.recv_string(flags=zmq.NOBLOCK).split(' ', maxsplit=1)
-                self.cmd_handler(loads(msg))
+            # Handle any messages that arrived during the last state, without waiting
+            self._loop.run_once(timeout=0)
+
+            # A command received during the last state wins over the `next_state` it set
+            self._apply_interrupt()
 
             # If we are processing the states
             if self.do_states:
@@ -124,6 +160,7 @@ class PanStateMachine(GraphMachine, Machine):
                     self.logger.warning("No valid state given, parking")
                     caller = self.park
 
+                state_changed = False
                 try:
                     state_changed = caller()
                 except KeyboardInterrupt:
@@ -145,8 +182,36 @@ class PanStateMachine(GraphMachine, Machine):
                 if 'all' in self.config['simulator']:
                     self.sleep(5)
 
-            else:
-                self.sleep(1)
+            elif self.keep_running:
+                # Nothing to do until a command (or other event) arrives
+                self._loop.run_once()
+
+        self._loop.remove_reader(self.cmd_subscriber.subscriber)
+
+    def render_state_graphs(self):
+        """ Draw the state diagram for every transition in the background
+
+        Each transition has its own diagram (with the destination state highlighted), which
+        is drawn once and kept in `$PANDIR/images/state_images`. On each transition the
+        `$PANDIR/images/state.svg` link is then pointed at the right diagram.
+
+        This is done at startup unless the `state_graphs.render` config entry is 'background',
+        in which case each diagram is only drawn (in the background) the first time it is
+        needed, which suits large custom state tables. Setting it to False turns the diagrams off.
+        """
+        if not self._graph_render:
+            return
+
+        for transition in self._state_machine_table['transitions']:
+            self._submit_state_graph(transition['trigger'], transition['dest'])
+
+    def stop_machine(self):
+        """ Stop the state machine loop
+
+        Can be called from any thread, the loop stops after the current transition.
+        """
+        self._keep_running = False
+        self._loop.wake()
 
     def cmd_handler(self, msg_obj):
         """ Handles incomding commands from remote sources
@@ -154,6 +219,10 @@ class PanStateMachine(GraphMachine, Machine):
         Typically this will be the POCS_shell but could also be PAWS in the future.
         These messages arrive via 0MQ and are processed during each iteration of
         the event loop.
+
+        Commands can arrive while a state is waiting (see `sleep` and `wait_until`), and the
+        state sets `next_state` when it is done, so the state a command asks for is kept
+        aside and only applied by `run` once the current state has returned.
         """
         self.logger.info("Incoming command message: {}".format(msg_obj))
 
@@ -166,12 +235,15 @@ class PanStateMachine(GraphMachine, Machine):
 
         if cmd == 'run':
             self.logger.info("Starting loop from pocs_shell")
-            self.next_state = 'ready'
+            self._interrupt = 'ready'
             self._do_states = True
 
         if cmd == 'park':
             if self.state not in ['parked', 'parking', 'sleeping', 'housekeeping']:
-                self.next_state = 'parking'
+                self._interrupt = 'parking'
+
+        # Let anything waiting inside a state know about the command
+        self._loop.post('command', msg_obj)
 
 
 ##################################################################################################
@@ -240,6 +312,28 @@ class PanStateMachine(GraphMachine, Machine):
 # Private Methods
 ##################################################################################################
 
+    def _receive_command(self, socket):
+        """ Read a message from the subscriber and handle it """
+        self.logger.info("Command message received")
+        try:
+            msg_type, msg = socket.recv_string(flags=zmq.NOBLOCK).split(' ', maxsplit=1)
+        except zmq.Again:
+            return
+
+        if msg_type == 'WEATHER':
+            # Weather readings pushed over the bus go straight to the cache
+            self.weather_cache.update(loads(msg))
+            return
+
+        self.cmd_handler(loads(msg))
+
+    def _apply_interrupt(self):
+        """ Move to the state asked for by the last command, if any """
+        if self._interrupt is not None:
+            self.logger.info("Command overrides next state: {}".format(self._interrupt))
+            self.next_state = self._interrupt
+            self._interrupt = None
+
     def _lookup_trigger(self):
         self.logger.debug("Source: {}\t Dest: {}".format(self.state, self.next_state))
         for state_info in self._state_machine_table['transitions']:
@@ -250,26 +344,89 @@ class PanStateMachine(GraphMachine, Machine):
         return 'parking'
 
     def _update_graph(self, event_data):
-        model = event_data.model
+        """ Point the state image link at the diagram for this transition
+
+        If the diagram hasn't been drawn yet it is drawn in the background and linked
+        when done, so this never waits for Graphviz.
+        """
+        if not self._graph_render:
+            return
+
+        try:
+            fn = self._get_state_graph_file(event_data.event.name, event_data.state.name)
+            self._graph_current = fn
+
+            if os.path.exists(fn):
+                self._link_state_graph(fn)
+            else:
+                self._submit_state_graph(event_data.event.name, event_data.state.name)
+
+        except Exception as e:
+            self.logger.warning("Can't generate state graph: {}".format(e))
+
+    def _get_state_graph_file(self, event_name, state_name):
+        state_id = 'state_{}_{}'.format(event_name, state_name)
+        image_dir = os.getenv('PANDIR', default='/var/panoptes/')
 
+        return '{}/images/state_images/{}.svg'.format(image_dir, state_id)
+
+    def _submit_state_graph(self, event_name, state_name):
+        fn = self._get_state_graph_file(event_name, state_name)
+
+        with self._graph_lock:
+            if fn in self._graph_pending or os.path.exists(fn):
+                return
+
+            self._graph_pending.add(fn)
+
+        self._graph_executor.submit(self._draw_state_graph, event_name, state_name, fn)
+
+    def _draw_state_graph(self, event_name, state_name, fn):
+        """ Draw the diagram for a transition (runs in the background) """
         try:
-            state_id = 'state_{}_{}'.format(event_data.event.name, event_data.state.name)
-            image_dir = os.getenv('PANDIR', default='/var/panoptes/')
-            fn = '{}/images/state_images/{}.svg'.format(image_dir, state_id)
-            ln_fn = '{}/images/state.svg'.format(image_dir)
+            graph = self._graph_template.copy()
+
+            for node in graph.nodes_iter():
+                node.attr.update(self._graph_styles['node']['default'])
 
-            # Only make the file once
-            if not os.path.exists(fn):
-                model.graph.draw(fn, prog='dot')
+            for edge in graph.edges_iter():
+                edge.attr.update(self._graph_styles['edge']['default'])
 
-            # Link current image
-            if os.path.exists(ln_fn):
-                os.remove(ln_fn)
+                # The label is the trigger (several are joined with '|')
+                triggers = [label.strip().split(' ')[0] for label in edge.attr.get('label', '').split('|')]
+                if edge[1] == state_name and event_name in triggers:
+                    edge.attr.update(self._graph_styles['edge']['previous'])
 
-            os.symlink(fn, ln_fn)
+            if graph.has_node(state_name):
+                graph.get_node(state_name).attr.update(self._graph_styles['node']['active'])
+
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+
+            tmp_fn = '{}.tmp'.format(fn)
+            graph.draw(tmp_fn, format='svg', prog='dot')
+            os.replace(tmp_fn, fn)
+
+            # Link it if the machine is (still) in this state
+            if self._graph_current == fn:
+                self._link_state_graph(fn)
 
         except Exception as e:
             self.logger.warning("Can't generate state graph: {}".format(e))
+        finally:
+            with self._graph_lock:
+                self._graph_pending.discard(fn)
+
+    def _link_state_graph(self, fn):
+        """ Point `$PANDIR/images/state.svg` at `fn`, replacing the old link in one step """
+        image_dir = os.getenv('PANDIR', default='/var/panoptes/')
+        ln_fn = '{}/images/state.svg'.format(image_dir)
+
+        tmp_ln_fn = '{}.tmp'.format(ln_fn)
+        if os.path.lexists(tmp_ln_fn):
+            os.remove(tmp_ln_fn)
+
+        os.symlink(fn, tmp_ln_fn)
+        os.replace(tmp_ln_fn, ln_fn)
 
     def _update_status(self, event_data):
         self.status()
@@ -8,12 +8,26 @@ def on_enter(event_data):
         target = pocs.observatory.current_target
         pocs.logger.debug("For analyzing: Target: {}".format(target))
 
-        image_info = pocs.observatory.analyze_recent()
+        if pocs.observatory.pipeline:
+            # The exposures were analyzed while observing, wait for the last ones
+            image_info = pocs.observatory.apply_corrections(wait=True)
+        else:
+            image_info = pocs.observatory.analyze_recent()
         # TODO: Handle Quantity correctly
         # pocs.db.insert_current('images', image_info)
 
         pocs.logger.debug("Image information: {}".format(image_info))
 
+        if target.current_visit.done_exposing:
+            # All of the frames have been added to the stack by now
+            if target.current_visit.stack_file is None:
+                target.current_visit.write_stack()
+
+            duty_cycle = target.current_visit.get_duty_cycle()
+            pocs.logger.info("Visit {visit_num}: shutter open {shutter_open:.0f} s of {elapsed:.0f} s "
+                             "({shutter_open_fraction:.1%}), longest gap {gap:.1f} s".format(**duty_cycle))
+            pocs.db.insert_current('visits', duty_cycle)
+
         if target.current_visit.done_exposing and target.done_visiting:
             # We have successfully analyzed this visit, so we go to next
             pocs.next_state = 'scheduling'
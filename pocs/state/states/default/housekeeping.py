@@ -3,8 +3,16 @@ def on_enter(event_data):
     pocs = event_data.model
     pocs.say("Recording all the data for the night (not really yet! TODO!!!).")
 
+    is_dark = pocs.is_dark()
+
+    # Work out the times for the coming night once, rather than on every safety check. This
+    # is usually after `dark_end` but before sunrise, so the night that is ending would
+    # otherwise be worked out again.
+    if not is_dark:
+        pocs.observatory.update_twilight(next_night=True)
+
     # Assume dark (we still check weather)
-    if pocs.is_dark():
+    if is_dark:
         # Assume bad weather so wait in ready state
         if not pocs.is_safe():
             pocs.next_state = 'ready'
@@ -2,12 +2,25 @@ from ....utils import error
 
 
 def on_enter(event_data):
-    """ """
+    """ Take the next exposure
+
+    When observing is pipelined (the `observing.pipeline` config entry) the exposure is
+    analyzed in the background while the next one is taken, so this state repeats until
+    the visit is done. Tracking corrections from the analysis are applied here, before
+    the exposure starts.
+    """
     pocs = event_data.model
     pocs.say("I'm finding exoplanets!")
 
+    observatory = pocs.observatory
+
     try:
-        pocs.observatory.observe()
+        if observatory.pipeline:
+            # Safe point between exposures
+            observatory.apply_corrections()
+            pocs.wait_until(lambda: not observatory.corrections.is_busy, timeout=60)
+
+        images = observatory.observe()
 
         # imgs_info = pocs.observatory.observe()
         # img_files = [info['img_file'] for cam_name, info in imgs_info.items()]
@@ -20,7 +33,15 @@ def on_enter(event_data):
     else:
         # Wait for files to exist to finish to set up processing
         try:
-            pocs.next_state = 'analyzing'
+            if observatory.pipeline and images:
+                observatory.start_analysis()
+
+                if observatory.current_target.current_visit.done_exposing:
+                    pocs.next_state = 'analyzing'
+                else:
+                    pocs.next_state = 'observing'
+            else:
+                pocs.next_state = 'analyzing'
         except error.Timeout as e:
             pocs.logger.warning("Timeout while waiting for images. Something wrong with camera, going to park.")
             pocs.next_state = 'parking'
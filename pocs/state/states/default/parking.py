@@ -3,10 +3,10 @@ def on_enter(event_data):
     pocs = event_data.model
     try:
         pocs.say("I'm takin' it on home and then parking.")
+        pocs.observatory.stop_guiding()
         pocs.observatory.mount.home_and_park()
 
-        while not pocs.observatory.mount.is_parked:
-            pocs.sleep()
+        pocs.wait_until(lambda: pocs.observatory.mount.is_parked, interval=1, with_status=True)
 
         # The mount is currently not parking in correct position so we manually move it there.
         pocs.observatory.mount.unpark()
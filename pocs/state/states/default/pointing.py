@@ -11,15 +11,18 @@ from ....utils import images
 def on_enter(event_data):
     """ Adjust pointing.
 
-    * Take 60 second exposure
+    * Take 30 second exposure (10 seconds with a quick solve)
     * Call `sync_coordinates`
-        * Plate-solve
+        * Plate-solve (a binned copy first with `pointing.quick` in the config)
         * Get pointing error
         * If within `_pointing_threshold`
             * goto tracking
+        * Else, if the pointing model is used for the target
+            * take the error left by the model off as well
+            * slew to target
         * Else
             * set set mount target coords to center RA/Dec
-            * sync mount coords
+            * sync mount coords (and the pointing model)
             * slew to target
     """
     pocs = event_data.model
@@ -62,6 +65,10 @@ def sync_coordinates(pocs, fname):
     threshold, sync the coordinates to the center and reacquire the target.
     Iterate on process until threshold is met then start tracking.
 
+    With `pointing.quick` in the config a binned copy of the image is solved first
+    (see `pocs.utils.images.quick_solve`), the full image is only processed and
+    solved if that fails.
+
     Parameters
     ----------
     pocs   : {pocsoptes}
@@ -91,15 +98,43 @@ def sync_coordinates(pocs, fname):
     kwargs['ra'] = target.ra.value
     kwargs['dec'] = target.dec.value
     kwargs['radius'] = 15.0
+    kwargs['priority'] = 'critical'
+
+    wcs_info = {}
+    quick_config = pocs._pointing_quick
+
+    if quick_config:
+        wcs_info = images.quick_solve(fname,
+                                      ra=kwargs['ra'],
+                                      dec=kwargs['dec'],
+                                      radius=quick_config.get('radius', 2.0),
+                                      binning=quick_config.get('binning', 4),
+                                      box_width=quick_config.get('box_width', None),
+                                      timeout=quick_config.get('timeout', 10),
+                                      camera_id=pocs.observatory.primary_camera.uid,
+                                      fits_headers=fits_headers)
+
+        if wcs_info:
+            pocs.logger.debug("Quick solve of guide image: {}".format(wcs_info))
+
+            # Save guide wcsinfo to use for future solves
+            target.pointing_image = fname
+            target.guide_wcsinfo = wcs_info
+
+            target = SkyCoord(ra=kwargs['ra'] * u.degree, dec=kwargs['dec'] * u.degree)
+        else:
+            pocs.logger.debug("Quick solve failed, solving full guide image")
 
-    pocs.logger.debug("Processing CR2 files with kwargs: {}".format(kwargs))
-    processed_info = images.process_cr2(fname, fits_headers=fits_headers, timeout=45, **kwargs)
-    # pocs.logger.debug("Processed info: {}".format(processed_info))
+    fits_fname = None
+    if not wcs_info:
+        pocs.logger.debug("Processing CR2 files with kwargs: {}".format(kwargs))
+        processed_info = images.process_cr2(fname, fits_headers=fits_headers, timeout=45, **kwargs)
+        # pocs.logger.debug("Processed info: {}".format(processed_info))
 
-    # Use the solve file
-    fits_fname = processed_info.get('solved_fits_file', None)
+        # Use the solve file
+        fits_fname = processed_info.get('solved_fits_file', None)
 
-    if os.path.exists(fits_fname):
+    if fits_fname is not None and os.path.exists(fits_fname):
         pocs.logger.debug("Solved guide file: {}".format(fits_fname))
         # Get the WCS info and the HEADER info
         pocs.logger.debug("Getting WCS and FITS headers for: {}".format(fits_fname))
@@ -107,6 +142,7 @@ def sync_coordinates(pocs, fname):
         wcs_info = images.get_wcsinfo(fits_fname)
 
         # Save guide wcsinfo to use for future solves
+        target.pointing_image = fname
         target.guide_wcsinfo = wcs_info
         pocs.logger.debug("WCS Info: {}".format(target.guide_wcsinfo))
 
@@ -118,6 +154,7 @@ def sync_coordinates(pocs, fname):
             target = SkyCoord(ra=float(hdu.header['RA']) * u.degree, dec=float(hdu.header['Dec']) * u.degree)
             pocs.logger.debug("Target coords: {}".format(target))
 
+    if wcs_info:
         # Create two coordinates
         center = SkyCoord(ra=wcs_info['ra_center'], dec=wcs_info['dec_center'])
         pocs.logger.debug("Center coords: {}".format(center))
@@ -126,6 +163,14 @@ def sync_coordinates(pocs, fname):
             separation = center.separation(target)
 
         pocs.logger.debug("Solved separation: {}".format(separation))
+
+        # Only the first solve after the slew is a point for the pointing model, later ones
+        # are after a sync or an extra offset (see below)
+        if pocs._pointing_iteration == 0:
+            try:
+                pocs.observatory.mount.add_pointing(center)
+            except Exception as e:
+                pocs.logger.warning("Can't add point to pointing model: {}".format(e))
     else:
         pocs.logger.warning("Could not solve guide image")
 
@@ -142,14 +187,24 @@ def sync_coordinates(pocs, fname):
 
         pocs._pointing_iteration = pocs._pointing_iteration + 1
 
-        # Tell the mount we are at the target, which is the center
-        pocs.say("Syncing with the latest image...")
-        has_target = pocs.observatory.mount.set_target_coordinates(center)
-        pocs.observatory.mount.serial_query('calibrate_mount')
+        mount = pocs.observatory.mount
 
-        # Now set back to target
-        if has_target:
-            if target is not None:
-                pocs.observatory.mount.set_target_coordinates(target)
+        if mount.has_pointing_model():
+            # A sync would move the zero point the model was fitted with, so slew again with
+            # what the model left taken off as well
+            pocs.say("Correcting the slew with the latest image...")
+            mount.offset_pointing(center)
+            mount.set_target_coordinates(mount.get_target_coordinates())
+        else:
+            # Tell the mount we are at the target, which is the center
+            pocs.say("Syncing with the latest image...")
+            mount.sync_pointing(center)
+            has_target = mount.set_target_coordinates(center, apply_model=False)
+            mount.serial_query('calibrate_mount')
+
+            # Now set back to target
+            if has_target:
+                if target is not None:
+                    mount.set_target_coordinates(target)
 
         pocs.next_state = 'slewing'
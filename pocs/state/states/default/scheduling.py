@@ -10,6 +10,9 @@ def on_enter(event_data):
     pocs = event_data.model
     pocs.say("Ok, I'm finding something good to look at...")
 
+    # Stop guiding before we move
+    pocs.observatory.stop_guiding()
+
     # Get the next target
     try:
         target = pocs.observatory.get_target()
@@ -23,6 +26,9 @@ def on_enter(event_data):
         pocs.logger.debug("Setting Target coords: {}".format(target))
         has_target = pocs.observatory.mount.set_target_coordinates(target)
 
+        # New slew so start checking the pointing again
+        pocs._pointing_iteration = 0
+
         # target_ha = pocs.observatory.scheduler.target_hour_angle(current_time(), target)
 
     else:
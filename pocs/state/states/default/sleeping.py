@@ -5,6 +5,10 @@ def on_enter(event_data):
     pocs.say("Another successful night!")
     pocs.say("ZZzzzz...")
 
+    dark_start = pocs.observatory.twilight.get_time('dark_start')
+    if dark_start is not None:
+        pocs.say("It gets dark again at {}".format(dark_start.isot))
+
     pocs.next_state = 'ready'
 
     # Wait until next night or shutdown
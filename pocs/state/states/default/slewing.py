@@ -10,9 +10,8 @@ def on_enter(event_data):
         # Wait until mount is_tracking, then transition to track state
         pocs.say("I'm slewing over to the coordinates to track the target.")
 
-        while not pocs.observatory.mount.is_tracking:
-            pocs.logger.debug("Slewing to target")
-            pocs.sleep()
+        pocs.logger.debug("Slewing to target")
+        pocs.wait_until(lambda: pocs.observatory.mount.is_tracking, interval=1, with_status=True)
 
         pocs.say("I'm at the target, checking pointing.")
         pocs.next_state = 'pointing'
@@ -6,6 +6,16 @@ def on_enter(event_data):
     try:
         pocs.say("I'm adjusting the tracking rate")
         pocs.observatory.update_tracking()
+
+        # Handle commands while the guide pulses run
+        corrections = pocs.observatory.corrections
+        if not pocs.wait_until(lambda: not corrections.is_busy, timeout=60):
+            pocs.logger.warning("Tracking adjustment still running: {}".format(corrections.get_remaining()))
+
+        # Keep correcting the tracking during the exposures if there is a guide camera
+        if pocs.observatory.start_guiding():
+            pocs.say("Guiding on the target")
+
         pocs.say("Done with tracking adjustment, going to observe")
         pocs.next_state = 'observing'
 
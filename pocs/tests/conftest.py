@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+import yaml
+
+from astropy import units as u
+from astropy.coordinates import EarthLocation
+
+from pocs.mount.emulator import IOptronEmulator
+from pocs.mount.ioptron import Mount
+
+collect_ignore = []
+
+# `pocs.mount.async_serial` uses async/await, which needs Python 3.5
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_async_serial.py')
+
+ioptron_commands = os.path.join(os.getenv('POCS', '.'), 'resources', 'conf_files', 'mounts', 'ioptron.yaml')
+
+
+@pytest.fixture
+def emulator():
+    """ An `IOptronEmulator` on a pseudo-terminal """
+    emulator = IOptronEmulator(commands_file=ioptron_commands, slew_rate=90.0)
+    emulator.start()
+
+    yield emulator
+
+    emulator.stop()
+
+
+@pytest.fixture
+def mount(emulator):
+    """ An iOptron `Mount` connected to the `emulator` """
+    with open(ioptron_commands, 'r') as f:
+        commands = yaml.safe_load(f.read())
+
+    location = EarthLocation(lat=19.54 * u.degree, lon=-155.58 * u.degree, height=3400 * u.meter)
+    mount = Mount({'port': emulator.port, 'model': 30, 'utc_offset': '-10.00'}, location, commands=commands)
+    mount.initialize()
+
+    yield mount
+
+    mount.serial.ser.close()
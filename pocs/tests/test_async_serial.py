@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+from pocs.mount.async_serial import AsyncMount
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_transaction(emulator, mount):
+    async def queries():
+        async_mount = AsyncMount(mount)
+        return await asyncio.gather(async_mount.transaction('get_status', ('set_ra', '00000000')),
+                                    async_mount.query('get_guide_rate'))
+
+    (status, ok), guide_rate = run(queries())
+
+    assert status == emulator.handle(':GAS#').rstrip('#')
+    assert ok == 1
+    assert guide_rate == '090'
+
+
+def test_slew_awaits_status(emulator, mount):
+    ra, dec = emulator.get_position()
+    target = SkyCoord(ra=(ra + 20) * u.degree, dec=20 * u.degree)
+
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def slew():
+        async_mount = AsyncMount(mount, poll_interval=0.05)
+        tick_task = asyncio.ensure_future(ticker())
+        try:
+            return await async_mount.slew_to_coordinates(target, timeout=10)
+        finally:
+            tick_task.cancel()
+
+    assert run(slew())
+    assert 'Tracking' in mount._state
+    assert mount._current_coordinates.separation(target) < 1 * u.arcsec
+
+    # The loop kept running while the mount slewed
+    assert len(ticks) > 10
+
+
+def test_move_and_tracking_rate(emulator, mount):
+    async def move():
+        async_mount = AsyncMount(mount)
+        await async_mount.move_direction('north', seconds=0.1)
+        return await async_mount.set_tracking_rate('ra', 0.005)
+
+    assert run(move())
+    assert emulator.tracking_mode == '4'
+    assert emulator.custom_rate['ra'] == pytest.approx(0.005)
+    assert emulator.received[-4:-2] == [':mn#', ':q#']
@@ -0,0 +1,72 @@
+import time
+
+from pocs.mount.corrections import CorrectionScheduler
+
+
+class PulseMount(object):
+
+    """ Records the guide pulses sent to it """
+
+    def __init__(self):
+        self.pulses = []
+
+    def serial_query(self, cmd, *args):
+        self.pulses.append((time.monotonic(), cmd, args[0]))
+
+
+def test_axes_run_together():
+    mount = PulseMount()
+    corrections = CorrectionScheduler(mount, concurrent_axes=True)
+
+    start = time.monotonic()
+    corrections.add('ra', 200)
+    corrections.add('dec', -200)
+
+    assert corrections.is_busy
+    assert [(cmd, ms) for t, cmd, ms in mount.pulses] == [('move_ms_west', '00200'), ('move_ms_north', '00200')]
+
+    assert corrections.wait(timeout=5)
+    assert time.monotonic() - start < 0.35
+
+
+def test_same_axis_combined():
+    mount = PulseMount()
+    corrections = CorrectionScheduler(mount)
+
+    corrections.add('ra', 100)
+    corrections.add('ra', -300)
+    corrections.add('ra', 50)
+
+    assert corrections.wait(timeout=5)
+    assert [(cmd, ms) for t, cmd, ms in mount.pulses] == [('move_ms_west', '00100'), ('move_ms_east', '00250')]
+
+    # Second pulse only once the first has finished
+    assert mount.pulses[1][0] - mount.pulses[0][0] >= 0.09
+
+
+def test_long_and_short_pulses():
+    mount = PulseMount()
+    corrections = CorrectionScheduler(mount, min_ms=10, max_ms=100)
+
+    corrections.add('dec', 5)
+    assert not corrections.is_busy
+
+    done = []
+    corrections.add_listener(lambda name, axis: done.append(axis))
+    corrections.add('dec', 150)
+
+    assert corrections.wait(timeout=5)
+    assert [(cmd, ms) for t, cmd, ms in mount.pulses] == [('move_ms_south', '00100'), ('move_ms_south', '00050')]
+    assert done == ['dec']
+
+
+def test_one_axis_at_a_time():
+    mount = PulseMount()
+    corrections = CorrectionScheduler(mount)
+
+    corrections.add('ra', -100)
+    corrections.add('dec', 100)
+
+    assert len(mount.pulses) == 1
+    assert corrections.wait(timeout=5)
+    assert [cmd for t, cmd, ms in mount.pulses] == ['move_ms_east', 'move_ms_south']
@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+
+from pocs.utils.events import EventLoop
+
+
+def test_timers():
+    loop = EventLoop()
+    calls = []
+
+    loop.call_later(0.1, calls.append, 'second')
+    loop.call_later(0.05, calls.append, 'first')
+    loop.call_later(0.05, calls.append, 'cancelled').cancel()
+
+    assert loop.run_until(lambda: len(calls) == 2, timeout=1)
+    assert calls == ['first', 'second']
+
+
+def test_post_from_thread():
+    loop = EventLoop()
+    received = []
+    loop.on('mount', lambda name, data: received.append(data))
+
+    threading.Timer(0.1, loop.post, args=('mount', 'tracking')).start()
+
+    start = time.monotonic()
+    assert loop.run_until(lambda: received, timeout=2)
+    assert received == ['tracking']
+    assert time.monotonic() - start < 1
+
+
+def test_reader():
+    loop = EventLoop()
+    read_fd, write_fd = os.pipe()
+    received = []
+
+    loop.add_reader(read_fd, lambda fd: received.append(os.read(fd, 10)))
+    os.write(write_fd, b'hi')
+
+    assert loop.run_once(timeout=1) == 1
+    assert received == [b'hi']
+
+    loop.remove_reader(read_fd)
+    assert loop.run_until(timeout=0.05) is False
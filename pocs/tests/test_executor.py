@@ -0,0 +1,58 @@
+import subprocess
+import time
+
+import pytest
+
+from pocs.utils.executor import BACKGROUND
+from pocs.utils.executor import CRITICAL
+from pocs.utils.executor import Executor
+
+
+@pytest.fixture
+def executor():
+    return Executor(tool_limits={'sleep': 1})
+
+
+def test_check_output(executor):
+    assert executor.check_output('echo', ['echo', 'hello'], universal_newlines=True) == 'hello\n'
+
+    with pytest.raises(subprocess.CalledProcessError):
+        executor.check_output('false', ['false'])
+
+    stats = executor.get_stats('false')
+    assert stats['count'] == 1
+    assert stats['failed'] == 1
+
+
+def test_tool_limit(executor):
+    first = executor.run('sleep', ['sleep', '0.2'])
+    second = executor.run('sleep', ['sleep', '0.2'])
+
+    assert first.pid is not None
+    assert second.pid is None
+    assert executor.get_running() == ['sleep']
+
+    assert second.wait(timeout=5) == 0
+    assert executor.get_stats('sleep')['queue_time'] > 0.1
+
+
+def test_timeout(executor):
+    job = executor.run('sleep', ['sleep', '10'], timeout=0.2)
+
+    assert job.wait(timeout=5) < 0
+    assert job.timed_out
+    assert executor.get_stats('sleep')['timed_out'] == 1
+
+
+def test_critical_stops_background(executor):
+    background = executor.run('sh', ['sh', '-c', 'sleep 0.3'], priority=BACKGROUND)
+    critical = executor.run('sleep', ['sleep', '0.3'], priority=CRITICAL)
+
+    time.sleep(0.1)
+    assert background._paused
+
+    critical.wait(timeout=5)
+    background.wait(timeout=5)
+
+    assert not background._paused
+    assert background.returncode == 0
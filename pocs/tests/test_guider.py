@@ -0,0 +1,95 @@
+import pytest
+import time
+
+from astropy import units as u
+
+from pocs.guider import CameraOffsets
+from pocs.guider import Guider
+from pocs.guider import get_guide_wcsinfo
+from pocs.utils import error
+from pocs.utils.PID import PID
+
+
+class GuideMount(object):
+
+    guide_rate = 0.9
+
+    def __init__(self):
+        self.rates = []
+
+    def set_tracking_rate(self, direction='ra', delta=0.0):
+        self.rates.append((direction, delta))
+
+
+class Pulses(object):
+
+    def __init__(self):
+        self.pulses = []
+
+    def add(self, axis, ms):
+        self.pulses.append((axis, ms))
+
+
+def test_pid_zero_set_point():
+    pid = PID(Kp=1.0, Ki=0.0, Kd=0.0, set_point=0.0)
+
+    assert pid.recalculate(2.0, interval=1.0) == pytest.approx(-2.0)
+    assert pid.recalculate(0.0, interval=1.0) == pytest.approx(0.0)
+
+    pid.reset()
+    assert pid.history == []
+
+
+def test_pulse_corrections():
+    pulses = Pulses()
+    guider = Guider(GuideMount(), lambda: None, corrections=pulses,
+                    config={'pid': {'ra': {'Kp': 1.0, 'Ki': 0.0}, 'dec': {'Kp': 0.5, 'Ki': 0.0}}})
+
+    residual = guider.update({'ra_delta_as': 13.5 * u.arcsec, 'dec_delta_as': -2.0})
+
+    # 13.5 arcsec at 0.9 sidereal is a one second pulse
+    assert pulses.pulses[0] == ('ra', pytest.approx(1000))
+    assert pulses.pulses[1] == ('dec', pytest.approx(-1.0 / 13.5 * 1000))
+    assert residual['ra_offset'] == pytest.approx(13.5)
+
+    guider.update({'ra_delta_as': 0.0, 'dec_delta_as': 0.0})
+    assert guider.get_rms()['ra'] == pytest.approx((13.5 ** 2 / 2) ** 0.5)
+
+
+def test_rate_corrections():
+    mount = GuideMount()
+    guider = Guider(mount, lambda: None, config={'mode': 'rate', 'cadence': 10,
+                                                 'pid': {'ra': {'Kp': 1.0, 'Ki': 0.0}}})
+
+    guider.update({'ra_delta_as': 15.0})
+    assert mount.rates == [('ra', pytest.approx(-0.1))]
+
+
+def test_thread():
+    pulses = Pulses()
+    measurements = iter([None, {'ra_delta_as': 1.0, 'dec_delta_as': 1.0}])
+
+    guider = Guider(GuideMount(), lambda: next(measurements, None), corrections=pulses, config={'cadence': 0.05})
+    residuals = []
+    guider.add_listener(lambda name, residual: residuals.append(residual))
+
+    guider.start()
+    time.sleep(0.3)
+    guider.stop()
+
+    assert not guider.is_running
+    assert len(residuals) == 1
+    assert [axis for axis, ms in pulses.pulses] == ['ra', 'dec']
+
+
+def test_guide_camera_wcs():
+    wcs_info = get_guide_wcsinfo({'pixscale': 3.6, 'rotation': 90})
+
+    assert wcs_info['cd11'].value == pytest.approx(0.0, abs=1e-12)
+    assert wcs_info['cd12'].value == pytest.approx(0.001)
+    assert wcs_info['cd21'].unit == u.degree / u.pixel
+
+    # Without its own plate scale the guide camera would measure 1 degree per pixel
+    assert get_guide_wcsinfo({}) == {}
+    with pytest.raises(error.InvalidConfig):
+        CameraOffsets(None, {})
@@ -0,0 +1,232 @@
+import numpy as np
+import pytest
+
+from astropy import units as u
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from pocs.utils.images.background import get_background
+from pocs.utils.images.calibration import apply_calibration
+from pocs.utils.images.calibration import combine_frames
+from pocs.utils.images.catalog import ImageCatalog
+from pocs.utils.images.hints import SolveHints
+from pocs.utils.images.metadata import get_wcs_header
+from pocs.utils.images.metadata import propagate_wcs
+from pocs.utils.images.quicksolve import _unbin_wcsinfo
+from pocs.utils.images.quicksolve import bin_data
+from pocs.utils.images.stacking import ImageStack
+
+
+@pytest.fixture
+def sky():
+    """ A flat 1000 ADU sky with 20 ADU of noise and some saturated 'stars' """
+    np.random.seed(42)
+    data = np.random.normal(1000, 20, (512, 768)).astype(np.uint16)
+
+    ys = np.random.randint(0, 512, 200)
+    xs = np.random.randint(0, 768, 200)
+    data[ys, xs] = 60000
+
+    return data
+
+
+def test_background_mesh_shape(sky):
+    info = get_background(sky, box_size=64)
+
+    assert info['background'].shape == (8, 12)
+    assert info['rms'].shape == (8, 12)
+
+
+def test_background_ignores_stars(sky):
+    info = get_background(sky, box_size=64)
+
+    assert abs(info['sky_level'] - 1000) < 2
+    assert abs(info['sky_rms'] - 20) < 2
+
+
+def test_background_subsample(sky):
+    info = get_background(sky, box_size=64, subsample=3)
+
+    assert abs(info['sky_level'] - 1000) < 2
+    assert abs(info['sky_rms'] - 20) < 3
+
+
+def test_background_full_frame(sky):
+    info = get_background(sky, box_size=64, full_frame=True)
+
+    assert info['background_frame'].shape == sky.shape
+    assert info['rms_frame'].shape == sky.shape
+
+
+def test_background_too_small():
+    with pytest.raises(AssertionError):
+        get_background(np.zeros((10, 10)), box_size=64)
+
+
+@pytest.fixture
+def bias_frames(tmpdir):
+    """ Ten 100 ADU bias frames, one of which has a cosmic-ray-like streak """
+    np.random.seed(7)
+    fnames = []
+    for i in range(10):
+        data = np.random.normal(100, 5, (64, 48)).astype(np.uint16)
+        if i == 0:
+            data[10] = 60000
+
+        fname = str(tmpdir.join('bias_{:02d}.fits'.format(i)))
+        fits.writeto(fname, data)
+        fnames.append(fname)
+
+    return fnames
+
+
+@pytest.mark.parametrize('method', ['median', 'sigma_clip'])
+def test_combine_frames(bias_frames, method):
+    # Force several small chunks
+    combined = combine_frames(bias_frames, method=method, max_memory=10 * 48 * 4 * 8)
+
+    assert combined.shape == (64, 48)
+    assert combined.dtype == np.float32
+    assert abs(np.median(combined) - 100) < 1
+    assert combined[10].max() < 120
+
+
+def test_apply_calibration():
+    data = np.full((4, 4), 350, dtype=np.uint16)
+    masters = {
+        'bias': np.full((4, 4), 100, dtype=np.float32),
+        'dark': np.full((4, 4), 10, dtype=np.float32),
+        'dark_exptime': 10.,
+        'flat': np.full((4, 4), 0.5, dtype=np.float32),
+    }
+
+    calibrated = apply_calibration(data, masters, exptime=30)
+
+    assert calibrated.dtype == np.float32
+    assert np.allclose(calibrated, 440)
+
+
+@pytest.mark.parametrize('method', ['mean', 'clipped_mean'])
+def test_stack_shift_and_add(method):
+    np.random.seed(11)
+    base = np.random.normal(1000, 10, (100, 120)).astype(np.float32)
+    base[50, 60] = 5000
+
+    stack = ImageStack(method=method)
+    for dy, dx in [(0, 0), (2, -4), (-6, 2), (4, 4)]:
+        # Frame drifted by (-dy, -dx), so a shift of (dy, dx) registers it
+        frame = np.roll(np.roll(base, -dy, axis=0), -dx, axis=1)
+        assert stack.add(frame, shift=(dy + 0.3, dx - 0.4)) == (dy, dx)
+
+    assert stack.num_frames == 4
+    assert stack.get_stack()[50, 60] == pytest.approx(5000)
+    assert stack.get_coverage().max() == 4
+
+
+def test_stack_clips_outliers():
+    stack = ImageStack(method='clipped_mean', min_frames=3)
+
+    np.random.seed(3)
+    for i in range(8):
+        frame = np.random.normal(100, 1, (10, 10))
+        if i == 5:
+            frame[4, 4] = 10000
+        stack.add(frame)
+
+    assert abs(stack.get_stack()[4, 4] - 100) < 2
+    assert stack.get_coverage()[4, 4] == 7
+
+
+def test_catalog_add_and_query(tmpdir):
+    catalog = ImageCatalog(db_file=str(tmpdir.join('images.sqlite')))
+
+    field_dir = tmpdir.mkdir('M42')
+    for i in range(5):
+        catalog.add_image(str(field_dir.join('ee04d1_{:03d}.cr2'.format(i))),
+                          target='M42', date_obs='2016-08-01T10:{:02d}:00'.format(i), exptime=120)
+
+    # Updates only touch the given columns
+    catalog.add_image(str(field_dir.join('ee04d1_002.cr2')), solved=True, ra_center=83.8, dec_center=-5.4)
+
+    assert len(catalog.get_images(target='M42')) == 5
+    assert len(catalog.get_images(target='M31')) == 0
+    assert len(catalog.get_images(target='M42', start='2016-08-01T10:01:00', end='2016-08-01T10:03:00')) == 2
+    assert len(catalog.get_images(directory=str(field_dir), prefix='ee04d1_00')) == 5
+
+    solved = catalog.get_images(solved=True)
+    assert len(solved) == 1
+    assert solved[0]['exptime'] == 120
+    assert solved[0]['ra_center'] == pytest.approx(83.8)
+
+
+def test_propagate_wcs():
+    wcs_info = {
+        'crpix0': 1700 * u.pixel, 'crpix1': 1200 * u.pixel,
+        'crval0': 83.8 * u.degree, 'crval1': -5.4 * u.degree,
+        'cd11': -0.003 * (u.degree / u.pixel), 'cd12': 0.0004 * (u.degree / u.pixel),
+        'cd21': 0.0004 * (u.degree / u.pixel), 'cd22': 0.003 * (u.degree / u.pixel),
+        'imagew': 3476 * u.pixel, 'imageh': 2314 * u.pixel,
+    }
+
+    # A star at (x, y) in the solved frame is at (x - dx, y - dy) in the new frame
+    new_info = propagate_wcs(wcs_info, shift=(12, -30))
+
+    ref_wcs = WCS(get_wcs_header(wcs_info))
+    new_wcs = WCS(get_wcs_header(new_info))
+
+    assert np.allclose(ref_wcs.all_pix2world([[500., 800.]], 1), new_wcs.all_pix2world([[530., 788.]], 1))
+    assert new_info['propagated']
+
+
+def test_solve_hints(tmpdir):
+    hints_file = str(tmpdir.join('hints.json'))
+    hints = SolveHints(hints_file=hints_file)
+
+    assert hints.get_options(camera_id='ee04d1') == []
+
+    header = {'CD1_1': -0.00285, 'CD1_2': 0.0, 'CD2_1': 0.0, 'CD2_2': 0.00285,
+              'IMAGEW': 5208, 'IMAGEH': 3476, 'DETNAME': 'ee04d1'}
+    hints.record(header)
+
+    # Reloaded from the file
+    options = SolveHints(hints_file=hints_file).get_options(header={'DETNAME': 'ee04d1', 'RA': '83.8', 'DEC': '-5.4'})
+
+    assert options[options.index('--parity') + 1] == 'pos'
+    assert float(options[options.index('--scale-low') + 1]) < 10.26 < float(options[options.index('--scale-high') + 1])
+    assert options[options.index('--downsample') + 1] == '4'
+    assert options[options.index('--ra') + 1] == '83.8'
+
+
+def test_bin_data():
+    data = np.arange(10 * 9).reshape(10, 9)
+
+    binned = bin_data(data, binning=4)
+
+    assert binned.shape == (2, 2)
+    assert binned[0, 0] == data[:4, :4].sum()
+    assert binned[1, 1] == data[4:8, 4:8].sum()
+
+
+def test_unbin_wcsinfo():
+    wcs_info = {
+        'crpix0': 434.5 * u.pixel, 'crpix1': 289.5 * u.pixel,
+        'crval0': 83.8 * u.degree, 'crval1': -5.4 * u.degree,
+        'cd11': -0.012 * (u.degree / u.pixel), 'cd12': 0.0016 * (u.degree / u.pixel),
+        'cd21': 0.0016 * (u.degree / u.pixel), 'cd22': 0.012 * (u.degree / u.pixel),
+        'imagew': 868 * u.pixel, 'imageh': 578 * u.pixel,
+        'pixscale': 43.6 * (u.arcsec / u.pixel),
+        'wcs_file': 'guide_quick.new',
+    }
+
+    full_info = _unbin_wcsinfo(wcs_info, 4, origin=(10, 20))
+
+    assert 'wcs_file' not in full_info
+    assert full_info['pixscale'].value == pytest.approx(10.9)
+    assert full_info['imagew'].value == 3472
+
+    # The corners of a binned pixel are the corners of the block of full pixels
+    binned_wcs = WCS(get_wcs_header(wcs_info))
+    full_wcs = WCS(get_wcs_header(full_info))
+
+    assert np.allclose(binned_wcs.all_pix2world([[100.5, 50.5]], 1),
+                       full_wcs.all_pix2world([[100 * 4 + 0.5 + 20, 50 * 4 + 0.5 + 10]], 1))
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+
+def test_handle(emulator):
+    assert emulator.handle(':MountInfo#') == '0030'
+    assert emulator.handle(':V#') == 'V1.00#'
+    assert emulator.handle(':Sr00000000#') == '1'
+    assert emulator.handle(':Mn00100#') is None
+    assert emulator.handle(':XYZ#') is None
+
+
+def test_initialize(emulator, mount):
+    assert mount.is_initialized
+    assert mount.guide_rate == pytest.approx(0.9)
+    assert emulator.latitude == pytest.approx(19.54, abs=1e-3)
+    assert emulator.gmt_offset == -600
+
+
+def test_slew_and_track(emulator, mount):
+    ra, dec = emulator.get_position()
+    target = SkyCoord(ra=(ra + 20) * u.degree, dec=20 * u.degree)
+
+    assert mount.set_target_coordinates(target)
+    assert mount.slew_to_target()
+    assert mount.is_slewing
+
+    start_time = time.monotonic()
+    while mount.is_slewing and time.monotonic() - start_time < 10:
+        time.sleep(0.05)
+
+    assert mount.is_tracking
+    assert mount.get_current_coordinates().separation(target) < 1 * u.arcsec
+
+
+def test_query_latency(mount):
+    for _ in range(10):
+        mount.status()
+
+    latency = mount.get_serial_latency('get_status,get_guide_rate,get_coordinates')
+    assert latency['count'] >= 10
+    assert latency['p90_ms'] <= 100
+
+
+def test_transaction(emulator, mount):
+    status, ok, pulse, coords = mount.serial_transaction('get_status',
+                                                         ('set_ra', '00000000'),
+                                                         ('move_ms_west', '00010'),
+                                                         'get_coordinates')
+
+    assert status == emulator.handle(':GAS#').rstrip('#')
+    assert ok == 1
+    assert pulse == ''
+    assert mount._mount_coord_to_skycoord(coords) is not None
+
+    assert emulator.received[-4:] == [':GAS#', ':Sr00000000#', ':Mw00010#', ':GEC#']
+
+
+def test_status_refresh_is_one_transaction(emulator, mount):
+    count = len(emulator.received)
+
+    mount.status()
+
+    assert emulator.received[count:] == [':GAS#', ':AG#', ':GEC#']
+    assert mount.get_serial_latency('get_status,get_guide_rate,get_coordinates')['count'] == 1
+    assert mount._current_coordinates is not None
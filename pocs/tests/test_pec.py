@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from pocs.utils import pec
+
+
+@pytest.fixture
+def pec_data():
+    """ Two hours of 35 s samples of a 480 s worm error with drift and noise """
+    np.random.seed(12)
+    t = np.cumsum(np.random.uniform(30, 40, 200))
+    w = 2 * np.pi / 480.
+    y = 4.0 * np.sin(w * t + 0.3) + 1.0 * np.cos(2 * w * t) + 0.01 * t + np.random.normal(0, 0.2, len(t))
+
+    return t, y
+
+
+def test_find_period(pec_data):
+    period, power = pec.find_period(*pec_data)
+
+    assert period == pytest.approx(480, rel=0.01)
+    assert power > 0.5
+
+
+def test_fit_harmonics(pec_data):
+    fit = pec.fit_harmonics(*pec_data, period=480, n_harmonics=3)
+
+    assert fit['amplitude'][0] == pytest.approx(4.0, abs=0.1)
+    assert fit['amplitude'][1] == pytest.approx(1.0, abs=0.1)
+    assert fit['amplitude'][2] < 0.1
+    assert fit['drift'] == pytest.approx(0.01, abs=1e-3)
+    assert fit['rms'] < 0.25
+
+
+def test_correction_table(pec_data):
+    fit = pec.fit_pec(*pec_data)
+    table = pec.get_correction_table(fit, num_segments=64)
+
+    assert len(table) == 64
+    assert table.meta['period'] == pytest.approx(480, rel=0.01)
+    # The correction cancels the rate of the periodic error
+    assert np.allclose(table['correction'] * pec.sidereal_rate.value, -table['rate_as'])
+    assert abs(np.mean(table['rate_as'])) < 1e-3
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from astropy import units as u
+from astropy.coordinates import Angle
+from astropy.coordinates import SkyCoord
+
+from pocs.mount.pointing_model import PointingModel
+
+true_terms = {
+    'east': np.array([120.0, -45.0, 30.0, -12.0, 60.0, -25.0, 8.0]),
+    'west': np.array([-80.0, 20.0, -15.0, 5.0, 60.0, -25.0, 10.0]),
+}
+
+
+@pytest.fixture
+def model():
+    return PointingModel(35 * u.degree, decay=1.0, min_points=5)
+
+
+def _solved(model, commanded, lst, side):
+    """ Where the mount ends up with the `true_terms` """
+    ha = Angle(lst) - commanded.ra
+    d_ha, d_dec = model._design(ha, commanded.dec).dot(true_terms[side])
+
+    return SkyCoord(ra=commanded.ra - d_ha * u.arcsec, dec=commanded.dec + d_dec * u.arcsec)
+
+
+def _points(n, side, seed=0):
+    rng = np.random.RandomState(seed)
+    sign = -1 if side == 'east' else 1
+
+    lst = Angle(100 * u.degree)
+    for _ in range(n):
+        ha = sign * rng.uniform(5, 80)
+        dec = rng.uniform(-60, 60)
+        yield SkyCoord(ra=(lst.degree - ha) * u.degree, dec=dec * u.degree), lst
+
+
+def test_unused_until_min_points(model):
+    coords = SkyCoord(ra=50 * u.degree, dec=10 * u.degree)
+
+    for commanded, lst in list(_points(4, 'east')):
+        model.add_point(commanded, _solved(model, commanded, lst, 'east'), lst)
+
+    corrected, (d_ha, d_dec) = model.correct(coords, Angle(100 * u.degree))
+    assert d_ha == 0 * u.arcsec and d_dec == 0 * u.arcsec
+    assert corrected.separation(coords) < 1e-6 * u.arcsec
+
+
+def test_fit_each_side(model):
+    for side in model.sides:
+        for commanded, lst in _points(30, side):
+            assert model.add_point(commanded, _solved(model, commanded, lst, side), lst) == side
+
+    for side in model.sides:
+        terms = model.get_terms(side)
+        assert np.allclose([terms[t] for t in model.terms], true_terms[side], atol=1)
+
+
+def test_correction_lands_on_target(model):
+    for commanded, lst in _points(30, 'west'):
+        model.add_point(commanded, _solved(model, commanded, lst, 'west'), lst)
+
+    lst = Angle(100 * u.degree)
+    target = SkyCoord(ra=60 * u.degree, dec=20 * u.degree)
+    sent, applied = model.correct(target, lst)
+
+    # Uncorrected the mount is off by arcminutes, corrected it lands on the target
+    assert _solved(model, target, lst, 'west').separation(target) > 1 * u.arcmin
+    assert _solved(model, sent, lst, 'west').separation(target) < 5 * u.arcsec
+
+    # A point with the correction applied is the same mount error
+    side = model.add_point(target, _solved(model, sent, lst, 'west'), lst, applied=applied)
+    terms = model.get_terms(side)
+    assert np.allclose([terms[t] for t in model.terms], true_terms['west'], atol=1)
+
+
+def test_sync_moves_index_terms(model):
+    for side in model.sides:
+        for commanded, lst in _points(30, side):
+            model.add_point(commanded, _solved(model, commanded, lst, side), lst)
+
+    # Sync the mount on the west side, which moves the zero points by the error there
+    lst = Angle(100 * u.degree)
+    commanded = SkyCoord(ra=60 * u.degree, dec=20 * u.degree)
+    err_ha, err_dec = model.get_error(commanded, _solved(model, commanded, lst, 'west'))
+    model.sync(commanded, _solved(model, commanded, lst, 'west'), lst)
+
+    synced = {
+        'west': true_terms['west'] - [err_ha, err_dec, 0, 0, 0, 0, 0],
+        'east': true_terms['east'] - [err_ha, -err_dec, 0, 0, 0, 0, 0],
+    }
+    for side in model.sides:
+        terms = model.get_terms(side)
+        assert np.allclose([terms[t] for t in model.terms], synced[side], atol=1)
+
+
+def test_correct_with_offset(model):
+    target = SkyCoord(ra=60 * u.degree, dec=20 * u.degree)
+    lst = Angle(100 * u.degree)
+
+    sent, (d_ha, d_dec) = model.correct(target, lst, offset=(30 * u.arcsec, -20 * u.arcsec))
+    assert model.is_active(lst - target.ra, target.dec) is False
+    assert d_ha == 30 * u.arcsec and d_dec == -20 * u.arcsec
+    assert model.get_error(target, sent) == pytest.approx((-30, 20))
+
+
+def test_save_load(model, tmpdir):
+    fname = str(tmpdir.join('pointing_model.json'))
+    model.model_file = fname
+
+    for commanded, lst in _points(10, 'east'):
+        model.add_point(commanded, _solved(model, commanded, lst, 'east'), lst)
+
+    loaded = PointingModel(35 * u.degree, model_file=fname)
+    assert loaded.get_terms('east') == pytest.approx(model.get_terms('east'))
+    assert loaded.get_terms('west') == dict((t, 0.0) for t in model.terms)
+
+    other_site = PointingModel(-20 * u.degree)
+    with pytest.warns(UserWarning):
+        assert not other_site.load(fname)
@@ -0,0 +1,116 @@
+import os
+import pty
+import time
+import tty
+
+import pytest
+
+from pocs.utils.rs232 import LatencyHistogram
+from pocs.utils.rs232 import SerialData
+from pocs.utils.rs232 import SharedLineBuffer
+
+
+@pytest.fixture
+def serial_data():
+    # Whatever is written to a loop:// port is read back
+    serial_data = SerialData(port='loop://', threaded=False)
+    serial_data.connect()
+
+    yield serial_data
+
+    serial_data.ser.close()
+
+
+def test_read_until_terminator(serial_data):
+    serial_data.write('+012345670123456#')
+
+    start_time = time.monotonic()
+    assert serial_data.read(terminator='#', timeout=1.0) == '+012345670123456#'
+    assert time.monotonic() - start_time < 0.1
+
+
+def test_read_without_terminator(serial_data):
+    # The iOptron answers '1' without a terminator to most commands
+    serial_data.write('1')
+
+    start_time = time.monotonic()
+    assert serial_data.read(terminator='#', min_size=1, timeout=1.0) == '1'
+    assert time.monotonic() - start_time < 0.1
+
+
+def test_read_timeout(serial_data):
+    serial_data.write('0030')
+
+    start_time = time.monotonic()
+    assert serial_data.read(terminator='#', timeout=0.2) == '0030'
+    assert time.monotonic() - start_time >= 0.2
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.summary()['p50_ms'] is None
+
+    for ms in [0.5, 3, 3, 4, 40]:
+        histogram.add(ms / 1000)
+
+    summary = histogram.summary()
+    assert summary['count'] == 5
+    assert summary['mean_ms'] == pytest.approx(10.1)
+    assert summary['p50_ms'] == 5
+    assert summary['p99_ms'] == 40
+    assert summary['max_ms'] == 40
+    assert summary['histogram'] == {'<=1': 1, '<=5': 3, '<=50': 1}
+
+
+def test_shared_line_buffer():
+    lines = SharedLineBuffer(size=4, line_size=8)
+    assert lines.latest() is None
+
+    for i in range(6):
+        lines.append('line {}'.format(i), timestamp=100 + i)
+
+    assert len(lines) == 4
+    assert lines.latest() == (105, 'line 5')
+    assert [line for t, line in lines.history()] == ['line 2', 'line 3', 'line 4', 'line 5']
+    assert lines.history(lines=2) == [(104, 'line 4'), (105, 'line 5')]
+    assert lines.history(since=103.5) == [(104, 'line 4'), (105, 'line 5')]
+
+    # Written over by a newer line
+    assert lines._read(1) is None
+
+    lines.append('a much longer line')
+    assert lines.latest()[1] == 'a much l'
+
+    # Left half-written by a writer that died
+    lines._seq[2] += 1
+    assert lines.latest() is None
+    assert [line for t, line in lines.history()] == ['line 3', 'line 4', 'line 5']
+
+
+def test_background_reader():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+
+    serial_data = SerialData(port=os.ttyname(slave), threaded=True, buffer_lines=10)
+    serial_data.connect()
+    serial_data.start()
+
+    try:
+        for i in range(20):
+            os.write(master, '{{"temp": {}}}\r\n'.format(i).encode())
+
+        start_time = time.monotonic()
+        while serial_data.get_reading() != '{"temp": 19}' and time.monotonic() - start_time < 5:
+            time.sleep(0.01)
+
+        assert serial_data.get_reading() == '{"temp": 19}'
+
+        history = serial_data.get_history()
+        assert [line for t, line in history] == ['{{"temp": {}}}'.format(i) for i in range(10, 20)]
+        assert all(t <= time.time() for t, line in history)
+    finally:
+        serial_data.stop()
+        os.close(master)
+        os.close(slave)
+
+    assert not serial_data.process.is_alive()
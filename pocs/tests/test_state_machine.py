@@ -0,0 +1,49 @@
+import logging
+
+from pocs.state.logic import PanStateLogic
+from pocs.state.machine import PanStateMachine
+from pocs.utils.events import EventLoop
+
+
+class WaitingMachine(PanStateMachine, PanStateLogic):
+
+    """ Just the command handling and waiting, without a state table or devices """
+
+    def __init__(self, state):
+        self.logger = logging.getLogger('test_state_machine')
+        self.state = state
+
+        self._loop = EventLoop()
+        self._sleep_delay = 0.05
+        self._next_state = None
+        self._interrupt = None
+        self._do_states = True
+
+
+def test_park_during_wait():
+    machine = WaitingMachine('slewing')
+
+    # The command arrives while the slewing state is waiting for the mount
+    machine._loop.call_later(0.05, machine.cmd_handler, {'message': 'park'})
+    assert machine.wait_until(lambda: False, timeout=0.2) is False
+
+    # Then the state finishes as usual
+    machine.next_state = 'pointing'
+
+    machine._apply_interrupt()
+    assert machine.next_state == 'parking'
+
+    # Only once
+    machine.next_state = 'parked'
+    machine._apply_interrupt()
+    assert machine.next_state == 'parked'
+
+
+def test_park_ignored_when_parked():
+    machine = WaitingMachine('parked')
+
+    machine.cmd_handler({'message': 'park'})
+    machine.next_state = 'housekeeping'
+
+    machine._apply_interrupt()
+    assert machine.next_state == 'housekeeping'
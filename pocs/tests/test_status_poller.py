@@ -0,0 +1,44 @@
+import time
+
+from pocs.utils.status import StatusPoller
+
+
+def test_ttl():
+    calls = []
+
+    def get_value():
+        calls.append(1)
+        return len(calls)
+
+    poller = StatusPoller()
+    poller.add_field('value', get_value, ttl=60)
+
+    poller.poll()
+    poller.poll()
+
+    snapshot = poller.get_snapshot()
+    assert snapshot['value'] == 1
+    assert snapshot['age']['value'] < 1
+    assert len(calls) == 1
+
+    poller.refresh('value')
+    poller.poll()
+    assert poller.get('value') == 2
+
+
+def test_thread():
+    changes = []
+
+    poller = StatusPoller(interval=0.05)
+    poller.add_listener(lambda name, value: changes.append((name, value)))
+    poller.add_field('time', time.monotonic, ttl=0.05)
+    poller.add_field('missing', lambda: None, ttl=0.05)
+
+    poller.start()
+    time.sleep(0.3)
+    poller.stop()
+
+    assert not poller.is_running
+    assert 'missing' not in poller.get_snapshot()
+    assert 3 <= len(changes) <= 8
+    assert all(name == 'time' for name, value in changes)
@@ -0,0 +1,66 @@
+import pytest
+
+from astroplan import Observer
+from astropy import units as u
+from astropy.coordinates import EarthLocation
+from astropy.time import Time
+
+from pocs.scheduler.twilight import TwilightTimetable
+
+
+@pytest.fixture
+def observer():
+    location = EarthLocation(lat=19.54 * u.degree, lon=-155.58 * u.degree, height=3400 * u.meter)
+    return Observer(location=location, timezone='US/Hawaii')
+
+
+def test_compute(observer):
+    # Midday in Hawaii
+    noon = Time('2016-08-13 22:00:00')
+    twilight = TwilightTimetable.compute(observer, time=noon)
+
+    times = [twilight.times[name] for name in TwilightTimetable.events]
+    assert times == sorted(times)
+    assert twilight.times['sunset'] > noon.unix
+    assert twilight.times['dark_start'] == pytest.approx(twilight.times['astronomical_evening'], abs=60)
+
+    assert not twilight.is_dark(noon)
+    assert twilight.is_dark(twilight.get_time('astronomical_evening') + 5 * u.minute)
+    assert twilight.is_night(twilight.get_time('sunset') + 5 * u.minute)
+    assert not twilight.is_dark(twilight.get_time('sunrise') - 5 * u.minute)
+
+    # During the night it is the same night
+    midnight = twilight.get_time('astronomical_evening') + 3 * u.hour
+    assert TwilightTimetable.compute(observer, time=midnight).times['sunset'] == pytest.approx(
+        twilight.times['sunset'], abs=1)
+
+
+def test_next_night(observer):
+    # After the end of astronomical darkness but before sunrise, when housekeeping runs
+    morning = Time('2016-09-10 15:30:00')
+    twilight = TwilightTimetable.compute(observer, time=morning)
+    assert twilight.times['dark_end'] < morning.unix < twilight.times['sunrise']
+
+    coming = TwilightTimetable.compute(observer, time=morning, next_night=True)
+    assert coming.times['sunset'] > twilight.times['sunrise']
+    assert coming.times['dark_start'] > morning.unix
+    assert not coming.is_dark(morning)
+
+    # During the day it is the same night either way
+    noon = Time('2016-09-10 22:00:00')
+    assert TwilightTimetable.compute(observer, time=noon, next_night=True).times == \
+        TwilightTimetable.compute(observer, time=noon).times
+
+
+def test_save_load(observer, tmpdir):
+    twilight = TwilightTimetable.compute(observer, time=Time('2016-08-13 22:00:00'), horizon=-12 * u.degree)
+
+    fname = str(tmpdir.join('twilight.json'))
+    twilight.save(fname)
+
+    loaded = TwilightTimetable.load(fname)
+    assert loaded.times == twilight.times
+    assert loaded.matches({'latitude': 19.54, 'longitude': -155.58}, -12)
+    assert not loaded.matches({'latitude': 19.54, 'longitude': -155.58}, -18)
+
+    assert TwilightTimetable.load(str(tmpdir.join('missing.json'))) is None
@@ -0,0 +1,43 @@
+import threading
+import time
+
+import pytest
+
+from pocs.utils.events import EventLoop
+from pocs.utils.watcher import FileWatcher
+
+
+def write_file(fname, delay=0.1):
+    def write():
+        with open(fname, 'w') as f:
+            f.write('image')
+
+    threading.Timer(delay, write).start()
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_wait_for_file(tmpdir, use_inotify):
+    fname = str(tmpdir.join('image.cr2'))
+    loop = EventLoop()
+
+    with FileWatcher([fname], use_inotify=use_inotify) as watcher:
+        if watcher.uses_inotify:
+            loop.add_reader(watcher.fileno(), watcher.read_events)
+
+        assert not watcher.all_written()
+
+        write_file(fname)
+        start = time.monotonic()
+        assert loop.run_until(watcher.all_written, timeout=5, interval=watcher.poll_interval)
+
+        if watcher.uses_inotify:
+            # Woken by the close rather than the poll interval
+            assert time.monotonic() - start < 0.5
+
+
+def test_existing_file(tmpdir):
+    fname = tmpdir.join('image.cr2')
+    fname.write('image')
+
+    with FileWatcher([str(fname)]) as watcher:
+        assert watcher.all_written()
@@ -0,0 +1,61 @@
+import time
+
+from datetime import datetime
+from datetime import timedelta
+
+from pocs.utils.weather import WeatherCache
+
+
+class WeatherCollection(object):
+
+    def __init__(self):
+        self.record = None
+        self.queries = 0
+
+    def find_one(self, query):
+        self.queries += 1
+        return self.record
+
+    def watch(self, *args, **kwargs):
+        raise RuntimeError("Change streams need a replica set")
+
+
+class WeatherDB(object):
+
+    def __init__(self):
+        self.current = WeatherCollection()
+
+
+def test_get_record():
+    db = WeatherDB()
+    now = datetime.utcnow()
+    db.current.record = {'type': 'weather', 'data': {'safe': True}, 'date': now}
+
+    cache = WeatherCache(db)
+    for _ in range(10):
+        assert cache.get_record()['data']['safe']
+
+    assert db.current.queries == 1
+
+    # Older records are ignored, newer ones (e.g. from the messaging bus) replace it
+    cache.update({'data': {'safe': False}, 'date': now - timedelta(minutes=5)})
+    assert cache.get_record()['data']['safe']
+
+    cache.update({'data': {'safe': False}, 'date': (now + timedelta(seconds=10)).isoformat()})
+    assert cache.get_record()['data']['safe'] is False
+
+
+def test_polling_fallback():
+    db = WeatherDB()
+    records = []
+
+    cache = WeatherCache(db, poll_interval=0.05)
+    cache.add_listener(lambda name, record: records.append(record))
+    cache.start()
+
+    db.current.record = {'type': 'weather', 'data': {'safe': True}, 'date': datetime.utcnow()}
+    time.sleep(0.3)
+    cache.stop()
+
+    assert len(records) == 1
+    assert cache.get_record()['data']['safe']
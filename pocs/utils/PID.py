@@ -32,7 +32,7 @@ class PID:
         self.Dval = 0.0
         self.previous_error = None
         self.set_point = None
-        if set_point:
+        if set_point is not None:
             self.set_point = set_point
         self.output_limits = output_limits
         self.history = []
@@ -43,7 +43,7 @@ class PID:
     def recalculate(self, value, interval=None,
                     reset_integral=False,
                     new_set_point=None):
-        if new_set_point:
+        if new_set_point is not None:
             self.set_point = float(new_set_point)
         if reset_integral:
             self.history = []
@@ -61,10 +61,8 @@ class PID:
         # Ival
         for entry in self.history:
             entry[2] += interval
-        for entry in self.history:
-            if self.max_age:
-                if entry[2] > self.max_age:
-                    self.history.remove(entry)
+        if self.max_age:
+            self.history = [entry for entry in self.history if entry[2] <= self.max_age]
         self.history.append([error, interval, 0])
         new_Ival = 0
         for entry in self.history:
@@ -72,7 +70,7 @@ class PID:
         self.Ival = new_Ival
 
         # Dval
-        if self.previous_error:
+        if self.previous_error is not None and interval > 0:
             self.Dval = (error - self.previous_error) / interval
 
         # Output
@@ -89,10 +87,20 @@ class PID:
 
         return output
 
+    def reset(self):
+        """ Forget the history, e.g. when starting on a new target """
+        self.Pval = None
+        self.Ival = 0.0
+        self.Dval = 0.0
+        self.previous_error = None
+        self.history = []
+        self.last_recalc_time = None
+        self.last_interval = 0.
+
     def tune(self, Kp=None, Ki=None, Kd=None):
-        if Kp:
+        if Kp is not None:
             self.Kp = Kp
-        if Ki:
+        if Ki is not None:
             self.Ki = Ki
-        if Kd:
+        if Kd is not None:
             self.Kd = Kd
@@ -1,11 +1,11 @@
 import os
 import re
-import subprocess
 
 from astropy.time import Time
 from astropy.utils import resolve_name
 
 from ..utils import error
+from .executor import get_executor
 
 
 def current_time(flatten=False, utcnow=False, pretty=False):
@@ -64,7 +64,7 @@ def list_connected_cameras():
     """
 
     command = ['gphoto2', '--auto-detect']
-    result = subprocess.check_output(command)
+    result = get_executor().check_output('gphoto2', command)
     lines = result.decode('utf-8').split('\n')
 
     ports = []
@@ -0,0 +1,235 @@
+import fcntl
+import heapq
+import itertools
+import os
+import threading
+import time
+import zmq
+
+from collections import defaultdict
+from collections import deque
+
+
+class EventLoop(object):
+
+    """ A small event loop for POCS
+
+    The loop waits (with a `zmq.Poller`, so both ZMQ sockets and file descriptors
+    can be watched) until one of the following happens:
+
+        * A registered socket or file descriptor is readable (e.g. a command
+          message or a file watcher), see `add_reader`.
+        * A timer is due, see `call_later` and `call_at`.
+        * An event is posted from any thread (e.g. a change of device status),
+          see `post`.
+
+    The callbacks for whatever happened are then called from the thread running the
+    loop, so no time is spent sleeping for a fixed delay and no CPU is used while
+    idle. Only the thread running the loop should call `run_once` and `run_until`,
+    everything else is thread-safe.
+    """
+
+    def __init__(self):
+        self._poller = zmq.Poller()
+        self._readers = {}
+
+        self._timers = []
+        self._counter = itertools.count()
+
+        self._lock = threading.Lock()
+        self._events = deque()
+        self._listeners = defaultdict(list)
+
+        # Self-pipe so other threads can wake the loop
+        self._wake_read, self._wake_write = os.pipe()
+        for fd in [self._wake_read, self._wake_write]:
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._poller.register(self._wake_read, zmq.POLLIN)
+
+    def add_reader(self, source, callback):
+        """ Call `callback(source)` whenever `source` has something to read
+
+        Args:
+            source:     A ZMQ socket or a file descriptor.
+            callback:   Callable taking the source.
+        """
+        self._readers[source] = callback
+        self._poller.register(source, zmq.POLLIN)
+
+    def remove_reader(self, source):
+        """ Stop watching `source` """
+        if self._readers.pop(source, None) is not None:
+            self._poller.unregister(source)
+
+    def call_later(self, delay, callback, *args):
+        """ Call `callback(*args)` after `delay` seconds
+
+        Returns:
+            `Timer`:    Handle that can be used to `cancel` the call.
+        """
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_at(self, when, callback, *args):
+        """ Call `callback(*args)` at `when` (a `time.monotonic` time)
+
+        Returns:
+            `Timer`:    Handle that can be used to `cancel` the call.
+        """
+        timer = Timer(when, callback, args)
+
+        with self._lock:
+            heapq.heappush(self._timers, (when, next(self._counter), timer))
+
+        self.wake()
+
+        return timer
+
+    def on(self, name, callback):
+        """ Call `callback(name, data)` whenever an event called `name` is posted """
+        self._listeners[name].append(callback)
+
+    def off(self, name, callback):
+        """ Remove a callback added with `on` """
+        if callback in self._listeners[name]:
+            self._listeners[name].remove(callback)
+
+    def post(self, name, data=None):
+        """ Post an event, can be called from any thread
+
+        Args:
+            name(str):  Name of the event, e.g. 'mount' for a change of mount status.
+            data:       Passed to the listeners.
+        """
+        with self._lock:
+            self._events.append((name, data))
+
+        self.wake()
+
+    def wake(self):
+        """ Wake the loop, can be called from any thread """
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            # Pipe is full so the loop is going to wake anyway
+            pass
+
+    def run_once(self, timeout=None):
+        """ Wait for something to happen and handle it
+
+        Args:
+            timeout(float):     Longest time to wait in seconds. None (the default) waits
+                until something happens, 0 handles only what is already pending.
+
+        Returns:
+            int:    The number of callbacks (readers, events and timers) that were run.
+        """
+        wait = self._time_to_next_timer()
+        if timeout is not None:
+            wait = timeout if wait is None else min(wait, timeout)
+
+        sockets = dict(self._poller.poll(None if wait is None else int(max(wait, 0) * 1000)))
+
+        handled = 0
+
+        if self._wake_read in sockets:
+            self._drain_wake_pipe()
+
+        for source, callback in list(self._readers.items()):
+            if sockets.get(source, 0) & zmq.POLLIN:
+                callback(source)
+                handled += 1
+
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+
+        for name, data in events:
+            for callback in list(self._listeners[name]):
+                callback(name, data)
+            handled += 1
+
+        for timer in self._pop_due_timers():
+            timer.callback(*timer.args)
+            handled += 1
+
+        return handled
+
+    def run_until(self, condition=None, timeout=None, interval=None):
+        """ Run the loop until `condition()` is true or `timeout` seconds have passed
+
+        `condition` is checked straight away, after anything happens on the loop and,
+        if given, at least every `interval` seconds for conditions that can't post an
+        event when they change.
+
+        Args:
+            condition:          Callable returning a bool. If None, run for `timeout` seconds.
+            timeout(float):     Seconds to run for, None (the default) to run until `condition`.
+            interval(float):    Longest time between checks of `condition` in seconds.
+
+        Returns:
+            bool:   True if `condition` became true, False on timeout.
+        """
+        assert condition is not None or timeout is not None, "Need a condition or a timeout"
+
+        end_time = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            if condition is not None and condition():
+                return True
+
+            wait = interval
+            if end_time is not None:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    return False
+
+                wait = remaining if wait is None else min(wait, remaining)
+
+            self.run_once(timeout=wait)
+
+    def close(self):
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+    def _time_to_next_timer(self):
+        with self._lock:
+            while self._timers and self._timers[0][2].cancelled:
+                heapq.heappop(self._timers)
+
+            if not self._timers:
+                return None
+
+            return max(self._timers[0][0] - time.monotonic(), 0)
+
+    def _pop_due_timers(self):
+        now = time.monotonic()
+        due = []
+
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                timer = heapq.heappop(self._timers)[2]
+                if not timer.cancelled:
+                    due.append(timer)
+
+        return due
+
+    def _drain_wake_pipe(self):
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+class Timer(object):
+
+    """ A call scheduled on an `EventLoop` """
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
@@ -0,0 +1,521 @@
+import heapq
+import itertools
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from collections import defaultdict
+
+# Job priorities, lower runs first
+CRITICAL = 0
+HIGH = 1
+NORMAL = 2
+BACKGROUND = 3
+
+priority_names = {
+    'critical': CRITICAL,
+    'high': HIGH,
+    'normal': NORMAL,
+    'background': BACKGROUND,
+}
+
+# Default number of concurrent jobs per tool, tools not listed are unlimited
+default_tool_limits = {
+    'cr2_to_jpg': 1,
+    'dcraw': 2,
+    'exiftool': 2,
+    'solve_field': 1,
+    'wcs-rd2xy': 2,
+    'wcsinfo': 2,
+}
+
+
+class Executor(object):
+
+    """ Runs the external tools used by POCS
+
+    All external programs (dcraw, solve-field, gphoto2, ...) are started through a
+    single executor so that the number running at once can be limited and the cost of
+    each tool is recorded.
+
+    Jobs are admitted from a priority queue. A job starts when the number of jobs
+    already running for the same tool is under the tool's limit and, for `NORMAL`
+    and `BACKGROUND` jobs, the total number of those jobs is under `max_jobs`.
+    `HIGH` jobs (e.g. camera control) are only subject to the tool limit. `CRITICAL`
+    jobs (e.g. the plate solve used for pointing) start straight away and any running
+    `BACKGROUND` jobs are stopped (SIGSTOP) until no critical job is left. Background
+    jobs are also run at a lower CPU priority.
+
+    Each job is started in its own session so that a timeout (or `kill`) stops the
+    whole process group, e.g. `solve-field` started by `solve_field.sh`.
+
+    Args:
+        tool_limits(dict):  Maximum concurrent jobs per tool name, added to (and
+            overriding) `default_tool_limits`.
+        max_jobs(int):      Maximum concurrent `NORMAL` and `BACKGROUND` jobs, defaults
+            to the number of CPUs.
+        background_nice(int): Niceness added to `BACKGROUND` jobs, defaults to 10.
+    """
+
+    def __init__(self, tool_limits=None, max_jobs=None, background_nice=10):
+        self.tool_limits = dict(default_tool_limits)
+        self.tool_limits.update(tool_limits or {})
+
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.background_nice = background_nice
+
+        self._lock = threading.RLock()
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = set()
+
+        self._stats = defaultdict(lambda: {
+            'count': 0,
+            'failed': 0,
+            'timed_out': 0,
+            'wall_time': 0.,
+            'max_wall_time': 0.,
+            'cpu_time': 0.,
+            'queue_time': 0.,
+        })
+
+    def run(self, tool, cmd, priority=NORMAL, timeout=None, **popen_kwargs):
+        """ Submit a command
+
+        If the job can be started straight away it is, so errors starting the command
+        (e.g. a missing executable) are raised here. Otherwise the job is queued and
+        errors are raised when the job is waited on.
+
+        Args:
+            tool(str):          Name of the tool, used for the limits and statistics.
+            cmd(list):          Command, as for `subprocess.Popen`.
+            priority(int|str):  One of `CRITICAL`, `HIGH`, `NORMAL` (default) or `BACKGROUND`,
+                or the lowercase name of one.
+            timeout(float):     Seconds after which the job is killed, defaults to no timeout.
+                Time spent stopped for a critical job doesn't count.
+            **popen_kwargs:     Passed to `subprocess.Popen`.
+
+        Returns:
+            `Job`:  A handle with the same `wait`, `communicate`, `poll`, `kill` and
+                `terminate` methods as a `subprocess.Popen`.
+        """
+        priority = priority_names.get(priority, priority)
+        assert priority in priority_names.values(), "Invalid priority: {}".format(priority)
+
+        job = Job(self, tool, cmd, priority, timeout, popen_kwargs)
+
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._counter), job))
+            self._dispatch()
+
+        if job._start_error is not None:
+            raise job._start_error
+
+        return job
+
+    def call(self, tool, cmd, timeout=None, **kwargs):
+        """ Run a command and return the return code, like `subprocess.call` """
+        job = self.run(tool, cmd, **kwargs)
+        try:
+            return job.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            job.kill()
+            job.wait()
+            raise
+
+    def check_call(self, tool, cmd, timeout=None, **kwargs):
+        """ Run a command, raising `subprocess.CalledProcessError` if it fails """
+        returncode = self.call(tool, cmd, timeout=timeout, **kwargs)
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd)
+
+        return returncode
+
+    def check_output(self, tool, cmd, timeout=None, **kwargs):
+        """ Run a command and return the output, like `subprocess.check_output` """
+        kwargs.setdefault('stdout', subprocess.PIPE)
+
+        job = self.run(tool, cmd, **kwargs)
+        try:
+            output, _ = job.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            job.kill()
+            job.communicate()
+            raise
+
+        if job.returncode:
+            raise subprocess.CalledProcessError(job.returncode, cmd, output=output)
+
+        return output
+
+    def get_stats(self, tool=None):
+        """ Timing statistics
+
+        Args:
+            tool(str):  Only return the statistics for this tool.
+
+        Returns:
+            dict:   Per tool: the number of jobs (`count`), how many `failed` (non-zero
+                exit) and `timed_out`, the total and maximum `wall_time`, the total `cpu_time`
+                (user + system, including any children) and the total `queue_time`, all in
+                seconds.
+        """
+        with self._lock:
+            stats = dict((name, dict(values)) for name, values in self._stats.items())
+
+        if tool is not None:
+            return stats.get(tool, {})
+
+        return stats
+
+    def get_running(self):
+        """ Tool names of the running jobs """
+        with self._lock:
+            return sorted(job.tool for job in self._running)
+
+    def _can_start(self, job):
+        if job.priority == CRITICAL:
+            return True
+
+        running_tool = sum(1 for j in self._running if j.tool == job.tool)
+        limit = self.tool_limits.get(job.tool)
+        if limit is not None and running_tool >= limit:
+            return False
+
+        if job.priority >= NORMAL:
+            running = sum(1 for j in self._running if j.priority >= NORMAL)
+            if running >= self.max_jobs:
+                return False
+
+        return True
+
+    def _dispatch(self):
+        """ Start the queued jobs that are allowed to run, in priority order """
+        with self._lock:
+            waiting = []
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                job = entry[2]
+
+                if self._can_start(job):
+                    if job._start():
+                        self._running.add(job)
+                else:
+                    waiting.append(entry)
+
+            for entry in waiting:
+                heapq.heappush(self._queue, entry)
+
+            self._update_preemption()
+
+    def _update_preemption(self):
+        critical = any(job.priority == CRITICAL for job in self._running)
+
+        for job in self._running:
+            if job.priority == BACKGROUND:
+                if critical:
+                    job._pause()
+                else:
+                    job._resume()
+
+    def _finished(self, job):
+        with self._lock:
+            self._running.discard(job)
+
+            stats = self._stats[job.tool]
+            stats['count'] += 1
+            stats['failed'] += int(job.returncode != 0)
+            stats['timed_out'] += int(job.timed_out)
+            stats['wall_time'] += job.wall_time
+            stats['max_wall_time'] = max(stats['max_wall_time'], job.wall_time)
+            stats['cpu_time'] += job.cpu_time
+            stats['queue_time'] += job.queue_time
+
+            self._dispatch()
+
+
+class Job(object):
+
+    """ A command run by the `Executor`
+
+    Behaves like a `subprocess.Popen` for the methods POCS uses. Only the executor
+    reaps the process, so `wait` and `communicate` wait on the job rather than calling
+    `os.waitpid` themselves.
+    """
+
+    def __init__(self, executor, tool, cmd, priority, timeout, popen_kwargs):
+        self.executor = executor
+        self.tool = tool
+        self.args = cmd
+        self.priority = priority
+        self.timeout = timeout
+
+        self.returncode = None
+        self.timed_out = False
+        self.wall_time = 0.
+        self.cpu_time = 0.
+        self.queue_time = 0.
+
+        self._popen_kwargs = popen_kwargs
+        self._proc = None
+        self._start_error = None
+        self._submitted = time.monotonic()
+        self._started_at = None
+
+        self._started = threading.Event()
+        self._done = threading.Event()
+
+        self._paused = False
+        self._paused_at = None
+        self._paused_time = 0.
+        self._timeout_credit = 0.
+        self._timer = None
+
+        self._readers = None
+        self._output = {}
+
+    @property
+    def pid(self):
+        """ PID of the process, None until the job has started """
+        return self._proc.pid if self._proc is not None else None
+
+    @property
+    def stdout(self):
+        self._started.wait()
+        return self._proc.stdout if self._proc is not None else None
+
+    @property
+    def stderr(self):
+        self._started.wait()
+        return self._proc.stderr if self._proc is not None else None
+
+    def poll(self):
+        """ The return code if the job has finished, else None """
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """ Wait for the job to finish, raising `subprocess.TimeoutExpired` on timeout """
+        if not self._done.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+
+        if self._start_error is not None:
+            raise self._start_error
+
+        return self.returncode
+
+    def communicate(self, input=None, timeout=None):
+        """ Read the output of the job, like `subprocess.Popen.communicate`
+
+        The output is read in the background so, as with `Popen`, `communicate` can be
+        called again after a `subprocess.TimeoutExpired` (e.g. after a `kill`).
+        """
+        end_time = None if timeout is None else time.monotonic() + timeout
+
+        if not self._started.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+
+        if self._start_error is not None:
+            raise self._start_error
+
+        if self._proc is None:
+            # Cancelled before it started
+            return None, None
+
+        if self._readers is None:
+            self._start_readers(input)
+
+        for reader in self._readers:
+            remaining = None if end_time is None else max(0, end_time - time.monotonic())
+            reader.join(remaining)
+            if reader.is_alive():
+                raise subprocess.TimeoutExpired(self.args, timeout)
+
+        remaining = None if end_time is None else max(0, end_time - time.monotonic())
+        self.wait(remaining)
+
+        return self._output.get('stdout'), self._output.get('stderr')
+
+    def send_signal(self, sig):
+        """ Send a signal to the process group of the job
+
+        If the job hasn't started yet it is removed from the queue instead.
+        """
+        with self.executor._lock:
+            if self._proc is None:
+                if not self._done.is_set():
+                    self.executor._queue = [e for e in self.executor._queue if e[2] is not self]
+                    self.executor._queue.sort()
+                    self.returncode = -sig
+                    self._started.set()
+                    self._done.set()
+                return
+
+            if self.returncode is None:
+                try:
+                    os.killpg(self._proc.pid, sig)
+                    if self._paused and sig in (signal.SIGTERM, signal.SIGINT):
+                        os.killpg(self._proc.pid, signal.SIGCONT)
+                except (ProcessLookupError, PermissionError):
+                    pass
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def _start(self):
+        """ Start the process, returns False if it couldn't be started """
+        kwargs = dict(self._popen_kwargs)
+        kwargs['start_new_session'] = True
+
+        self._started_at = time.monotonic()
+        self.queue_time = self._started_at - self._submitted
+
+        try:
+            self._proc = subprocess.Popen(self.args, **kwargs)
+        except Exception as e:
+            self._start_error = e
+            self._started.set()
+            self._done.set()
+            return False
+
+        # Set from here rather than with `preexec_fn`, which isn't safe with other threads running
+        if self.priority == BACKGROUND and self.executor.background_nice:
+            try:
+                os.setpriority(os.PRIO_PROCESS, self._proc.pid,
+                               os.getpriority(os.PRIO_PROCESS, 0) + self.executor.background_nice)
+            except OSError:
+                # Already finished
+                pass
+
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+
+        watcher = threading.Thread(target=self._watch, name='executor-{}'.format(self.tool))
+        watcher.daemon = True
+        watcher.start()
+
+        self._started.set()
+
+        return True
+
+    def _watch(self):
+        """ Wait for the process to exit then record its cost and reap it """
+        pid = self._proc.pid
+
+        try:
+            # Wait without reaping so the CPU times can still be read from /proc
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            pass
+
+        self.cpu_time = _get_cpu_time(pid)
+        self.wall_time = time.monotonic() - self._started_at
+
+        self._proc.wait()
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+        self.returncode = self._proc.returncode
+        self._done.set()
+
+        self.executor._finished(self)
+
+    def _on_timeout(self):
+        with self.executor._lock:
+            if self.returncode is not None:
+                return
+
+            # Don't count time spent stopped for a critical job
+            paused_time = self._paused_time - self._timeout_credit
+            if self._paused or paused_time > 0:
+                self._timeout_credit = self._paused_time
+                self._timer = threading.Timer(max(paused_time, 1.), self._on_timeout)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+
+            self.timed_out = True
+            self.kill()
+
+    def _pause(self):
+        if self._paused or self.returncode is not None:
+            return
+
+        try:
+            os.killpg(self._proc.pid, signal.SIGSTOP)
+            self._paused = True
+            self._paused_at = time.monotonic()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _resume(self):
+        if not self._paused:
+            return
+
+        try:
+            os.killpg(self._proc.pid, signal.SIGCONT)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+        self._paused = False
+        self._paused_time += time.monotonic() - self._paused_at
+
+    def _start_readers(self, input):
+        self._readers = []
+
+        if input is not None and self._proc.stdin is not None:
+            try:
+                self._proc.stdin.write(input)
+                self._proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        for name in ['stdout', 'stderr']:
+            pipe = getattr(self._proc, name)
+            if pipe is not None:
+                reader = threading.Thread(target=self._read, args=(name, pipe))
+                reader.daemon = True
+                reader.start()
+                self._readers.append(reader)
+
+    def _read(self, name, pipe):
+        self._output[name] = pipe.read()
+        pipe.close()
+
+    def __repr__(self):
+        return '<Job {} pid={} priority={} returncode={}>'.format(self.tool, self.pid, self.priority,
+                                                                  self.returncode)
+
+
+def _get_cpu_time(pid):
+    """ User + system time of a (zombie) process and its reaped children, in seconds """
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            # The command name may contain spaces so split after it
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = sum(int(t) for t in fields[11:15])
+        return ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return 0.
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """ The shared `Executor` """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = Executor()
+
+    return _executor
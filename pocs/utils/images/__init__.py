@@ -5,8 +5,22 @@ from warnings import warn
 
 from astropy.io import fits
 
+from .background import get_background
+# `conversions` has to be imported before the modules it depends on (circular imports)
 from .conversions import cr2_to_pgm
+from .conversions import process_cr2
+from .calculations import get_pec_data
+from .calculations import get_pec_fit
+from .calculations import get_solve_field
+from .calculations import measure_offset
+from .io import crop_data
 from .io import read_pgm
+from .metadata import get_target_position
+from .metadata import get_wcs_header
+from .metadata import get_wcsinfo
+from .metadata import propagate_wcs
+from .quicksolve import bin_data
+from .quicksolve import quick_solve
 
 
 def read_image_data(fname):
@@ -0,0 +1,186 @@
+import numpy as np
+
+from scipy import ndimage
+
+
+def get_background(data, box_size=64, filter_size=3, sigma=3.0, iters=5, subsample=None, full_frame=False):
+    """ Estimate the sky background and noise of an image on a mesh of tiles.
+
+    The image is cut into `box_size` x `box_size` tiles with a reshaped view, so all of
+    the tiles are sigma-clipped at once rather than looping over them. Each tile is
+    sorted once, after which every clipping iteration is just a set of index lookups
+    and comparisons. The clipping uses a robust width (from the interquartile range) so
+    that bright stars don't inflate the threshold. The resulting meshes are median
+    filtered to suppress tiles dominated by bright objects.
+
+    Note:
+        Rows and columns that don't fill a complete tile are ignored. For the RGGB
+        mosaic `box_size` should be even so each tile samples all four Bayer channels
+        equally, and `subsample` should be odd for the same reason.
+
+    Args:
+        data(np.array):         Image data, e.g. from `read_image_data`.
+        box_size(int):          Size of each tile in pixels, defaults to 64.
+        filter_size(int):       Size of the median filter applied to the mesh, defaults to 3.
+            A value of 1 (or None) disables the filtering.
+        sigma(float):           Clipping threshold in units of standard deviation, defaults to 3.
+        iters(int):             Maximum number of clipping iterations, defaults to 5.
+        subsample(int):         Only use every `subsample` row and column within each tile. This
+            is meant for quick-look values, defaults to None (use all pixels).
+        full_frame(bool):       If True, also return the meshes interpolated back to the size of
+            `data` (keys `background_frame` and `rms_frame`), defaults to False.
+
+    Returns:
+        dict:   Contains the `background` and `rms` meshes, the global `sky_level` and
+            `sky_rms` (medians of the meshes) and the `box_size` that was used.
+    """
+    assert data.ndim == 2, "Background estimation requires a 2D image"
+
+    box_size = int(box_size)
+    n_rows = data.shape[0] // box_size
+    n_cols = data.shape[1] // box_size
+
+    assert n_rows > 0 and n_cols > 0, "Image ({}) is smaller than box_size {}".format(data.shape, box_size)
+
+    # (row, y, col, x) view of the data, no copy yet
+    tiles = data[:n_rows * box_size, :n_cols * box_size].reshape(n_rows, box_size, n_cols, box_size)
+
+    if subsample is not None and subsample > 1:
+        tiles = tiles[:, ::subsample, :, ::subsample]
+
+    # Put each tile on the last axis, this is the only copy of the data we make
+    tiles = tiles.transpose(0, 2, 1, 3).reshape(n_rows * n_cols, -1)
+
+    background, rms = _sigma_clipped_stats(tiles, sigma=sigma, iters=iters)
+
+    background = background.reshape(n_rows, n_cols)
+    rms = rms.reshape(n_rows, n_cols)
+
+    if filter_size is not None and filter_size > 1:
+        background = ndimage.median_filter(background, size=filter_size, mode='nearest')
+        rms = ndimage.median_filter(rms, size=filter_size, mode='nearest')
+
+    info = {
+        'background': background,
+        'rms': rms,
+        'sky_level': float(np.median(background)),
+        'sky_rms': float(np.median(rms)),
+        'box_size': box_size,
+    }
+
+    if full_frame:
+        info['background_frame'] = expand_mesh(background, data.shape)
+        info['rms_frame'] = expand_mesh(rms, data.shape)
+
+    return info
+
+
+def expand_mesh(mesh, shape):
+    """ Interpolate a background mesh back up to a full image
+
+    Args:
+        mesh(np.array):     Mesh as returned from `get_background`.
+        shape(tuple):       Shape of the full image.
+
+    Returns:
+        np.array:           Bilinear interpolation of `mesh` with the given `shape`.
+    """
+    # Bilinear interpolation is separable, so do it as two small matrix products
+    row_weights = _interpolation_weights(mesh.shape[0], shape[0])
+    col_weights = _interpolation_weights(mesh.shape[1], shape[1])
+
+    return row_weights.dot(mesh).dot(col_weights.T)
+
+
+def _interpolation_weights(n_mesh, n_pixels):
+    """ Linear interpolation matrix from `n_mesh` tile centers to `n_pixels` pixels """
+    # Pixel centers in units of tiles, relative to the center of the first tile
+    position = np.clip((np.arange(n_pixels) + 0.5) * n_mesh / n_pixels - 0.5, 0, n_mesh - 1)
+
+    below = np.floor(position).astype(np.intp)
+    above = np.minimum(below + 1, n_mesh - 1)
+    frac = position - below
+
+    weights = np.zeros((n_pixels, n_mesh))
+    pixels = np.arange(n_pixels)
+    np.add.at(weights, (pixels, below), 1 - frac)
+    np.add.at(weights, (pixels, above), frac)
+
+    return weights
+
+
+def _sigma_clipped_stats(tiles, sigma=3.0, iters=5):
+    """ Sigma-clipped median and standard deviation along the last axis
+
+    Because each row is sorted the clipped set is always a contiguous range
+    `[lo, hi)` of the sorted values, so each iteration only has to move the
+    range bounds.
+    """
+    srt = np.sort(tiles, axis=-1)
+    n_tiles, n_pix = srt.shape
+    rows = np.arange(n_tiles)
+
+    def _quantile(idx, lo, count, q):
+        pos = lo + (count - 1) * q
+        below = np.floor(pos).astype(np.intp)
+        above = np.minimum(below + 1, n_pix - 1)
+        frac = pos - below
+
+        return srt[idx, below] * (1 - frac) + srt[idx, above] * frac
+
+    lo = np.zeros(n_tiles, dtype=np.intp)
+    hi = np.full(n_tiles, n_pix, dtype=np.intp)
+
+    # For integer data the thresholds can be rounded into the data type, which keeps
+    # the comparisons below in the (much cheaper) native type.
+    is_integer = np.issubdtype(srt.dtype, np.integer)
+    if is_integer:
+        limits = np.iinfo(srt.dtype)
+
+    # Only tiles whose clipping range is still changing are looked at again
+    active = rows
+
+    for _ in range(iters):
+        a_lo = lo[active]
+        a_hi = hi[active]
+        count = a_hi - a_lo
+
+        median = _quantile(active, a_lo, count, 0.5)
+        width = (_quantile(active, a_lo, count, 0.75) - _quantile(active, a_lo, count, 0.25)) / 1.349
+
+        lower = median - sigma * width
+        upper = median + sigma * width
+
+        if is_integer:
+            lower = np.clip(np.ceil(lower), limits.min, limits.max).astype(srt.dtype)
+            upper = np.clip(np.floor(upper), limits.min, limits.max).astype(srt.dtype)
+
+        values = srt if len(active) == n_tiles else srt[active]
+        new_lo = np.count_nonzero(values < lower[:, np.newaxis], axis=-1)
+        new_hi = np.count_nonzero(values <= upper[:, np.newaxis], axis=-1)
+
+        # Never clip a tile down to nothing
+        empty = new_hi <= new_lo
+        new_lo[empty] = a_lo[empty]
+        new_hi[empty] = a_hi[empty]
+
+        changed = (new_lo != a_lo) | (new_hi != a_hi)
+
+        lo[active] = new_lo
+        hi[active] = new_hi
+
+        active = active[changed]
+        if len(active) == 0:
+            break
+
+    count = hi - lo
+    median = _quantile(rows, lo, count, 0.5)
+
+    # Standard deviation of the surviving pixels
+    index = np.arange(n_pix)
+    keep = (index >= lo[:, np.newaxis]) & (index < hi[:, np.newaxis])
+
+    residual = np.where(keep, srt - median[:, np.newaxis].astype(np.float32), 0)
+    rms = np.sqrt(np.einsum('ij,ij->i', residual, residual) / count)
+
+    return median, rms
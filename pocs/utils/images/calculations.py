@@ -15,15 +15,17 @@ from skimage.feature import register_translation
 from dateutil import parser as date_parser
 
 import numpy as np
-import pandas as pd
 
 from astropy.visualization import quantity_support
 from matplotlib import pyplot as plt
 
-from scipy.optimize import curve_fit
-
 from pocs.utils import error
+from pocs.utils import pec
+from pocs.utils.executor import get_executor
 
+from .catalog import ImageCatalog
+from .hints import SolveHints
+from .hints import read_header
 from .io import crop_data
 from .io import read_exif
 from .metadata import get_wcsinfo
@@ -39,6 +41,11 @@ def solve_field(fname, timeout=15, solve_opts=[], **kwargs):
         timeout(int, optional):     Timeout for the solve-field command, defaults to 60 seconds.
         solve_opts(list, optional): List of options for solve-field.
         verbose(bool, optional):    Show output, defaults to False.
+        use_hints(bool, optional):  Narrow the search with hints from previous solves of the same
+            camera (see `SolveHints`), defaults to True.
+        camera_id(str, optional):   Camera for the hints, defaults to the DETNAME in the FITS header.
+        priority(str, optional):    Executor priority (see `pocs.utils.executor`), defaults to
+            'normal'. Solves needed for pointing should be 'critical'.
     """
     verbose = kwargs.get('verbose', False)
     if verbose:
@@ -54,27 +61,38 @@ def solve_field(fname, timeout=15, solve_opts=[], **kwargs):
         options = solve_opts
     else:
         options = [
-            '--guess-scale',
             '--cpulimit', str(timeout),
             '--no-verify',
             '--no-plots',
             '--crpix-center',
-            '--downsample', '4',
         ]
         if kwargs.get('clobber', True):
             options.append('--overwrite')
         if kwargs.get('skip_solved', True):
             options.append('--skip-solved')
 
-        if 'ra' in kwargs:
-            options.append('--ra')
-            options.append(str(kwargs.get('ra')))
-        if 'dec' in kwargs:
-            options.append('--dec')
-            options.append(str(kwargs.get('dec')))
-        if 'radius' in kwargs:
-            options.append('--radius')
-            options.append(str(kwargs.get('radius')))
+        hint_options = []
+        if kwargs.get('use_hints', True):
+            hint_options = SolveHints().get_options(camera_id=kwargs.get('camera_id'),
+                                                    header=read_header(fname),
+                                                    ra=kwargs.get('ra'),
+                                                    dec=kwargs.get('dec'),
+                                                    radius=kwargs.get('radius'))
+
+        if hint_options:
+            options.extend(hint_options)
+        else:
+            options.extend(['--guess-scale', '--downsample', '4'])
+
+            if 'ra' in kwargs:
+                options.append('--ra')
+                options.append(str(kwargs.get('ra')))
+            if 'dec' in kwargs:
+                options.append('--dec')
+                options.append(str(kwargs.get('dec')))
+            if 'radius' in kwargs:
+                options.append('--radius')
+                options.append(str(kwargs.get('radius')))
 
         if os.getenv('PANTEMP'):
             options.append('--temp-dir')
@@ -85,7 +103,8 @@ def solve_field(fname, timeout=15, solve_opts=[], **kwargs):
         print("Cmd: ", cmd)
 
     try:
-        proc = subprocess.Popen(cmd, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        proc = get_executor().run('solve_field', cmd, priority=kwargs.get('priority', 'normal'),
+                                  universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     except OSError as e:
         raise error.InvalidCommand("Can't send command to solve_field.sh. {} \t {}".format(e, cmd))
     except ValueError as e:
@@ -138,9 +157,17 @@ def get_solve_field(fname, **kwargs):
             out_dict.update(read_exif(fname))
             fname = fname.replace('cr2', 'new')  # astrometry.net default extension
             out_dict['solved_fits_file'] = fname
+        elif os.path.exists(os.path.splitext(fname)[0] + '.new'):
+            fname = os.path.splitext(fname)[0] + '.new'
+            out_dict['solved_fits_file'] = fname
 
         try:
-            out_dict.update(fits.getheader(fname))
+            header = fits.getheader(fname)
+            out_dict.update(header)
+
+            # Remember the scale, parity etc. for the next solve
+            if kwargs.get('use_hints', True):
+                SolveHints().record(header, camera_id=kwargs.get('camera_id'))
         except OSError:
             if verbose:
                 print("Can't read fits header for {}".format(fname))
@@ -308,7 +335,7 @@ def measure_offset(d0, d1, info={}, crop=True, pixel_factor=100, rate=None, verb
     shift, error, diffphase = register_translation(d0, d1, pixel_factor)
 
     offset_info['shift'] = (shift[0], shift[1])
-    # offset_info['error'] = error
+    offset_info['error'] = error
     # offset_info['diffphase'] = diffphase
 
     if transform is not None:
@@ -390,10 +417,13 @@ def get_pointing_error(fits_fname, verbose=False):  # unused
 
 def get_pec_data(image_dir, ref_image=None, img_prefix='',
                  observer=None, phase_length=480,
-                 skip_solved=True, verbose=False, parallel=False, **kwargs):
+                 skip_solved=True, verbose=False, parallel=False, catalog=None, **kwargs):
 
     assert observer is not None, "Observer required"
 
+    # Solving for the PEC data shouldn't get in the way of observing
+    kwargs.setdefault('priority', 'background')
+
     # Gather all the images
     base_dir = os.getenv('PANDIR', '/var/panoptes')
     target_name, obs_date_start = image_dir.rstrip('/').split('/', 1)
@@ -415,7 +445,7 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
     if ref_image.endswith('cr2'):
         if verbose:
             print("Solving guide image")
-        ref_solve_info = get_solve_field(ref_image, verbose=verbose)
+        ref_solve_info = get_solve_field(ref_image, verbose=verbose, priority=kwargs['priority'])
         if verbose:
             print("Solved guide image info: {}".format(ref_solve_info))
         ref_image = ref_image.replace('cr2', 'new')
@@ -424,7 +454,7 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
     # Note: not sure this is needed any more
     if not os.path.exists(ref_image):
         if os.path.exists(ref_image.replace('new', 'fits')):
-            ref_solve_info = get_solve_field(ref_image.replace('new', 'fits'))
+            ref_solve_info = get_solve_field(ref_image.replace('new', 'fits'), priority=kwargs['priority'])
 
     if verbose and ref_solve_info:
         print(ref_solve_info)
@@ -438,9 +468,19 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
         print("Reference image: {}".format(ref_image))
         print("Reference time: {}".format(t0))
 
-    # Image sequence
-    image_files = glob.glob('{}/{}*.cr2'.format(target_dir, img_prefix))
-    image_files.sort()
+    # Image sequence, from the catalog if it has the images
+    catalog_rows = {}
+    try:
+        for row in ImageCatalog(db_file=catalog).get_images(directory=target_dir, prefix=img_prefix):
+            if row['path'].endswith('.cr2'):
+                catalog_rows[row['path']] = row
+    except Exception as e:
+        warn("Can't read image catalog: {}".format(e))
+
+    image_files = sorted(catalog_rows.keys())
+    if len(image_files) == 0:
+        image_files = glob.glob('{}/{}*.cr2'.format(target_dir, img_prefix))
+        image_files.sort()
 
     if verbose:
         print("Found {} images in sequence".format(len(image_files)))
@@ -452,6 +492,20 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
         if verbose:
             print('*' * 80)
         header_info = {}
+
+        # Use the catalog entry if the image has been solved
+        row = catalog_rows.get(img, {})
+        if row.get('solved') and row.get('ra_center') is not None and row.get('date_obs'):
+            if verbose:
+                print("Using catalog entry for {}".format(img))
+
+            img_info.append({
+                'ra_center': row['ra_center'] * u.degree,
+                'dec_center': row['dec_center'] * u.degree,
+                'date-obs': row['date_obs'],
+            })
+            return
+
         img_wcs_path = img.replace('cr2', 'wcs')
         if not os.path.exists(img_wcs_path):
             if verbose:
@@ -490,54 +544,48 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
             print("Solving for {}".format(img))
         solver(img)
 
-    # Get the center RA/Dec for all images
-    ras = [w['ra_center'].value for w in img_info]
-    decs = [w['dec_center'].value for w in img_info]
+    # Get the center RA/Dec for all images as single arrays
+    ra_centers = u.Quantity([w['ra_center'] for w in img_info])
+    dec_centers = u.Quantity([w['dec_center'] for w in img_info])
+
+    ras = ra_centers.value
+    decs = dec_centers.value
 
     # Get the center RA/Dec in arcseconds.  (??? - used for HA below)
-    ras_as = [w['ra_center'].to(u.arcsec).value for w in img_info]
-    decs_as = [w['dec_center'].to(u.arcsec).value for w in img_info]
+    ras_as = ra_centers.to(u.arcsec).value
+    decs_as = dec_centers.to(u.arcsec).value
 
-    # List of times for sequqnce
-    time_range = [Time(w.get('date-obs', t0)) for w in img_info]
+    # One `Time` for the whole sequence
+    time_range = Time([w.get('date-obs', t0.isoformat()) for w in img_info])
 
-    # Get the Hourangle from the observer
-    ha = []
-    ha = np.array([observer.target_hour_angle(t, SkyCoord(ras[idx], decs[idx], unit='degree')).to(u.degree).value
-                   for idx, t in enumerate(time_range)])
+    # Get the Hourangle from the observer for all images at once
+    ha = observer.target_hour_angle(time_range, SkyCoord(ras, decs, unit='degree')).to(u.degree).value
 
     ha[ha > 270] = ha[ha > 270] - 360
 
-    # Get time deltas between each timestamp
-    dt = np.diff([t.datetime.timestamp() for t in time_range])
-    # Add the offset for initial time
-    dt = np.insert(dt, 0, (time_range[0].datetime.timestamp() - t0.timestamp()))
+    # Get time deltas between each timestamp, including the offset for initial time
+    timestamps = time_range.unix
+    dt = np.diff(np.insert(timestamps, 0, Time(t0).unix))
+
     # Total offset for each image
     t_offset = np.cumsum(dt)
 
-    # Arcsecond difference between each image for RA
-    ra_diff = np.diff(ras_as)
-    ra_diff = np.insert(ra_diff, 0, 0)
-
-    # Arcsecond difference between each image for Dec
-    dec_diff = np.diff(decs_as)
-    dec_diff = np.insert(dec_diff, 0, 0)
-
-    # Delta arcsecond
-    dra_as = pd.Series(ra_diff)
-    ddec_as = pd.Series(dec_diff)
+    # Delta arcsecond between each image
+    dra_as = np.insert(np.diff(ras_as), 0, 0)
+    ddec_as = np.insert(np.diff(decs_as), 0, 0)
 
     # Delta arcsecond rate
-    dra_as_rate = dra_as / dt
-    ddec_as_rate = ddec_as / dt
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dra_as_rate = dra_as / dt
+        ddec_as_rate = ddec_as / dt
 
-    # Fill in empty values
-    dra_as_rate.fillna(value=0, inplace=True)
-    ddec_as_rate.fillna(value=0, inplace=True)
+    # Fill in empty values (0 / 0)
+    dra_as_rate[np.isnan(dra_as_rate)] = 0
+    ddec_as_rate[np.isnan(ddec_as_rate)] = 0
 
     if verbose:
-        print(len(ra_diff))
-        print(len(dec_diff))
+        print(len(dra_as))
+        print(len(ddec_as))
         print(len(dt))
         print(len(t_offset))
         print(len(ras))
@@ -553,7 +601,7 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
         'ra_as': dra_as,
         'ra_as_rate': dra_as_rate,
         'offset': t_offset,
-        'time_range': [t.mjd for t in time_range],
+        'time_range': time_range.mjd,
     }, meta={
         'name': target_name,
         'obs_date_start': obs_date_start,
@@ -573,81 +621,77 @@ def get_pec_data(image_dir, ref_image=None, img_prefix='',
     return table
 
 
-def get_pec_fit(data, gear_period=480, with_plot=False, **kwargs):
-    """
-    Adapted from:
-    http://stackoverflow.com/questions/16716302/how-do-i-fit-a-sine-curve-to-my-data-with-pylab-and-numpy
-    """
+def get_pec_fit(data, gear_period=None, n_harmonics=3, with_plot=False, **kwargs):
+    """ Fit the periodic error of the mount
 
-    if with_plot:
-        fig, axes = plt.subplots(nrows=2, ncols=1, sharex=True)
-
-    for idx, key in enumerate(['as', 'as_rate']):
+    The image to image offsets from `get_pec_data` are accumulated into a position
+    error, the worm period is found with a periodogram and harmonics of the period are
+    fit by least squares, see `pocs.utils.pec`. The Dec axis is fit with the RA period.
 
-        ra_field = 'ra_{}'.format(key)
-        dec_field = 'dec_{}'.format(key)
+    Args:
+        data(`astropy.table.Table`):    Table from `get_pec_data`.
+        gear_period(float):             Worm period in seconds, defaults to None, which will
+            search for the period.
+        n_harmonics(int):               Number of harmonics to fit, defaults to 3.
+        with_plot(bool):                Save a plot of the fit, defaults to False.
+        **kwargs:                       Can contain `plot_title` and `plot_name` as well as
+            options for `pec.find_period`.
 
-        guess_freq = 2
-        guess_phase = 0
-        guess_amplitude_ra = 3 * np.std(data[ra_field]) / (2**0.5)
-        guess_offset_ra = np.mean(data[ra_field])
+    Returns:
+        dict:   The `ra` and `dec` fits and the RA `correction` table for the mount.
+    """
+    plot_title = kwargs.pop('plot_title', 'PEC Fit')
+    plot_name = kwargs.pop('plot_name', 'pec_fit.png')
 
-        guess_amplitude_dec = 3 * data[dec_field].std() / (2**0.5)
-        guess_offset_dec = data[dec_field].mean()
+    fit_time = np.asarray(data['offset'])
 
-        # Initial guess parameters
-        ra_p0 = [guess_freq, guess_amplitude_ra, guess_phase, guess_offset_ra]
-        dec_p0 = [guess_freq, guess_amplitude_dec, guess_phase, guess_offset_dec]
+    positions = {}
+    pec_fit = {}
 
-        # Worm gear is a periodic sine function
-        def gear_sin(x, freq, amplitude, phase, offset):
-            return amplitude * np.sin(x * freq + phase) + offset
+    period = gear_period
+    for direction in ['ra', 'dec']:
+        positions[direction] = np.cumsum(data['{}_as'.format(direction)])
 
-        # Fit to function
-        fit_range = data['ha']
-        ra_fit = curve_fit(gear_sin, fit_range, data[ra_field], p0=ra_p0)
-        dec_fit = curve_fit(gear_sin, fit_range, data[dec_field], p0=dec_p0)
+        pec_fit[direction] = pec.fit_pec(fit_time, positions[direction], period=period,
+                                         n_harmonics=n_harmonics, **kwargs)
+        period = pec_fit['ra']['period']
 
-        smooth_range = np.linspace(fit_range.min(), fit_range.max(), 1000)
-        smooth_ra_fit = gear_sin(smooth_range, *ra_fit[0])
-        smooth_dec_fit = gear_sin(smooth_range, *dec_fit[0])
+    pec_fit['correction'] = pec.get_correction_table(pec_fit['ra'])
 
-        # The `gradient` method takes the derivate, giving the rate
-        if key == 'as_rate':
-            smooth_ra_fit = np.gradient(smooth_ra_fit)
-            smooth_dec_fit = np.gradient(smooth_dec_fit)
+    if with_plot:
+        fig, axes = plt.subplots(nrows=2, ncols=1, sharex=True)
 
-        if with_plot:
-            ra_max = np.max(smooth_ra_fit)
-            ra_min = np.min(smooth_ra_fit)
+        smooth_range = np.linspace(fit_time.min(), fit_time.max(), 1000)
 
+        for idx, key in enumerate(['as', 'as_rate']):
             ax = axes[idx]
 
             if key == 'as':
-                ax.plot(fit_range, data[ra_field], 'o', color='red', alpha=0.5)
+                ax.plot(fit_time, positions['ra'], 'o', color='red', alpha=0.5)
 
-            ax.plot(smooth_range, smooth_ra_fit, label='RA Fit', color='blue')
-            ax.plot(smooth_range, smooth_dec_fit, label='Dec Fit', color='green')
+            ra_fit = pec.evaluate(pec_fit['ra'], smooth_range, derivative=(key == 'as_rate'))
+            dec_fit = pec.evaluate(pec_fit['dec'], smooth_range, derivative=(key == 'as_rate'))
 
-            ax.set_title("Peak-to-Peak: {} arcsec".format(round(ra_max - ra_min, 3)))
-            ax.set_xlabel('HA')
+            ax.plot(smooth_range, ra_fit, label='RA Fit', color='blue')
+            ax.plot(smooth_range, dec_fit, label='Dec Fit', color='green')
+
+            ax.set_title("Period: {:.1f} s Peak-to-Peak: {} arcsec".format(
+                pec_fit['ra']['period'], round(pec_fit['correction'].meta['peak_to_peak'], 3)))
+            ax.set_xlabel('Time [s]')
             ax.set_ylabel('RA Offset [{}]'.format(key))
             ax.legend()
 
-    if with_plot:
-        plt.suptitle(kwargs.get('plot_title', 'PEC Fit'))
-        plt.savefig('{}/images/{}'.format(os.getenv('PANDIR', default='/var/panoptes/'),
-                                          kwargs.get('plot_name', 'pec_fit.png')))
-
-    ra_optimized = ra_fit[0]
+        plt.suptitle(plot_title)
+        plt.savefig('{}/images/{}'.format(os.getenv('PANDIR', default='/var/panoptes/'), plot_name))
 
-    return ra_optimized
+    return pec_fit
 
 
-def make_pec_fit_fn(params):  # unused
-    """ Creates a PEC function based on passed params """
+def make_pec_fit_fn(params):
+    """ Creates a PEC function of time based on a fit from `get_pec_fit` """
+    fit = params.get('ra', params)
 
     def fit_fn(x):
-        return params[1] * np.sin(x * params[0] + params[2]) + params[3]
+        return pec.evaluate(fit, x)
 
     return fit_fn
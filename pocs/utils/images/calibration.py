@@ -0,0 +1,324 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from warnings import warn
+
+import numpy as np
+
+from astropy.io import fits
+
+from .io import read_exif
+from .io import read_pgm
+
+
+def combine_frames(fnames, method='median', sigma=3.0, iters=3, offset=None, normalize=False,
+                   max_memory=256 * 2**20, parallel=True, max_workers=4, **kwargs):
+    """ Combine a stack of frames into a single frame
+
+    The frames are never read into memory all at once. Each frame is memory mapped (CR2 files
+    are first decoded to PGM with `dcraw`, see `cr2_to_pgm`) and the stack is combined a chunk
+    of rows at a time. The chunk size is picked so that all of the chunks being worked on at
+    once fit into `max_memory`, whatever the number of frames.
+
+    Args:
+        fnames(list):       List of CR2, PGM or FITS filenames.
+        method(str):        One of 'median', 'mean' or 'sigma_clip' (a sigma-clipped mean),
+            defaults to 'median'.
+        sigma(float):       Clipping threshold for 'sigma_clip', defaults to 3.
+        iters(int):         Maximum number of clipping iterations for 'sigma_clip', defaults to 3.
+        offset(np.array):   An array (e.g. a master bias) that is subtracted from each frame before
+            combining, defaults to None.
+        normalize(bool):    Divide each frame by its median before combining (used for flats),
+            defaults to False.
+        max_memory(int):    Approximate number of bytes used for the stack, defaults to 256 MB.
+        parallel(bool):     Combine chunks in parallel threads, defaults to True.
+        max_workers(int):   Number of threads to use if `parallel`, defaults to 4.
+
+    Returns:
+        np.array:           The combined frame as float32.
+    """
+    assert len(fnames) > 0, warn("Need frames to combine")
+    assert method in ['median', 'mean', 'sigma_clip'], warn("Unknown combine method: {}".format(method))
+
+    verbose = kwargs.get('verbose', False)
+
+    if not parallel:
+        max_workers = 1
+
+    frames, remove_files = _open_frames(fnames, max_workers=max_workers, **kwargs)
+
+    try:
+        shape = frames[0][0].shape
+        for fn, (frame, _, _) in zip(fnames, frames):
+            assert frame.shape == shape, warn("Frame {} does not match shape {}".format(fn, shape))
+
+        # Per-frame scale factors are measured on a sparse grid of pixels
+        scales = np.ones(len(frames), dtype=np.float32)
+        if normalize:
+            for idx, (frame, bscale, bzero) in enumerate(frames):
+                sample = frame[::16, ::16] * np.float32(bscale) + np.float32(bzero)
+                if offset is not None:
+                    sample -= offset[::16, ::16]
+                scales[idx] = np.median(sample)
+
+        bytes_per_row = len(frames) * shape[1] * 4
+        chunk_rows = int(max(1, max_memory // (bytes_per_row * max_workers)))
+
+        if verbose:
+            print("Combining {} frames with {} rows per chunk".format(len(frames), chunk_rows))
+
+        combined = np.empty(shape, dtype=np.float32)
+
+        def _combine_chunk(start):
+            end = min(start + chunk_rows, shape[0])
+
+            stack = np.empty((len(frames), end - start, shape[1]), dtype=np.float32)
+            for idx, (frame, bscale, bzero) in enumerate(frames):
+                stack[idx] = frame[start:end]
+                if bscale != 1 or bzero != 0:
+                    stack[idx] *= bscale
+                    stack[idx] += bzero
+
+            if offset is not None:
+                stack -= offset[start:end]
+
+            if normalize:
+                stack /= scales[:, np.newaxis, np.newaxis]
+
+            combined[start:end] = _combine_stack(stack, method=method, sigma=sigma, iters=iters)
+
+        chunks = range(0, shape[0], chunk_rows)
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # Consume the results so any exceptions are raised here
+                list(executor.map(_combine_chunk, chunks))
+        else:
+            for start in chunks:
+                _combine_chunk(start)
+    finally:
+        for fn in remove_files:
+            os.remove(fn)
+
+    return combined
+
+
+def make_master_bias(fnames, master_fname=None, method='median', **kwargs):
+    """ Make a master bias frame
+
+    Args:
+        fnames(list):           Bias frames, see `combine_frames`.
+        master_fname(str):      If given, the master is written to this FITS file.
+        method(str):            Combine method, see `combine_frames`, defaults to 'median'.
+
+    Returns:
+        np.array:               The master bias.
+    """
+    bias = combine_frames(fnames, method=method, **kwargs)
+
+    if master_fname is not None:
+        _write_master(master_fname, bias, 'BIAS', len(fnames), **kwargs)
+
+    return bias
+
+
+def make_master_dark(fnames, master_bias=None, master_fname=None, method='median', **kwargs):
+    """ Make a master (bias subtracted) dark frame
+
+    Args:
+        fnames(list):           Dark frames, see `combine_frames`.
+        master_bias(np.array):  Master bias to subtract, defaults to None.
+        master_fname(str):      If given, the master is written to this FITS file.
+        method(str):            Combine method, see `combine_frames`, defaults to 'median'.
+
+    Returns:
+        np.array:               The master dark.
+    """
+    dark = combine_frames(fnames, method=method, offset=master_bias, **kwargs)
+
+    if master_fname is not None:
+        _write_master(master_fname, dark, 'DARK', len(fnames), exptime=get_exptime(fnames[0]), **kwargs)
+
+    return dark
+
+
+def make_master_flat(fnames, master_bias=None, master_dark=None, dark_exptime=None,
+                     master_fname=None, method='sigma_clip', **kwargs):
+    """ Make a master flat frame normalized to one
+
+    Each flat is bias and dark subtracted and divided by its own median before combining.
+
+    Args:
+        fnames(list):           Flat frames, see `combine_frames`.
+        master_bias(np.array):  Master bias to subtract, defaults to None.
+        master_dark(np.array):  Master dark to subtract, scaled by exposure time, defaults to None.
+        dark_exptime(float):    Exposure time of `master_dark` in seconds. Required with `master_dark`.
+        master_fname(str):      If given, the master is written to this FITS file.
+        method(str):            Combine method, see `combine_frames`, defaults to 'sigma_clip'.
+
+    Returns:
+        np.array:               The master flat.
+    """
+    offset = master_bias
+    if master_dark is not None:
+        assert dark_exptime, warn("Need the exposure time of the dark to scale it")
+        scaled_dark = master_dark * (get_exptime(fnames[0]) / dark_exptime)
+        offset = scaled_dark if offset is None else offset + scaled_dark
+
+    flat = combine_frames(fnames, method=method, offset=offset, normalize=True, **kwargs)
+    flat /= np.median(flat)
+
+    if master_fname is not None:
+        _write_master(master_fname, flat, 'FLAT', len(fnames), **kwargs)
+
+    return flat
+
+
+def load_masters(bias=None, dark=None, flat=None):
+    """ Load master calibration frames from FITS files
+
+    Args:
+        bias(str):      Filename of master bias, defaults to None.
+        dark(str):      Filename of master dark, defaults to None.
+        flat(str):      Filename of master flat, defaults to None.
+
+    Returns:
+        dict:           The loaded frames (and `dark_exptime`) for `apply_calibration`.
+    """
+    masters = {}
+
+    for name, fname in [('bias', bias), ('dark', dark), ('flat', flat)]:
+        if fname is not None:
+            with fits.open(fname) as hdulist:
+                masters[name] = hdulist[0].data.astype(np.float32)
+                masters['{}_file'.format(name)] = fname
+
+                if name == 'dark':
+                    masters['dark_exptime'] = float(hdulist[0].header.get('EXPTIME', 0))
+
+    return masters
+
+
+def apply_calibration(data, masters, exptime=None):
+    """ Apply master calibration frames to a science frame
+
+    The bias is subtracted, the dark is scaled by exposure time and subtracted
+    and the result is divided by the flat. The arithmetic is done in place.
+
+    Args:
+        data(np.array):     The science frame. If not already float32 it is converted first.
+        masters(dict):      Master frames, see `load_masters`. Filenames are also accepted
+            under the same keys and are loaded.
+        exptime(float):     Exposure time of the science frame in seconds, required to apply a dark.
+
+    Returns:
+        np.array:           The calibrated frame (float32).
+    """
+    if any(isinstance(masters.get(name), str) for name in ['bias', 'dark', 'flat']):
+        masters = load_masters(bias=masters.get('bias'), dark=masters.get('dark'), flat=masters.get('flat'))
+
+    if data.dtype != np.float32 or not data.flags.writeable:
+        data = data.astype(np.float32)
+
+    if masters.get('bias') is not None:
+        np.subtract(data, masters['bias'], out=data)
+
+    if masters.get('dark') is not None:
+        if exptime and masters.get('dark_exptime'):
+            scale = np.float32(exptime / masters['dark_exptime'])
+            data -= masters['dark'] * scale
+        else:
+            warn("Missing exposure time, not applying dark")
+
+    if masters.get('flat') is not None:
+        np.divide(data, masters['flat'], out=data)
+
+    return data
+
+
+def get_exptime(fname):
+    """ Get the exposure time in seconds from a FITS header or the CR2 EXIF """
+    if fname.endswith('.cr2'):
+        exptime = read_exif(fname).get('ExposureTime', 0)
+    else:
+        exptime = fits.getheader(fname).get('EXPTIME', 0)
+
+    return parse_exptime(exptime)
+
+
+def parse_exptime(exptime):
+    """ Convert an exposure time such as '1/30' or 120 to seconds, 0 if unknown """
+    try:
+        exptime = float(Fraction(str(exptime)))
+    except ValueError:
+        exptime = 0.
+
+    return exptime
+
+
+def _combine_stack(stack, method='median', sigma=3.0, iters=3):
+    """ Combine along the first axis of `stack` """
+    if method == 'median':
+        return np.median(stack, axis=0)
+
+    if method == 'mean':
+        return np.mean(stack, axis=0)
+
+    # Sigma-clipped mean. Clipped values are marked with NaN.
+    for _ in range(iters):
+        center = np.nanmedian(stack, axis=0)
+        std = np.nanstd(stack, axis=0)
+
+        with np.errstate(invalid='ignore'):
+            clip = np.abs(stack - center) > sigma * std
+
+        if not clip.any():
+            break
+
+        stack[clip] = np.nan
+
+    with np.errstate(invalid='ignore'):
+        return np.nanmean(stack, axis=0)
+
+
+def _open_frames(fnames, max_workers=1, **kwargs):
+    """ Memory map each of the frames, decoding CR2 files in parallel
+
+    FITS data is mapped without scaling (astropy can't memory map scaled data, such as
+    unsigned ints stored with BZERO) so the scaling is returned along with each frame.
+
+    Returns:
+        tuple:  List of (array, bscale, bzero) and list of temporary files to remove when done.
+    """
+    cr2_files = [fn for fn in fnames if fn.endswith('.cr2')]
+    pgm_lookup = {}
+
+    if cr2_files:
+        # Imported here as `conversions` uses this module when calibrating
+        from .conversions import cr2_to_pgm
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pgm_lookup = dict(zip(cr2_files, executor.map(lambda fn: cr2_to_pgm(fn, **kwargs), cr2_files)))
+
+    frames = []
+    for fn in fnames:
+        if fn in pgm_lookup:
+            frames.append((read_pgm(pgm_lookup[fn], memmap=True), 1, 0))
+        elif fn.endswith('.pgm'):
+            frames.append((read_pgm(fn, memmap=True), 1, 0))
+        else:
+            with fits.open(fn, memmap=True, do_not_scale_image_data=True) as hdulist:
+                header = hdulist[0].header
+                frames.append((hdulist[0].data, header.get('BSCALE', 1), header.get('BZERO', 0)))
+
+    return frames, list(pgm_lookup.values())
+
+
+def _write_master(fname, data, image_type, num_frames, exptime=None, clobber=True, **kwargs):
+    hdu = fits.PrimaryHDU(data)
+    hdu.header.set('IMAGETYP', image_type)
+    hdu.header.set('NCOMBINE', num_frames)
+    if exptime is not None:
+        hdu.header.set('EXPTIME', exptime)
+
+    hdu.writeto(fname, output_verify='silentfix', clobber=clobber)
@@ -0,0 +1,236 @@
+import os
+import sqlite3
+
+from warnings import warn
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.time import Time
+from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+
+
+class ImageCatalog(object):
+
+    """ A queryable catalog of image metadata
+
+    Each image written by `cr2_to_fits` and `process_cr2` is recorded in a small SQLite
+    database so that finding images (e.g. all of the images for a target over a date range)
+    is a single indexed query rather than a `glob` of the filesystem followed by opening every
+    file to read the header.
+
+    Images are keyed by the path of the raw (CR2) file. Adding an image that already exists
+    updates the columns that are given and leaves the others alone, so information can be
+    added as it becomes known (e.g. after a plate solve).
+    """
+
+    columns = [
+        ('path', 'TEXT PRIMARY KEY'),
+        ('fits_file', 'TEXT'),
+        ('directory', 'TEXT'),
+        ('target', 'TEXT'),
+        ('camera_id', 'TEXT'),
+        ('visit_num', 'INTEGER'),
+        ('exp_num', 'INTEGER'),
+        ('date_obs', 'TEXT'),
+        ('mjd', 'REAL'),
+        ('exptime', 'REAL'),
+        ('ra_center', 'REAL'),
+        ('dec_center', 'REAL'),
+        ('pixscale', 'REAL'),
+        ('orientation', 'REAL'),
+        ('solved', 'INTEGER DEFAULT 0'),
+        ('sky_level', 'REAL'),
+        ('sky_rms', 'REAL'),
+    ]
+
+    def __init__(self, db_file=None):
+        if db_file is None:
+            db_file = '{}/data/images.sqlite'.format(os.getenv('PANDIR', default='/var/panoptes'))
+
+        self.db_file = db_file
+        self.column_names = [name for name, _ in self.columns]
+
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS images ({})'.format(
+                ', '.join('{} {}'.format(name, col_type) for name, col_type in self.columns)))
+            conn.execute('CREATE INDEX IF NOT EXISTS images_target_mjd ON images (target, mjd)')
+            conn.execute('CREATE INDEX IF NOT EXISTS images_mjd ON images (mjd)')
+            conn.execute('CREATE INDEX IF NOT EXISTS images_directory ON images (directory, path)')
+
+    def add_image(self, path, **info):
+        """ Add (or update) an image in the catalog
+
+        Args:
+            path(str):      Path to the raw image.
+            **info:         Values for the other columns, see `columns`. Unknown keys are
+                ignored. If `date_obs` is given and `mjd` isn't then it is calculated.
+        """
+        path = os.path.abspath(path)
+
+        values = dict((k, v) for k, v in info.items() if k in self.column_names and v is not None)
+        values['directory'] = os.path.dirname(path)
+
+        if 'date_obs' in values and 'mjd' not in values:
+            try:
+                values['mjd'] = Time(values['date_obs']).mjd
+            except ValueError:
+                pass
+
+        names = sorted(values.keys())
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO images (path) VALUES (?)', (path,))
+            conn.execute('UPDATE images SET {} WHERE path = ?'.format(', '.join('{} = ?'.format(n) for n in names)),
+                         [values[n] for n in names] + [path])
+
+    def get_images(self, target=None, directory=None, prefix=None, start=None, end=None, solved=None,
+                   camera_id=None):
+        """ Find images in the catalog
+
+        Args:
+            target(str):        Target name.
+            directory(str):     Directory the images are in.
+            prefix(str):        Start of the image filename (only used with `directory`).
+            start(Time):        Only images taken at or after this time (`astropy.time.Time` or
+                anything `Time` accepts).
+            end(Time):          Only images taken before this time.
+            solved(bool):       Only (un)solved images.
+            camera_id(str):     Only images from this camera.
+
+        Returns:
+            list(dict):         Matching rows, ordered by path.
+        """
+        where = []
+        params = []
+
+        if target is not None:
+            where.append('target = ?')
+            params.append(target)
+
+        if directory is not None:
+            directory = os.path.abspath(directory)
+            where.append('directory = ?')
+            params.append(directory)
+
+            if prefix:
+                # Compare on path range so the index can be used
+                start_path = os.path.join(directory, prefix)
+                where.append('path >= ? AND path < ?')
+                params.extend([start_path, start_path + '\uffff'])
+
+        if start is not None:
+            where.append('mjd >= ?')
+            params.append(Time(start).mjd)
+
+        if end is not None:
+            where.append('mjd < ?')
+            params.append(Time(end).mjd)
+
+        if solved is not None:
+            where.append('solved = ?')
+            params.append(int(solved))
+
+        if camera_id is not None:
+            where.append('camera_id = ?')
+            params.append(camera_id)
+
+        query = 'SELECT * FROM images'
+        if where:
+            query = '{} WHERE {}'.format(query, ' AND '.join(where))
+        query = '{} ORDER BY path'.format(query)
+
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def get_image(self, path):
+        """ Get the catalog entry for a single image, None if not found """
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM images WHERE path = ?', (os.path.abspath(path),)).fetchone()
+
+        return dict(row) if row is not None else None
+
+    def remove_image(self, path):
+        """ Remove an image from the catalog """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM images WHERE path = ?', (os.path.abspath(path),))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        conn.row_factory = sqlite3.Row
+
+        return _Connection(conn)
+
+
+def add_to_catalog(path, catalog=None, **info):
+    """ Add an image to a catalog, only warning if there is a problem
+
+    Args:
+        path(str):          Path to the raw image.
+        catalog:            An `ImageCatalog`, a database filename or None (the default) for
+            the default catalog. If False, nothing is done.
+        **info:             Column values, see `ImageCatalog.add_image`.
+    """
+    if catalog is False:
+        return
+
+    try:
+        if not isinstance(catalog, ImageCatalog):
+            catalog = ImageCatalog(db_file=catalog)
+
+        catalog.add_image(path, **info)
+    except Exception as e:
+        warn("Can't add image to catalog: {}".format(e))
+
+
+def get_wcs_center(header):
+    """ Get the center and pixel scale of an image from its WCS header
+
+    Args:
+        header(dict):   FITS header (or a dict of header values) containing a WCS.
+
+    Returns:
+        dict:   `ra_center`, `dec_center` (degrees) and `pixscale` (arcsec/pixel), empty
+            if there is no WCS.
+    """
+    if 'CRVAL1' not in header:
+        return {}
+
+    wcs_header = fits.Header()
+    for key in ['NAXIS1', 'NAXIS2', 'IMAGEW', 'IMAGEH', 'CTYPE1', 'CTYPE2', 'CRVAL1', 'CRVAL2',
+                'CRPIX1', 'CRPIX2', 'CD1_1', 'CD1_2', 'CD2_1', 'CD2_2', 'CUNIT1', 'CUNIT2']:
+        if key in header:
+            wcs_header[key] = header[key]
+
+    width = wcs_header.get('IMAGEW', wcs_header.get('NAXIS1', 2 * wcs_header['CRPIX1']))
+    height = wcs_header.get('IMAGEH', wcs_header.get('NAXIS2', 2 * wcs_header['CRPIX2']))
+
+    wcs = WCS(wcs_header, naxis=2)
+    ra, dec = wcs.all_pix2world([[(width + 1) / 2., (height + 1) / 2.]], 1)[0]
+
+    return {
+        'ra_center': float(ra),
+        'dec_center': float(dec),
+        'pixscale': float(np.mean(proj_plane_pixel_scales(wcs)) * 3600),
+    }
+
+
+class _Connection(object):
+
+    """ Commit (or roll back) and close the connection when done """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
@@ -9,9 +9,15 @@ from dateutil import parser as date_parser
 
 from pocs.utils import current_time
 from pocs.utils import error
+from pocs.utils.executor import get_executor
 from pocs.version import version
 
+from .background import get_background
 from .calculations import get_solve_field
+from .calibration import apply_calibration
+from .calibration import parse_exptime
+from .catalog import add_to_catalog
+from .catalog import get_wcs_center
 from .io import read_exif
 from .io import read_pgm
 from .metadata import *
@@ -68,6 +74,8 @@ def process_cr2(cr2_fname, to_fits=True, fits_headers={}, solve=False, make_pret
                     pprint(solve_info)
 
                 processed_info.update(solve_info)
+
+                add_to_catalog(cr2_fname, catalog=kwargs.get('catalog'), solved=True, **get_wcs_center(solve_info))
             except error.PanError as e:
                 warn("Timeout while solving: {}".format(e))
             except Exception as e:
@@ -97,7 +105,8 @@ def process_cr2(cr2_fname, to_fits=True, fits_headers={}, solve=False, make_pret
     """
 
 
-def cr2_to_fits(cr2_fname, fits_fname=None, clobber=False, fits_headers={}, remove_cr2=False, **kwargs):
+def cr2_to_fits(cr2_fname, fits_fname=None, clobber=False, fits_headers={}, remove_cr2=False, calibration=None,
+                catalog=None, **kwargs):
     """ Convert a CR2 file to FITS
 
     This is a convenience function that first converts the CR2 to PGM via `cr2_to_pgm`. Also adds keyword headers
@@ -117,6 +126,10 @@ def cr2_to_fits(cr2_fname, fits_fname=None, clobber=False, fits_headers={}, remo
         fits_headers {dict} -- Header values to be saved with the FITS, by default includes the EXIF
             info from the CR2 (default: {{}})
         remove_cr2 {bool} -- A bool indicating if the CR2 should be removed (default: {False})
+        calibration {dict} -- Master bias/dark/flat frames (or their filenames) that are applied
+            to the data before saving, see `calibration.apply_calibration` (default: {None})
+        catalog {ImageCatalog} -- Catalog to record the image in, see `catalog.add_to_catalog`. If
+            None the default catalog is used, False skips the catalog (default: {None})
 
     """
 
@@ -135,6 +148,12 @@ def cr2_to_fits(cr2_fname, fits_fname=None, clobber=False, fits_headers={}, remo
         # Add the EXIF information from the CR2 file
         exif = read_exif(cr2_fname)
 
+        if calibration is not None:
+            if verbose:
+                print("Applying calibration frames")
+
+            pgm = apply_calibration(pgm, calibration, exptime=parse_exptime(exif.get('ExposureTime', 0)))
+
         # Set the PGM as the primary data for the FITS file
         hdu = fits.PrimaryHDU(pgm)
 
@@ -158,6 +177,12 @@ def cr2_to_fits(cr2_fname, fits_fname=None, clobber=False, fits_headers={}, remo
         hdu.header.set('BLU-BAL', exif.get('BlueBalance', ''))
         hdu.header.set('WB-RGGB', exif.get('WB_RGGBLevelAsShot', ''))
 
+        if calibration is not None:
+            for name in ['bias', 'dark', 'flat']:
+                fname = calibration.get('{}_file'.format(name), calibration.get(name))
+                if isinstance(fname, str):
+                    hdu.header.set('CAL-{}'.format(name.upper()), os.path.basename(fname))
+
         if verbose:
             print("Adding provided FITS header")
 
@@ -178,6 +203,27 @@ def cr2_to_fits(cr2_fname, fits_fname=None, clobber=False, fits_headers={}, remo
             if remove_cr2:
                 os.unlink(cr2_fname)
 
+            if catalog is not False:
+                # Quick sky values as a quality measure, but not when something is waiting on
+                # this image (e.g. the pointing solve)
+                sky_info = {}
+                if kwargs.get('priority', 'normal') != 'critical':
+                    try:
+                        sky_info = get_background(pgm, subsample=3)
+                    except Exception as e:
+                        warn("Can't measure sky background: {}".format(e))
+
+                add_to_catalog(cr2_fname, catalog=catalog,
+                               fits_file=fits_fname,
+                               target=fits_headers.get('object', fits_headers.get('title')),
+                               camera_id=fits_headers.get('detname'),
+                               visit_num=fits_headers.get('visit'),
+                               exp_num=fits_headers.get('exp_num'),
+                               date_obs=hdu.header.get('DATE-OBS'),
+                               exptime=parse_exptime(exif.get('ExposureTime', 0)),
+                               sky_level=sky_info.get('sky_level'),
+                               sky_rms=sky_info.get('sky_rms'))
+
     return fits_fname
 
 
@@ -222,7 +268,7 @@ def cr2_to_pgm(cr2_fname, pgm_fname=None, dcraw='/usr/bin/dcraw', clobber=True,
                 print("PGM Conversion command: \n {}".format(cmd_list))
 
             # Run the command
-            if subprocess.check_call(cmd_list) == 0:
+            if get_executor().check_call('dcraw', cmd_list, priority=kwargs.get('priority', 'normal')) == 0:
                 if verbose:
                     print("PGM Conversion command successful")
 
@@ -268,7 +314,8 @@ def make_pretty_image(fname, timeout=15, **kwargs):
         print(cmd)
 
     try:
-        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        proc = get_executor().run('cr2_to_jpg', cmd, priority='background', timeout=timeout,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         if verbose:
             print(proc)
     except OSError as e:
@@ -0,0 +1,155 @@
+import json
+import os
+
+from warnings import warn
+
+import numpy as np
+
+from astropy.io import fits
+
+from pocs.utils import current_time
+
+
+class SolveHints(object):
+
+    """ Hints for `solve_field` learnt from previous solves
+
+    The pixel scale, orientation, parity and image size of each camera are recorded from
+    every successful solve and kept in a small JSON file. These are then used to narrow
+    down the search of astrometry.net for the next solves with the same camera (scale
+    bounds, parity and a downsample suited to the image size), which makes a big difference
+    to the solve time compared with a blind solve.
+    """
+
+    def __init__(self, hints_file=None, scale_tolerance=0.05, num_scales=10):
+        if hints_file is None:
+            hints_file = '{}/data/solve_hints.json'.format(os.getenv('PANDIR', default='/var/panoptes'))
+
+        self.hints_file = hints_file
+        self.scale_tolerance = scale_tolerance
+        self.num_scales = num_scales
+
+        self._hints = {}
+        if os.path.exists(self.hints_file):
+            try:
+                with open(self.hints_file, 'r') as f:
+                    self._hints = json.load(f)
+            except (OSError, ValueError) as e:
+                warn("Can't read solve hints: {}".format(e))
+
+    def get_hint(self, camera_id='default'):
+        """ The hint for a camera or an empty dict if there isn't one """
+        return self._hints.get(camera_id or 'default', {})
+
+    def record(self, header, camera_id=None):
+        """ Record a solve
+
+        Args:
+            header(dict):       FITS header of a solved image (e.g. the `.new` file).
+            camera_id(str):     Camera used, defaults to the `DETNAME` in the header.
+
+        Returns:
+            dict:   The updated hint for the camera, empty if the header has no WCS.
+        """
+        if 'CD1_1' not in header:
+            return {}
+
+        camera_id = camera_id or header.get('DETNAME') or 'default'
+
+        cd = np.array([[float(header['CD1_1']), float(header.get('CD1_2', 0))],
+                       [float(header.get('CD2_1', 0)), float(header['CD2_2'])]])
+        det = np.linalg.det(cd)
+
+        hint = self._hints.get(camera_id, {})
+
+        pixscale = float(np.sqrt(abs(det)) * 3600)
+        hint['pixscales'] = (hint.get('pixscales', []) + [pixscale])[-self.num_scales:]
+        hint['pixscale'] = float(np.median(hint['pixscales']))
+
+        # astrometry.net calls a negative determinant (i.e. north up, east left) positive parity
+        hint['parity'] = 'pos' if det < 0 else 'neg'
+        hint['orientation'] = float(np.degrees(np.arctan2(cd[0, 1], cd[1, 1])))
+
+        width = header.get('IMAGEW', header.get('NAXIS1'))
+        height = header.get('IMAGEH', header.get('NAXIS2'))
+        if width and height:
+            hint['imagew'] = int(width)
+            hint['imageh'] = int(height)
+            hint['fieldw'] = hint['pixscale'] * max(hint['imagew'], hint['imageh']) / 3600.
+
+        hint['updated'] = current_time().isot
+
+        self._hints[camera_id] = hint
+        self.save()
+
+        return hint
+
+    def get_options(self, camera_id=None, header={}, ra=None, dec=None, radius=None):
+        """ Options for `solve-field` for an image from `camera_id`
+
+        Args:
+            camera_id(str):     Camera used, defaults to the `DETNAME` in `header`.
+            header(dict):       FITS header of the image to be solved, used for the camera and
+                (if not given) the RA/Dec of the pointing.
+            ra(float):          RA guess in degrees.
+            dec(float):         Dec guess in degrees.
+            radius(float):      Search radius in degrees, defaults to the field width.
+
+        Returns:
+            list:   Options to add to the `solve-field` command, empty if there is no hint.
+        """
+        hint = self.get_hint(camera_id or header.get('DETNAME'))
+
+        options = []
+        if not hint:
+            return options
+
+        options.extend([
+            '--scale-units', 'arcsecperpix',
+            '--scale-low', '{:.4f}'.format(hint['pixscale'] * (1 - self.scale_tolerance)),
+            '--scale-high', '{:.4f}'.format(hint['pixscale'] * (1 + self.scale_tolerance)),
+            '--parity', hint['parity'],
+        ])
+
+        # Keep about 1300 pixels across the downsampled image
+        if 'imagew' in hint:
+            downsample = max(1, int(round(max(hint['imagew'], hint['imageh']) / 1300.)))
+            options.extend(['--downsample', str(downsample)])
+
+        if ra is None and dec is None:
+            try:
+                ra = float(header['RA'])
+                dec = float(header['DEC'])
+            except (KeyError, ValueError, TypeError):
+                pass
+
+        if ra is not None and dec is not None:
+            if radius is None:
+                radius = hint.get('fieldw', 15.0)
+
+            options.extend(['--ra', str(ra), '--dec', str(dec), '--radius', str(radius)])
+
+        return options
+
+    def save(self):
+        """ Write the hints to `hints_file` """
+        try:
+            tmp_file = '{}.tmp'.format(self.hints_file)
+            with open(tmp_file, 'w') as f:
+                json.dump(self._hints, f, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.hints_file)
+        except OSError as e:
+            warn("Can't save solve hints: {}".format(e))
+
+
+def read_header(fname):
+    """ Header of a FITS file, empty for other files """
+    header = {}
+
+    if fname.endswith('.fits') or fname.endswith('.new'):
+        try:
+            header = fits.getheader(fname)
+        except OSError:
+            pass
+
+    return header
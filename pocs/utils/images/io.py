@@ -8,6 +8,7 @@ import numpy as np
 from json import loads
 
 from .. import error
+from ..executor import get_executor
 
 
 def read_exif(fname, exiftool='/usr/bin/exiftool'):
@@ -37,14 +38,14 @@ def read_exif(fname, exiftool='/usr/bin/exiftool'):
         cmd_list = command.split()
 
         # Run the command
-        exif = loads(subprocess.check_output(cmd_list).decode('utf-8'))
+        exif = loads(get_executor().check_output('exiftool', cmd_list).decode('utf-8'))
     except subprocess.CalledProcessError as err:
         raise error.InvalidSystemCommand(msg="File: {} \n err: {}".format(fname, err))
 
     return exif[0]
 
 
-def read_pgm(fname, byteorder='>', remove_after=False):
+def read_pgm(fname, byteorder='>', remove_after=False, memmap=False):
     """Return image data from a raw PGM file as numpy array.
 
     Note:
@@ -61,18 +62,25 @@ def read_pgm(fname, byteorder='>', remove_after=False):
         byteorder(str):     Big endian
         remove_after(bool): Delete fname file after reading, defaults to False.
         clobber(bool):      Clobber existing PGM or not, defaults to True
+        memmap(bool):       Return a read-only memory map of the file instead of reading it,
+            defaults to False. Can't be combined with `remove_after`.
 
     Returns:
         numpy.array:        The raw data from the PGMx
 
     """
 
-    with open(fname, 'rb') as f:
-        buffer = f.read()
+    assert not (memmap and remove_after), warn("Can't remove a memory mapped PGM")
 
     # We know our header info is 19 chars long
     header_offset = 19
 
+    with open(fname, 'rb') as f:
+        if memmap:
+            buffer = f.read(header_offset)
+        else:
+            buffer = f.read()
+
     img_type, img_size, img_max_value, _ = buffer[0:header_offset].decode().split('\n')
 
     assert img_type == 'P5', warn("No a PGM file")
@@ -80,9 +88,13 @@ def read_pgm(fname, byteorder='>', remove_after=False):
     # Get the width and height (as strings)
     width, height = img_size.split(' ')
 
-    data = np.flipud(np.frombuffer(buffer[header_offset:],
-                                   dtype=byteorder + 'u2',
-                                   ).reshape((int(height), int(width))))
+    if memmap:
+        data = np.flipud(np.memmap(fname, dtype=byteorder + 'u2', mode='r', offset=header_offset,
+                                   shape=(int(height), int(width))))
+    else:
+        data = np.flipud(np.frombuffer(buffer[header_offset:],
+                                       dtype=byteorder + 'u2',
+                                       ).reshape((int(height), int(width))))
 
     if remove_after:
         os.remove(fname)
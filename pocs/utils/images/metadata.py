@@ -4,8 +4,14 @@ import shutil
 import subprocess
 import warnings
 
+import numpy as np
+
 from astropy import units as u
 from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from pocs.utils.executor import get_executor
 
 from .calculations import *
 from .conversions import *
@@ -39,7 +45,8 @@ def get_wcsinfo(fits_fname, verbose=False):
     if verbose:
         print("wcsinfo command: {}".format(run_cmd))
 
-    proc = subprocess.Popen(run_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    proc = get_executor().run('wcsinfo', run_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True)
     try:
         output, errs = proc.communicate(timeout=5)
     except subprocess.TimeoutExpired:
@@ -114,7 +121,7 @@ def get_target_position(target, wcs_file, verbose=False):
     if verbose:
         print("wcsinfo command: {}".format(run_cmd))
 
-    result = subprocess.check_output(run_cmd)
+    result = get_executor().check_output('wcs-rd2xy', run_cmd)
     lines = result.decode('utf-8').split('\n')
     if verbose:
         print("Result: {}".format(result))
@@ -134,3 +141,89 @@ def get_target_position(target, wcs_file, verbose=False):
     if verbose:
         print("Target center: {}".format(target_center))
     return target_center
+
+
+def propagate_wcs(wcs_info, shift=(0, 0), rotation=0 * u.degree):
+    """ Derive the WCS of a frame from a solved frame and the offset between them
+
+    Rather than plate-solving every frame of a visit, the WCS of a solved frame (e.g.
+    the guide image) is moved by the shift (and rotation) measured between the frames
+    with `measure_offset`. Only the linear (TAN) part of the WCS is propagated, any
+    distortion terms of the solve are dropped, so this is only good for small offsets.
+
+    Args:
+        wcs_info(dict):         WCS information of the solved frame as returned by `get_wcsinfo`.
+        shift(tuple):           The (row, column) shift in pixels that registers the new frame
+            with the solved frame, i.e. the `shift` from `measure_offset`.
+        rotation(u.Quantity):   Rotation of the new frame about the image center relative
+            to the solved frame, defaults to 0 degrees.
+
+    Returns:
+        dict:   WCS information for the new frame, in the same format as `get_wcsinfo`.
+    """
+    dy, dx = shift
+    theta = rotation.to(u.radian).value
+
+    width = wcs_info['imagew'].value
+    height = wcs_info['imageh'].value
+    center = np.array([(width + 1) / 2., (height + 1) / 2.])
+
+    # Pixel in the solved frame for a pixel in the new frame: R (p - c) + c + shift
+    rotate = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+
+    cd = np.array([[wcs_info['cd11'].value, wcs_info['cd12'].value],
+                   [wcs_info['cd21'].value, wcs_info['cd22'].value]])
+    crpix = np.array([wcs_info['crpix0'].value, wcs_info['crpix1'].value])
+
+    new_cd = cd.dot(rotate)
+    new_crpix = center + rotate.T.dot(crpix - center - np.array([dx, dy]))
+
+    new_info = dict(wcs_info)
+    new_info.pop('wcs_file', None)
+    new_info.update({
+        'crpix0': new_crpix[0] * u.pixel,
+        'crpix1': new_crpix[1] * u.pixel,
+        'cd11': new_cd[0, 0] * (u.deg / u.pixel),
+        'cd12': new_cd[0, 1] * (u.deg / u.pixel),
+        'cd21': new_cd[1, 0] * (u.deg / u.pixel),
+        'cd22': new_cd[1, 1] * (u.deg / u.pixel),
+        'propagated': True,
+        'shift': (dy, dx),
+    })
+
+    if 'orientation' in wcs_info:
+        new_info['orientation'] = wcs_info['orientation'] + rotation.to(u.degree)
+
+    ra_center, dec_center = _make_wcs(new_info).all_pix2world([center], 1)[0]
+    new_info['ra_center'] = ra_center * u.degree
+    new_info['dec_center'] = dec_center * u.degree
+
+    return new_info
+
+
+def get_wcs_header(wcs_info):
+    """ Create FITS header cards for the (linear) WCS in `wcs_info`
+
+    Args:
+        wcs_info(dict):     WCS information as returned by `get_wcsinfo` or `propagate_wcs`.
+
+    Returns:
+        `astropy.io.fits.Header`:   Header with the WCS keywords.
+    """
+    header = _make_wcs(wcs_info).to_header()
+
+    if wcs_info.get('propagated', False):
+        header.set('WCS-PROP', True, 'WCS propagated from a solved frame')
+
+    return header
+
+
+def _make_wcs(wcs_info):
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crval = [wcs_info['crval0'].value, wcs_info['crval1'].value]
+    wcs.wcs.crpix = [wcs_info['crpix0'].value, wcs_info['crpix1'].value]
+    wcs.wcs.cd = [[wcs_info['cd11'].value, wcs_info['cd12'].value],
+                  [wcs_info['cd21'].value, wcs_info['cd22'].value]]
+
+    return wcs
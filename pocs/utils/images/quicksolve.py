@@ -0,0 +1,174 @@
+import os
+import subprocess
+
+from warnings import warn
+
+import numpy as np
+
+from astropy import units as u
+from astropy.io import fits
+
+from .calculations import solve_field
+from .conversions import cr2_to_pgm
+from .hints import SolveHints
+from .io import read_pgm
+from .metadata import get_wcsinfo
+
+
+def bin_data(data, binning=4):
+    """ Sum `binning` x `binning` blocks of pixels
+
+    The raw data of a colour camera is a Bayer mosaic, so an even `binning` sums whole
+    colour cells. Rows and columns that don't fill a block are dropped.
+
+    Args:
+        data(np.array):     Image data.
+        binning(int):       Pixels per block on each side, defaults to 4.
+
+    Returns:
+        np.array:   The binned data, as float32.
+    """
+    rows = (data.shape[0] // binning) * binning
+    cols = (data.shape[1] // binning) * binning
+
+    blocks = data[:rows, :cols].astype(np.float32).reshape(rows // binning, binning, cols // binning, binning)
+
+    return blocks.sum(axis=(1, 3))
+
+
+def quick_solve(fname, ra=None, dec=None, radius=2.0, binning=4, box_width=None, timeout=10,
+                camera_id=None, fits_headers={}, priority='critical', remove_after=True):
+    """ Plate-solve a binned (and optionally cropped) copy of an image
+
+    This is much faster than solving the full image, so it is meant for the pointing
+    iterations where only the center of the field is needed. The solve is limited to
+    `radius` around the expected position and, if the camera has been solved before (see
+    `SolveHints`), to the known pixel scale and parity.
+
+    The WCS that is returned is for the pixels of the full (unbinned) image, so it can be
+    used like the WCS of a full solve.
+
+    Args:
+        fname(str):         The CR2 or FITS file to solve.
+        ra(float):          Expected RA of the center in degrees.
+        dec(float):         Expected Dec of the center in degrees.
+        radius(float):      Search radius around `ra` and `dec` in degrees, defaults to 2.
+        binning(int):       Binning of the image that is solved, defaults to 4.
+        box_width(int):     Only solve a box of this width (full image pixels) around the
+            center, defaults to None (the whole image).
+        timeout(int):       Seconds to allow for the solve, defaults to 10.
+        camera_id(str):     Camera for the hints.
+        fits_headers(dict): Extra headers for the binned FITS file.
+        priority(str):      Executor priority, defaults to 'critical'.
+        remove_after(bool): Remove the binned files when done, defaults to True.
+
+    Returns:
+        dict:   WCS information as returned by `get_wcsinfo` (without a `wcs_file`, as
+            that is the binned file), empty if the image didn't solve.
+    """
+    base = os.path.splitext(fname)[0]
+    quick_fname = '{}_quick.fits'.format(base)
+    solved_fname = '{}_quick.new'.format(base)
+
+    if fname.endswith('.cr2'):
+        data = read_pgm(cr2_to_pgm(fname, priority=priority), remove_after=True)
+    else:
+        data = fits.getdata(fname)
+
+    # Where the solved box starts in the full image
+    origin = (0, 0)
+    if box_width is not None and box_width < min(data.shape):
+        row0 = data.shape[0] // 2 - box_width // 2
+        col0 = data.shape[1] // 2 - box_width // 2
+        data = data[row0:row0 + box_width, col0:col0 + box_width]
+        origin = (row0, col0)
+
+    binned = bin_data(data, binning=binning)
+
+    header = fits.Header()
+    for key, value in fits_headers.items():
+        try:
+            header.set(key.upper()[0:8], value)
+        except Exception:
+            pass
+    if ra is not None and dec is not None:
+        header.set('RA', ra)
+        header.set('DEC', dec)
+
+    fits.writeto(quick_fname, binned, header=header, overwrite=True)
+
+    options = [
+        '--cpulimit', str(timeout),
+        '--no-verify',
+        '--no-plots',
+        '--crpix-center',
+        '--overwrite',
+        '--downsample', '2',
+        '--objs', '100',
+    ]
+
+    hint = SolveHints().get_hint(camera_id)
+    if 'pixscale' in hint:
+        pixscale = hint['pixscale'] * binning
+        options.extend([
+            '--scale-units', 'arcsecperpix',
+            '--scale-low', '{:.4f}'.format(pixscale * 0.95),
+            '--scale-high', '{:.4f}'.format(pixscale * 1.05),
+            '--parity', hint['parity'],
+        ])
+    else:
+        options.append('--guess-scale')
+
+    if ra is not None and dec is not None:
+        options.extend(['--ra', str(ra), '--dec', str(dec), '--radius', str(radius)])
+
+    if os.getenv('PANTEMP'):
+        options.extend(['--temp-dir', os.getenv('PANTEMP')])
+
+    wcs_info = {}
+    try:
+        proc = solve_field(quick_fname, solve_opts=options, priority=priority)
+        try:
+            proc.communicate(timeout=timeout + 5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+
+        if os.path.exists(solved_fname):
+            wcs_info = _unbin_wcsinfo(get_wcsinfo(solved_fname), binning, origin)
+    except Exception as e:
+        warn("Problem with quick solve: {}".format(e))
+    finally:
+        if remove_after:
+            for fn in [quick_fname, solved_fname]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    return wcs_info
+
+
+def _unbin_wcsinfo(wcs_info, binning, origin=(0, 0)):
+    """ WCS information of a binned image in the pixels of the full image """
+    if 'cd11' not in wcs_info:
+        return {}
+
+    row0, col0 = origin
+
+    full_info = dict(wcs_info)
+    full_info.pop('wcs_file', None)
+
+    for key in ['cd11', 'cd12', 'cd21', 'cd22', 'pixscale']:
+        if key in full_info:
+            full_info[key] = full_info[key] / binning
+
+    for key in ['imagew', 'imageh']:
+        if key in full_info:
+            full_info[key] = full_info[key] * binning
+
+    # Center of a binned pixel in full image pixels (FITS pixels start at 1)
+    full_info['crpix0'] = ((wcs_info['crpix0'].value - 0.5) * binning + 0.5 + col0) * u.pixel
+    full_info['crpix1'] = ((wcs_info['crpix1'].value - 0.5) * binning + 0.5 + row0) * u.pixel
+
+    full_info['binning'] = binning
+
+    return full_info
@@ -0,0 +1,188 @@
+import numpy as np
+
+from astropy.io import fits
+
+
+class ImageStack(object):
+
+    """ A running shift-and-add co-add of a set of frames.
+
+    Frames are added one at a time as they arrive so only the accumulators are kept
+    in memory, never the individual frames. Each frame is shifted by a whole number
+    of Bayer cells (i.e. an even number of pixels) so that the RGGB pattern of the
+    raw data still lines up in the co-add.
+
+    Two accumulation methods are supported:
+
+    * `mean`: a plain running mean.
+    * `clipped_mean`: a running mean (and variance, with Welford's algorithm) where
+      a new pixel value is rejected if it is more than `sigma` standard deviations
+      from the current mean of that pixel. Clipping only starts once a pixel has
+      `min_frames` values, so the first few frames are always accepted.
+
+    The accumulators are the size of the first frame, any part of a shifted frame
+    that falls outside of this is dropped. The number of values contributing to each
+    pixel is kept so the edges are still correct.
+    """
+
+    def __init__(self, method='mean', sigma=3.0, min_frames=3, bayer=True):
+        assert method in ['mean', 'clipped_mean'], "Unknown stacking method: {}".format(method)
+
+        self.method = method
+        self.sigma = sigma
+        self.min_frames = min_frames
+        self.bayer = bayer
+
+        self.reset()
+
+##################################################################################################
+# Properties
+##################################################################################################
+
+    @property
+    def num_frames(self):
+        """ Number of frames that have been added """
+        return self._num_frames
+
+    @property
+    def shape(self):
+        return None if self._mean is None else self._mean.shape
+
+##################################################################################################
+# Methods
+##################################################################################################
+
+    def reset(self):
+        """ Clear the accumulators """
+        self._mean = None
+        self._m2 = None
+        self._count = None
+        self._num_frames = 0
+        self.shifts = []
+
+    def add(self, data, shift=(0, 0)):
+        """ Shift-and-add a frame to the stack
+
+        Args:
+            data(np.array):     The frame to add.
+            shift(tuple):       The (row, column) shift that registers `data` with the first
+                frame, as returned in the 'shift' of `measure_offset`. It is rounded to whole
+                pixels (or Bayer cells, see `bayer`).
+
+        Returns:
+            tuple:              The (row, column) shift in pixels that was applied.
+        """
+        assert data.ndim == 2, "Can only stack 2D frames"
+
+        if self._mean is None:
+            self._mean = np.zeros(data.shape, dtype=np.float32)
+            self._count = np.zeros(data.shape, dtype=np.uint16)
+            if self.method == 'clipped_mean':
+                self._m2 = np.zeros(data.shape, dtype=np.float32)
+
+        assert data.shape == self.shape, "Frame {} does not match stack {}".format(data.shape, self.shape)
+
+        dy, dx = [self._round_shift(s) for s in shift]
+
+        dst, src = self._overlap(dy, dx)
+        if dst is not None:
+            self._accumulate(dst, data[src].astype(np.float32))
+
+        self._num_frames += 1
+        self.shifts.append((dy, dx))
+
+        return dy, dx
+
+    def get_stack(self):
+        """ Get the co-added image
+
+        Returns:
+            np.array:   The stacked frame, NaN where no frame contributed.
+        """
+        assert self._mean is not None, "No frames have been added"
+
+        stack = self._mean.copy()
+        stack[self._count == 0] = np.nan
+
+        return stack
+
+    def get_coverage(self):
+        """ Number of frames contributing to each pixel """
+        assert self._count is not None, "No frames have been added"
+
+        return self._count.copy()
+
+    def write(self, fname, fits_headers={}, clobber=True):
+        """ Write the stack to a FITS file
+
+        The coverage map is saved in a second extension.
+
+        Args:
+            fname(str):             Name of the FITS file.
+            fits_headers(dict):     Additional header values.
+            clobber(bool):          Overwrite an existing file, defaults to True.
+
+        Returns:
+            str:                    The filename.
+        """
+        hdu = fits.PrimaryHDU(self.get_stack())
+        hdu.header.set('NCOMBINE', self.num_frames)
+        hdu.header.set('COMBTYPE', self.method)
+
+        for key, value in fits_headers.items():
+            try:
+                hdu.header.set(key.upper()[0: 8], "{}".format(value))
+            except Exception:
+                pass
+
+        coverage = fits.ImageHDU(self.get_coverage(), name='COVERAGE')
+
+        fits.HDUList([hdu, coverage]).writeto(fname, output_verify='silentfix', clobber=clobber)
+
+        return fname
+
+##################################################################################################
+# Private Methods
+##################################################################################################
+
+    def _round_shift(self, value):
+        if self.bayer:
+            return 2 * int(np.round(value / 2.))
+        else:
+            return int(np.round(value))
+
+    def _overlap(self, dy, dx):
+        """ Slices of the stack (dst) and the new frame (src) that overlap after shifting """
+        ny, nx = self.shape
+
+        if abs(dy) >= ny or abs(dx) >= nx:
+            return None, None
+
+        dst = (slice(max(dy, 0), ny + min(dy, 0)), slice(max(dx, 0), nx + min(dx, 0)))
+        src = (slice(max(-dy, 0), ny + min(-dy, 0)), slice(max(-dx, 0), nx + min(-dx, 0)))
+
+        return dst, src
+
+    def _accumulate(self, dst, values):
+        mean = self._mean[dst]
+        count = self._count[dst]
+
+        if self.method == 'clipped_mean':
+            m2 = self._m2[dst]
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                std = np.sqrt(m2 / (count - 1))
+
+            # Reject outliers, only after we have enough values for a sensible deviation
+            keep = (count < self.min_frames) | (np.abs(values - mean) <= self.sigma * std)
+        else:
+            keep = np.ones(values.shape, dtype=bool)
+
+        count += keep
+
+        delta = np.where(keep, values - mean, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean += np.where(keep, delta / count, 0)
+
+        if self.method == 'clipped_mean':
+            m2 += delta * (values - mean) * keep
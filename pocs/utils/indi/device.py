@@ -2,6 +2,7 @@ import shutil
 import subprocess
 
 from .. import error
+from ..executor import get_executor
 from .. import listify
 from ..logger import get_logger
 
@@ -159,7 +160,8 @@ class PanIndiDevice(object):
 
         output = ''
         try:
-            output = subprocess.check_output(cmd, universal_newlines=True).strip().split('\n')
+            output = get_executor().check_output('indi_getprop', cmd, priority='high',
+                                                 universal_newlines=True).strip().split('\n')
             if isinstance(output, int):
                 if output > 0:
                     raise error.InvalidCommand("Problem with get_property. Output: {}".format(output))
@@ -197,7 +199,7 @@ class PanIndiDevice(object):
 
         output = ''
         try:
-            output = subprocess.call(cmd)
+            output = get_executor().call('indi_setprop', cmd, priority='high')
             self.logger.debug("Output from set_property: {}".format(output))
             if output > 0:
                 raise error.InvalidCommand("Problem with set_property. \n Cmd{} \n Output: {}".format(cmd, output))
@@ -3,6 +3,7 @@ import shutil
 import subprocess
 
 from .. import error
+from ..executor import get_executor
 from ..logger import get_logger
 
 
@@ -70,7 +71,8 @@ class PanIndiServer(object):
 
         try:
             self.logger.debug("Starting INDI Server: {}".format(cmd))
-            self._proc = subprocess.Popen(cmd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+            self._proc = get_executor().run('indiserver', cmd, priority='high', stderr=subprocess.STDOUT,
+                                            stdout=subprocess.PIPE)
             self.logger.debug("INDI server started. PID: {}".format(self._proc.pid))
         except Exception as e:
             self.logger.warning("Cannot start indiserver: {}".format(e))
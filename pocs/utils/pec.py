@@ -0,0 +1,200 @@
+import numpy as np
+
+from astropy import units as u
+from astropy.table import Table
+
+try:
+    from astropy.timeseries import LombScargle
+except ImportError:
+    from astropy.stats import LombScargle
+
+sidereal_rate = 15.041 * (u.arcsec / u.second)
+
+
+def find_period(t, y, min_period=60, max_period=1200, samples_per_peak=10):
+    """ Find the dominant period of `y` with a Lomb-Scargle periodogram
+
+    Any linear trend is removed first so it doesn't leak power into long periods.
+
+    Args:
+        t(np.array):            Times in seconds.
+        y(np.array):            Values, e.g. offsets in arcseconds.
+        min_period(float):      Shortest period to search in seconds, defaults to 60.
+        max_period(float):      Longest period to search in seconds, defaults to 1200. This is
+            limited to half the length of the data.
+        samples_per_peak(int):  Frequency grid oversampling, defaults to 10.
+
+    Returns:
+        tuple:  Best period in seconds and the periodogram power at that period.
+    """
+    t, y = _clean(t, y)
+
+    assert len(t) > 4, "Need more samples to find a period"
+
+    max_period = min(max_period, (t.max() - t.min()) / 2.)
+    assert max_period > min_period, "Data does not cover the period range"
+
+    residual = y - np.polyval(np.polyfit(t, y, 1), t)
+
+    frequency, power = LombScargle(t, residual).autopower(minimum_frequency=1. / max_period,
+                                                          maximum_frequency=1. / min_period,
+                                                          samples_per_peak=samples_per_peak)
+    best = np.argmax(power)
+
+    return 1. / frequency[best], power[best]
+
+
+def fit_harmonics(t, y, period, n_harmonics=3):
+    """ Fit a harmonic series with a fixed period by linear least squares
+
+    The periodic error is modelled as harmonics of the worm period plus a linear
+    drift (e.g. from polar misalignment):
+
+        y(t) = c0 + c1 * t + sum_k [a_k * cos(k * w * t) + b_k * sin(k * w * t)]
+
+    with w = 2 pi / period. For a known period this is linear in all of the
+    coefficients so a single least-squares solve gives the fit.
+
+    Args:
+        t(np.array):        Times in seconds.
+        y(np.array):        Values, e.g. offsets in arcseconds.
+        period(float):      Fundamental period in seconds.
+        n_harmonics(int):   Number of harmonics of the period to fit, defaults to 3.
+
+    Returns:
+        dict:   The fit, with the `period`, the `offset` and `drift` (per second) of the linear
+            term, the `cos` and `sin` coefficients and the `amplitude` and `phase` of each
+            harmonic, as well as the `rms` of the residuals.
+    """
+    t, y = _clean(t, y)
+
+    assert len(t) > 2 + 2 * n_harmonics, "Need more samples than fit parameters"
+
+    coeffs, _, _, _ = np.linalg.lstsq(_design_matrix(t, period, n_harmonics), y, rcond=-1)
+
+    fit = {
+        'period': float(period),
+        'n_harmonics': n_harmonics,
+        'offset': coeffs[0],
+        'drift': coeffs[1],
+        'cos': coeffs[2::2],
+        'sin': coeffs[3::2],
+    }
+
+    fit['amplitude'] = np.hypot(fit['cos'], fit['sin'])
+    fit['phase'] = np.arctan2(fit['sin'], fit['cos'])
+    fit['rms'] = np.std(y - evaluate(fit, t))
+
+    return fit
+
+
+def evaluate(fit, t, periodic_only=False, derivative=False):
+    """ Evaluate a fit from `fit_harmonics`
+
+    Args:
+        fit(dict):              The fit.
+        t(np.array):            Times in seconds.
+        periodic_only(bool):    Leave out the offset and drift, defaults to False.
+        derivative(bool):       Return the rate of change instead (per second), defaults to False.
+
+    Returns:
+        np.array:   The model values.
+    """
+    t = np.asarray(t, dtype=float)
+    k = np.arange(1, fit['n_harmonics'] + 1)
+    wt = (2 * np.pi / fit['period']) * np.outer(t, k)
+
+    if derivative:
+        w = 2 * np.pi * k / fit['period']
+        y = (-np.sin(wt) * w).dot(fit['cos']) + (np.cos(wt) * w).dot(fit['sin'])
+        if not periodic_only:
+            y += fit['drift']
+    else:
+        y = np.cos(wt).dot(fit['cos']) + np.sin(wt).dot(fit['sin'])
+        if not periodic_only:
+            y += fit['offset'] + fit['drift'] * t
+
+    return y
+
+
+def fit_pec(t, y, period=None, n_harmonics=3, **kwargs):
+    """ Find the worm period (if not given) and fit the periodic error
+
+    Args:
+        t(np.array):        Times in seconds.
+        y(np.array):        Position offsets in arcseconds.
+        period(float):      Worm period in seconds. If None (default) it is found with `find_period`.
+        n_harmonics(int):   Number of harmonics to fit, defaults to 3.
+        **kwargs:           Passed to `find_period`.
+
+    Returns:
+        dict:   See `fit_harmonics`, with the periodogram `power` if the period was searched for.
+    """
+    power = None
+    if period is None:
+        period, power = find_period(t, y, **kwargs)
+
+    fit = fit_harmonics(t, y, period, n_harmonics=n_harmonics)
+    fit['power'] = power
+
+    return fit
+
+
+def get_correction_table(fit, num_segments=128):
+    """ Tabulate the periodic error over one worm period
+
+    The `correction` column is the guide rate adjustment, as a fraction of the
+    sidereal rate, that cancels the periodic error in each segment. The drift is
+    not part of the correction. Phase 0 corresponds to t = 0 of the fitted data.
+
+    Args:
+        fit(dict):          A fit from `fit_harmonics` or `fit_pec`.
+        num_segments(int):  Number of segments to split the period into, defaults to 128.
+
+    Returns:
+        `astropy.table.Table`:  Table with a row per segment.
+    """
+    phase = np.arange(num_segments) / num_segments
+    segment_time = phase * fit['period']
+
+    error_as = evaluate(fit, segment_time, periodic_only=True)
+    rate_as = evaluate(fit, segment_time, periodic_only=True, derivative=True)
+
+    table = Table({
+        'phase': phase,
+        'time': segment_time,
+        'error_as': error_as,
+        'rate_as': rate_as,
+        'correction': -rate_as / sidereal_rate.value,
+    }, names=['phase', 'time', 'error_as', 'rate_as', 'correction'], meta={
+        'period': fit['period'],
+        'peak_to_peak': float(error_as.max() - error_as.min()),
+    })
+
+    table['error_as'].format = '%+2.3f'
+    table['rate_as'].format = '%+1.5f'
+    table['correction'].format = '%+1.6f'
+
+    return table
+
+
+def _design_matrix(t, period, n_harmonics):
+    wt = (2 * np.pi / period) * np.outer(t, np.arange(1, n_harmonics + 1))
+
+    columns = np.empty((len(t), 2 + 2 * n_harmonics))
+    columns[:, 0] = 1
+    columns[:, 1] = t
+    columns[:, 2::2] = np.cos(wt)
+    columns[:, 3::2] = np.sin(wt)
+
+    return columns
+
+
+def _clean(t, y):
+    """ Arrays of the finite samples """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    good = np.isfinite(t) & np.isfinite(y)
+
+    return t[good], y[good]
@@ -1,4 +1,6 @@
+import bisect
 import multiprocessing
+import numpy as np
 import serial as serial
 import time
 
@@ -10,37 +12,66 @@ class SerialData(object):
 
     """
     Main serial class
+
+    Reads block for at most `poll_timeout` at a time, so a response is returned as soon
+    as it has arrived (see `read`) rather than after a fixed delay.
+
+    Args:
+        port (str):             Serial port, or a pyserial URL such as `loop://`.
+        baudrate (int):         Defaults to 9600.
+        threaded (bool):        Read in a separate process, see `receiving_function`.
+        name (str):             Name for the logs.
+        poll_timeout (float):   Longest a single blocking read waits, in seconds. Also how
+            long the line has to be quiet for a response without a terminator to be complete.
+            Defaults to 0.005.
+        buffer_lines (int):     Lines kept from the separate process, defaults to 1000.
+        line_size (int):        Longest line kept in bytes, defaults to 256.
     """
 
-    def __init__(self, port=None, baudrate=9600, threaded=True, name="serial_data"):
+    def __init__(self, port=None, baudrate=9600, threaded=True, name="serial_data", poll_timeout=0.005,
+                 buffer_lines=1000, line_size=256):
 
         self.logger = get_logger(self)
 
         try:
-            self.ser = serial.Serial()
-            self.ser.port = port
+            if port is not None and '://' in port:
+                self.ser = serial.serial_for_url(port, do_not_open=True)
+            else:
+                self.ser = serial.Serial()
+                self.ser.port = port
             self.ser.baudrate = baudrate
             self.is_threaded = threaded
 
             self.ser.bytesize = serial.EIGHTBITS
             self.ser.parity = serial.PARITY_NONE
             self.ser.stopbits = serial.STOPBITS_ONE
-            self.ser.timeout = 0.1
+            self.ser.timeout = poll_timeout
             self.ser.xonxoff = 0
             self.ser.rtscts = 0
             self.ser.interCharTimeout = None
 
             self.name = name
-            self.serial_receiving = ''
+
+            # Response times of the queries, see `record_latency`
+            self.latency = dict()
+
+            # Lines from the separate process, see `get_reading` and `get_history`
+            self.lines = None
 
             if self.is_threaded:
                 self.logger.debug("Using threads (multiprocessing)")
-                self.process = multiprocessing.Process(target=self.receiving_function)
+
+                # The process reads the port that is opened here, so it has to be forked
+                context = multiprocessing.get_context('fork')
+
+                self.lines = SharedLineBuffer(size=buffer_lines, line_size=line_size, context=context)
+                self._stop_receiving = context.Event()
+
+                self.process = context.Process(target=self.receiving_function)
                 self.process.daemon = True
                 self.process.name = "PANOPTES_{}".format(name)
 
-            self.logger.debug('Serial connection set up to {}, sleeping for two seconds'.format(self.name))
-            time.sleep(2)
+            self.logger.debug('Serial connection set up to {}'.format(self.name))
             self.logger.info('SerialData created')
         except Exception as err:
             self.ser = None
@@ -62,6 +93,12 @@ class SerialData(object):
         self.logger.debug("Starting serial process: {}".format(self.process.name))
         self.process.start()
 
+    def stop(self, timeout=5):
+        """ Stops the separate process """
+        if self.is_threaded and self.process.is_alive():
+            self._stop_receiving.set()
+            self.process.join(timeout)
+
     def connect(self):
         """ Actually set up the Thread and connect to serial """
 
@@ -79,25 +116,29 @@ class SerialData(object):
         return self.ser.isOpen()
 
     def receiving_function(self):
-        buffer = ''
-        while True:
+        """ Reads lines into `lines` until `stop` is called
+
+        This runs in the separate process. Each read blocks for at most `poll_timeout`, so
+        the loop doesn't spin while the device is quiet. Each complete, non-empty line is
+        added with the time it arrived.
+        """
+        buffer = b''
+        while not self._stop_receiving.is_set():
             try:
-                buffer = buffer + self.read()
-                if '\n' in buffer:
-                    lines = buffer.split('\n')  # Guaranteed to have at least 2 entries
-                    self.serial_receiving = lines[-2]
-                    # If the Arduino sends lots of empty lines, you'll lose the
-                    # last filled line, so you could make the above statement conditional
-                    # like so: if lines[-2]: serial_receiving = lines[-2]
-                    buffer = lines[-1]
-            except IOError as err:
-                print("Device is not sending messages. IOError: {}".format(err))
-                time.sleep(2)
-            except UnicodeDecodeError:
-                print("Unicode problem")
-                time.sleep(2)
-            except:
-                print("Uknown problem")
+                buffer = buffer + self.ser.read(max(self.ser.inWaiting(), 1))
+            except (serial.SerialException, OSError) as err:
+                self.logger.warning("Device is not sending messages: {}".format(err))
+                self._stop_receiving.wait(2)
+                continue
+
+            if b'\n' in buffer:
+                now = time.time()
+
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    line = line.strip()
+                    if line:
+                        self.lines.append(line, now)
 
     def write(self, value):
         """
@@ -109,49 +150,282 @@ class SerialData(object):
         # self.logger.debug('Serial write: {}'.format(value))
         return self.ser.write(value.encode())
 
-    def read(self):
+    def read(self, terminator=None, min_size=None, timeout=1.0):
         """
-        Reads value using readline
-        If no response is given, delay and then try to read again. Fail after 10 attempts
+        Reads a response
+
+        Reads whatever is waiting, blocking for up to `poll_timeout` when nothing is, until
+        the response is complete. That is when `terminator` arrives or, for a response
+        that may not have one, when there are at least `min_size` characters and nothing more
+        arrives for `poll_timeout`. Without either the response is complete once the line
+        goes quiet.
+
+        Args:
+            terminator (str):   End of the response, e.g. '#'.
+            min_size (int):     Shortest complete response.
+            timeout (float):    Give up after this many seconds, defaults to 1.
+
+        Returns:
+            str:    The response, including the terminator. What has arrived so far on a timeout.
         """
         assert self.ser
         assert self.ser.isOpen()
 
-        retry_limit = 5
-        delay = 0.5
+        if terminator is not None:
+            terminator = terminator.encode()
+
+        response = b''
+        end_time = time.monotonic() + timeout
+
+        while True:
+            chunk = self.ser.read(max(self.ser.inWaiting(), 1))
+            response += chunk
+
+            if terminator is not None and terminator in response:
+                break
+
+            if not chunk and response:
+                if min_size is not None and len(response) >= min_size:
+                    break
 
-        while True and retry_limit:
-            response_string = self.ser.readline(self.ser.inWaiting()).decode()
-            if response_string > '':
+                if terminator is None and min_size is None:
+                    break
+
+            if time.monotonic() > end_time:
+                self.logger.debug('Serial read timed out with: {}'.format(response))
                 break
 
-            time.sleep(delay)
-            retry_limit -= 1
+        # self.logger.debug('Serial read: {}'.format(response))
+
+        return response.decode()
+
+    def read_waiting(self):
+        """ Reads what has arrived, waiting for up to `poll_timeout` if nothing has """
+        assert self.ser
+        assert self.ser.isOpen()
+
+        return self.ser.read(max(self.ser.inWaiting(), 1)).decode()
 
-        # self.logger.debug('Serial read: {}'.format(response_string))
+    def record_latency(self, name, seconds):
+        """ Add the response time of a query (e.g. a mount command) to its histogram """
+        if name not in self.latency:
+            self.latency[name] = LatencyHistogram()
 
-        return response_string
+        self.latency[name].add(seconds)
+
+    def get_latency(self, name=None):
+        """ Latency summary (see `LatencyHistogram.summary`) of one query or of all of them """
+        if name is not None:
+            return self.latency[name].summary() if name in self.latency else None
+
+        return dict((query, histogram.summary()) for query, histogram in self.latency.items())
 
     def get_reading(self):
+        """ The latest line from the separate process, '' if there isn't one yet """
         if not self.ser:
             return 0
-        for i in range(40):
-            raw_line = self.serial_receiving
-            try:
-                return raw_line.strip()
-            except ValueError:
-                time.sleep(.005)
-        return 0.
+
+        latest = self.lines.latest() if self.lines is not None else None
+
+        return latest[1] if latest is not None else ''
+
+    def get_history(self, lines=None, since=None):
+        """ Recent lines from the separate process
+
+        Args:
+            lines (int):    Number of lines, defaults to all that are kept (`buffer_lines`).
+            since (float):  Only lines that arrived after this unix time.
+
+        Returns:
+            list: (unix time, line) tuples, oldest first.
+        """
+        if self.lines is None:
+            return []
+
+        return self.lines.history(lines=lines, since=since)
 
     def clear_buffer(self):
         """ Clear Response Buffer """
         count = 0
         while self.ser.inWaiting() > 0:
-            count += 1
-            contents = self.ser.read(1)
+            count += len(self.ser.read(self.ser.inWaiting()))
 
         # self.logger.debug('Cleared {} bytes from buffer'.format(count))
 
     def __del__(self):
         if self.ser:
             self.ser.close()
+
+
+class SharedLineBuffer(object):
+
+    """ Ring buffer of timestamped lines in shared memory
+
+    One process adds lines with `append` and any process that has the buffer (e.g. the
+    parent of a forked process) reads them with `latest` and `history`, without pipes or
+    pickling. The slots are numpy views of the shared memory, only the lines that are
+    returned are copied out.
+
+    There are no locks. Each slot has a sequence number that is odd while the slot is
+    being written and goes up by two with each write. A reader reads a slot again if the
+    number was odd or changed while it was reading, and skips a slot that has been
+    written over by a newer line. A slot that stays odd (the writer died while writing
+    it) is skipped after `max_retries` reads.
+
+    Args:
+        size (int):         Number of lines kept, defaults to 1000.
+        line_size (int):    Longest line in bytes, longer lines are cut. Defaults to 256.
+        context:            The multiprocessing context the memory is shared in.
+    """
+
+    # Reads of a slot that is being written before giving up on it
+    max_retries = 1000
+
+    def __init__(self, size=1000, line_size=256, context=None):
+        context = context or multiprocessing
+
+        self.size = size
+        self.line_size = line_size
+
+        dtype = np.dtype([('seq', '<u8'), ('time', '<f8'), ('line', 'S{}'.format(line_size))])
+
+        self._slots = context.RawArray('b', dtype.itemsize * size)
+        self._count = context.RawArray('Q', 1)
+
+        slots = np.frombuffer(self._slots, dtype=dtype)
+        self._seq = slots['seq']
+        self._time = slots['time']
+        self._line = slots['line']
+
+        # Lines written so far
+        self._written = np.frombuffer(self._count, dtype=np.uint64)
+
+    def __len__(self):
+        return min(int(self._written[0]), self.size)
+
+    def append(self, line, timestamp=None):
+        """ Add a line, there must only be one process adding lines
+
+        Args:
+            line (bytes or str):    The line.
+            timestamp (float):      Unix time of the line, defaults to now.
+        """
+        if isinstance(line, str):
+            line = line.encode()
+
+        n = int(self._written[0])
+        i = n % self.size
+
+        seq = self._seq[i]
+        self._seq[i] = seq + 1
+        self._time[i] = time.time() if timestamp is None else timestamp
+        self._line[i] = line[:self.line_size]
+        self._seq[i] = seq + 2
+
+        self._written[0] = n + 1
+
+    def latest(self):
+        """ The last line as a (unix time, line) tuple, None if there isn't one """
+        n = int(self._written[0])
+        if n == 0:
+            return None
+
+        return self._read(n - 1)
+
+    def history(self, lines=None, since=None):
+        """ Recent lines as (unix time, line) tuples, oldest first
+
+        Args:
+            lines (int):    Number of lines, defaults to all that are kept.
+            since (float):  Only lines after this unix time.
+        """
+        n = int(self._written[0])
+
+        first = max(n - self.size, 0)
+        if lines is not None:
+            first = max(n - lines, first)
+
+        history = list()
+        for index in range(first, n):
+            entry = self._read(index)
+            if entry is not None and (since is None or entry[0] > since):
+                history.append(entry)
+
+        return history
+
+    def _read(self, index):
+        """ Line number `index`, None if it has been written over or can't be read """
+        i = index % self.size
+
+        # The sequence number of the slot once this line was written
+        wanted = 2 * (index // self.size + 1)
+
+        for _ in range(self.max_retries):
+            seq = int(self._seq[i])
+            if seq > wanted:
+                return None
+
+            if seq == wanted:
+                timestamp = float(self._time[i])
+                line = bytes(self._line[i])
+
+                if int(self._seq[i]) == seq:
+                    return timestamp, line.decode(errors='replace')
+
+            # The line is being written
+            time.sleep(0)
+
+        return None
+
+
+class LatencyHistogram(object):
+
+    """ Histogram of response times
+
+    The times are counted in fixed bins (in milliseconds) so keeping the histogram is
+    cheap however many queries there are. The percentiles in `summary` are the upper
+    edges of the bins they fall in.
+    """
+
+    bins = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bins) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+
+        self.counts[bisect.bisect_left(self.bins, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, percent):
+        """ Upper edge (ms) of the bin the `percent` percentile is in, None if there are no times """
+        if self.count == 0:
+            return None
+
+        needed = percent / 100 * self.count
+        seen = 0
+        for edge, count in zip(self.bins, self.counts):
+            seen += count
+            if seen >= needed:
+                return min(edge, self.max)
+
+        return self.max
+
+    def summary(self):
+        """ Count, mean, median, 90th and 99th percentile and max (ms) plus the bin counts """
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+            'histogram': dict(('<={}'.format(edge), count) for edge, count in zip(self.bins, self.counts)
+                              if count) if self.count else {},
+        }
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from .logger import get_logger
+
+
+class StatusPoller(object):
+
+    """ Refresh device status in a background thread
+
+    Each field has a function that reads it (e.g. from the mount over serial) and a time to
+    live. The poller thread calls the function whenever the value is older than its TTL and
+    keeps the results in a snapshot, so reading the status never blocks on the device and the
+    device is queried at most once per TTL for each field, however often the status is read.
+
+    Listeners added with `add_listener` are called with `(name, value)` from the poller thread
+    whenever a value changes, e.g. to post an event on the state machine's event loop.
+
+    Args:
+        interval(float):    Longest time the poller thread sleeps between checks, defaults to 1.
+    """
+
+    def __init__(self, interval=1.0):
+        self.logger = get_logger(self)
+
+        self.interval = interval
+
+        self._fields = {}
+        self._values = {}
+        self._updated = {}
+        self._listeners = []
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_field(self, name, getter, ttl=5.0):
+        """ Add a field to the snapshot
+
+        Args:
+            name(str):      Name of the field.
+            getter:         Callable returning the current value. Returning None leaves the
+                field out of the snapshot (e.g. when the device isn't ready yet).
+            ttl(float):     Seconds before the value is refreshed, defaults to 5.
+        """
+        with self._lock:
+            self._fields[name] = (getter, ttl)
+
+        self._wake.set()
+
+    def add_listener(self, callback):
+        """ Call `callback(name, value)` when a field changes """
+        self._listeners.append(callback)
+
+    def start(self):
+        """ Start the poller thread """
+        if self.is_running:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='status_poller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the poller thread """
+        self._stop.set()
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def refresh(self, name=None):
+        """ Refresh a field (or all fields) on the next pass of the poller thread """
+        with self._lock:
+            names = [name] if name is not None else list(self._fields.keys())
+            for field in names:
+                self._updated.pop(field, None)
+
+        self._wake.set()
+
+    def get(self, name, default=None):
+        """ The last value of a field """
+        with self._lock:
+            return self._values.get(name, default)
+
+    def get_snapshot(self):
+        """ The last value of each field
+
+        Returns:
+            dict:   Field values, along with `age`, a dict of how long ago (in seconds) each
+                field was read.
+        """
+        now = time.monotonic()
+        with self._lock:
+            snapshot = dict(self._values)
+            snapshot['age'] = dict((name, now - updated) for name, updated in self._updated.items()
+                                   if name in self._values)
+
+        return snapshot
+
+    def poll(self):
+        """ Refresh the fields that are older than their TTL
+
+        This is what the poller thread runs. It can also be called directly.
+
+        Returns:
+            float:  Seconds until the next field is due.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            due = [(name, getter) for name, (getter, ttl) in self._fields.items()
+                   if now - self._updated.get(name, -float('inf')) >= ttl]
+
+        for name, getter in due:
+            try:
+                value = getter()
+            except Exception as e:
+                self.logger.debug("Can't update status field {}: {}".format(name, e))
+                value = None
+
+            with self._lock:
+                self._updated[name] = time.monotonic()
+                try:
+                    changed = bool(value != self._values.get(name))
+                except Exception:
+                    changed = True
+                if value is None:
+                    self._values.pop(name, None)
+                else:
+                    self._values[name] = value
+
+            if changed:
+                for callback in self._listeners:
+                    try:
+                        callback(name, value)
+                    except Exception as e:
+                        self.logger.debug("Status listener failed: {}".format(e))
+
+        now = time.monotonic()
+        with self._lock:
+            waits = [self._updated.get(name, now) + ttl - now for name, (getter, ttl) in self._fields.items()]
+
+        return max(min(waits + [self.interval]), 0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.poll()
+
+            self._wake.wait(wait)
+            self._wake.clear()
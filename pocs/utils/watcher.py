@@ -0,0 +1,152 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o0004000
+IN_CLOEXEC = 0o2000000
+
+_event_header = struct.Struct('iIII')
+
+_libc = None
+
+
+def _get_libc():
+    """ libc with the inotify functions, None if they aren't available (e.g. not Linux) """
+    global _libc
+
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+
+    return _libc or None
+
+
+class FileWatcher(object):
+
+    """ Wait for files to be written
+
+    On Linux the directories of the files are watched with inotify, so a file counts as
+    written as soon as it is closed after writing (or moved into place). The watcher's
+    `fileno` can be added to an event loop (see `pocs.utils.events.EventLoop.add_reader`)
+    with `read_events` as the callback.
+
+    Where inotify isn't available (or doesn't see the writes, e.g. on some network
+    filesystems) a file counts as written once it exists and its size hasn't changed
+    between two checks, so `all_written` should be called at least every `poll_interval`
+    seconds.
+
+    Files that already exist when the watcher is created count as written.
+
+    Args:
+        filenames(list):        Files to wait for.
+        use_inotify(bool):      Use inotify if available, defaults to True.
+    """
+
+    def __init__(self, filenames, use_inotify=True):
+        self.filenames = set(os.path.abspath(f) for f in filenames)
+
+        self._fd = None
+        self._watches = {}
+        self._written = set()
+        self._sizes = {}
+
+        libc = _get_libc() if use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                for directory in set(os.path.dirname(f) for f in self.filenames):
+                    wd = libc.inotify_add_watch(fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO)
+                    if wd >= 0:
+                        self._watches[wd] = directory
+
+        # Only check once the watches are in place so no file can be missed
+        self._written.update(f for f in self.filenames if os.path.exists(f))
+
+    @property
+    def uses_inotify(self):
+        return bool(self._watches)
+
+    @property
+    def poll_interval(self):
+        """ Longest time between calls to `all_written` in seconds """
+        return 1.0 if self.uses_inotify else 0.25
+
+    def fileno(self):
+        """ The inotify file descriptor, None if polling """
+        return self._fd
+
+    def read_events(self, fd=None):
+        """ Read the pending inotify events
+
+        Args:
+            fd(int):    Ignored, so this can be used directly as an event loop callback.
+
+        Returns:
+            list:   The watched files that were written.
+        """
+        written = []
+        if self._fd is None:
+            return written
+
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return written
+
+        offset = 0
+        while offset + _event_header.size <= len(buf):
+            wd, mask, cookie, length = _event_header.unpack_from(buf, offset)
+            offset += _event_header.size
+
+            name = buf[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, `all_written` falls back to checking the files
+                continue
+
+            if wd in self._watches and name:
+                path = os.path.join(self._watches[wd], name)
+                if path in self.filenames and path not in self._written:
+                    self._written.add(path)
+                    written.append(path)
+
+        return written
+
+    def all_written(self):
+        """ Whether all of the files have been written """
+        for fname in self.filenames - self._written:
+            try:
+                size = os.path.getsize(fname)
+            except OSError:
+                continue
+
+            if self._sizes.get(fname) == size:
+                self._written.add(fname)
+            else:
+                self._sizes[fname] = size
+
+        return self._written >= self.filenames
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,142 @@
+import threading
+
+from astropy.time import Time
+
+from .logger import get_logger
+
+
+class WeatherCache(object):
+
+    """ The latest weather record, kept in memory
+
+    The weather station writes its readings to the `current` collection (type 'weather').
+    Rather than querying the database for every safety check, the latest record is kept
+    here and updated in the background:
+
+        * From a MongoDB change stream on `current`, if the server supports them (a replica
+          set is needed).
+        * Otherwise by polling the database every `poll_interval` seconds.
+
+    Records can also be pushed with `update`, e.g. from a WEATHER message on the
+    messaging bus.
+
+    The record is stored as it is, so the age of the reading (its `date`) can still be
+    checked by the caller.
+
+    Args:
+        db(`pocs.utils.database.PanMongo`): Database with the `current` collection.
+        poll_interval(float):   Seconds between polls when there is no change stream,
+            defaults to 30.
+        use_change_stream(bool): Try to use a change stream, defaults to True.
+    """
+
+    def __init__(self, db, poll_interval=30, use_change_stream=True):
+        self.logger = get_logger(self)
+
+        self.db = db
+        self.poll_interval = poll_interval
+        self.use_change_stream = use_change_stream
+
+        self._record = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_record(self):
+        """ The latest weather record, None if there isn't one
+
+        The first call reads the record from the database if nothing has been received yet.
+        """
+        with self._lock:
+            record = self._record
+
+        if record is None:
+            record = self.fetch()
+
+        return record
+
+    def update(self, record):
+        """ Replace the cached record if `record` is newer (or has no date)
+
+        Args:
+            record(dict):   Weather record with `data` and `date` (a `datetime` or an ISO
+                string) keys.
+        """
+        if not record:
+            return
+
+        # Records from the messaging bus have the date as a string
+        if isinstance(record.get('date'), str):
+            record = dict(record)
+            record['date'] = Time(record['date']).datetime
+
+        with self._lock:
+            previous = self._record
+            if previous is not None and record.get('date') and previous.get('date'):
+                if record['date'] <= previous['date']:
+                    return
+
+            self._record = record
+
+        for callback in self._listeners:
+            try:
+                callback('weather', record)
+            except Exception as e:
+                self.logger.debug("Weather listener failed: {}".format(e))
+
+    def add_listener(self, callback):
+        """ Call `callback('weather', record)` whenever a new record arrives """
+        self._listeners.append(callback)
+
+    def fetch(self):
+        """ Read the latest record from the database and cache it """
+        record = self.db.current.find_one({'type': 'weather'})
+        self.update(record)
+
+        return record
+
+    def start(self):
+        """ Start following the weather records in a background thread """
+        if self.is_running:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='weather_cache')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.use_change_stream:
+            try:
+                self._follow_change_stream()
+            except Exception as e:
+                self.logger.info("No weather change stream ({}), polling every {} s".format(e, self.poll_interval))
+
+        while not self._stop.is_set():
+            try:
+                self.fetch()
+            except Exception as e:
+                self.logger.warning("Can't read weather record: {}".format(e))
+
+            self._stop.wait(self.poll_interval)
+
+    def _follow_change_stream(self):
+        pipeline = [{'$match': {'fullDocument.type': 'weather'}}]
+
+        with self.db.current.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000) as stream:
+            # Get the current record once the stream is open so no change is missed
+            self.fetch()
+
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None and change.get('fullDocument'):
+                    self.update(change['fullDocument'])
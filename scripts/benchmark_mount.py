@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import time
+
+import yaml
+
+from astropy import units as u
+from astropy.coordinates import EarthLocation
+
+from pocs.mount.emulator import IOptronEmulator
+from pocs.mount.ioptron import Mount
+
+
+def benchmark(queries=200, latency=0.003, baudrate=9600):
+    """ Time the serial queries of the iOptron mount against the emulator
+
+    Returns:
+        dict:   The latency summary of each command, see `Mount.get_serial_latency`.
+    """
+    commands_file = os.path.join(os.getenv('POCS', '.'), 'resources', 'conf_files', 'mounts', 'ioptron.yaml')
+    with open(commands_file, 'r') as f:
+        commands = yaml.safe_load(f.read())
+
+    emulator = IOptronEmulator(commands_file=commands_file, latency=latency, baudrate=baudrate)
+    port = emulator.start()
+
+    try:
+        location = EarthLocation(lat=19.54 * u.degree, lon=-155.58 * u.degree, height=3400 * u.meter)
+        mount = Mount({'port': port, 'model': 30}, location, commands=commands)
+        mount.initialize()
+
+        start_time = time.monotonic()
+        for _ in range(queries):
+            mount.status()
+            mount.get_current_coordinates()
+            mount.serial_query('move_ms_west', '00010')
+        elapsed = time.monotonic() - start_time
+
+        print("{} queries in {:.2f} seconds".format(queries * 3, elapsed))
+
+        return mount.get_serial_latency()
+    finally:
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the serial mount against the iOptron emulator")
+    parser.add_argument('--queries', default=200, type=int, help="Rounds of status, coordinates and guide pulse")
+    parser.add_argument('--latency', default=0.003, type=float, help="Response latency of the emulator (s)")
+    parser.add_argument('--baudrate', default=9600, type=int, help="Baud rate, 0 for no transfer time")
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark(args.queries, args.latency, args.baudrate or None), indent=2, sort_keys=True))